@@ -1,9 +1,20 @@
+import concurrent.futures
+import logging
 import sys, re, os
+import tempfile
 
 from __main__ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 
 from MultiVolumeImporterLib.Helper import Helper
+from MultiVolumeImporterLib import NiftiBatch
+from MultiVolumeImporterLib import NiftiFrames
+from MultiVolumeImporterLib import ProcessPool
+from MultiVolumeImporterLib.NiftiFrameIndex import NiftiFrameIndex
+from MultiVolumeImporterLib import ScalarStorage
+from MultiVolumeImporterLib.FrameAssembler import FrameAssembler
+from MultiVolumeImporterLib.FrameReader import FrameReader, ParallelFrameReader
+from MultiVolumeImporterLib.LazyVolumeSequence import LazyVolumeSequence, NiftiFrameSource
 
 #
 # MultiVolumeImporter
@@ -39,6 +50,10 @@ class MultiVolumeImporter(ScriptedLoadableModule):
 
 class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
 
+  # worker processes that decompress several 4D NIfTI files at once (kept between imports)
+  niftiPool = None
+  niftiPoolSize = 0
+
   def setup(self):
     ScriptedLoadableModuleWidget.setup(self)
     # Instantiate and connect widgets ...
@@ -117,6 +132,28 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
     self.__fa.value = 1
     dummyFormLayout.addRow(label, self.__fa)
 
+    label = qt.QLabel('Decoding threads:')
+    self.__loadThreads = qt.QSpinBox()
+    self.__loadThreads.toolTip = 'Number of frames decoded in parallel. If set to 1 then frames are decoded one after the other.'
+    self.__loadThreads.minimum = 1
+    self.__loadThreads.maximum = 64
+    self.__loadThreads.value = 1
+    dummyFormLayout.addRow(label, self.__loadThreads)
+
+    label = qt.QLabel('Index compressed NIfTI frames:')
+    self.__niftiFrameIndex = qt.QCheckBox()
+    self.__niftiFrameIndex.toolTip = ('Store the frames of .nii.gz files compressed one by one in the cache directory,'
+      ' so that the next import of the file decompresses its frames in parallel (see Decoding threads).'
+      ' This takes about as much disk space again as the file itself.')
+    dummyFormLayout.addRow(label, self.__niftiFrameIndex)
+
+    label = qt.QLabel('Load NIfTI frames on demand:')
+    self.__niftiOnDemand = qt.QCheckBox()
+    self.__niftiOnDemand.toolTip = ('Load a single 4D NIfTI file as a volume sequence (instead of into the output node)'
+      ' whose frames are only read when they are displayed. .nii.gz files are indexed first (see Index compressed'
+      ' NIfTI frames), which takes one pass over the file the first time.')
+    dummyFormLayout.addRow(label, self.__niftiOnDemand)
+
     importButton = qt.QPushButton("Import")
     importButton.toolTip = "Import the contents of the directory as a MultiVolume"
     self.layout.addWidget(importButton)
@@ -170,8 +207,6 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
 
     # each frame is saved as a separate volume
     # first filter valid file names and sort alphabetically
-    frames = []
-    frame0 = None
     inputDir = self.__fDialog.directory
     for f in os.listdir(inputDir):
       if not f.startswith('.'):
@@ -185,26 +220,32 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
       if fileName.lower().endswith('.nii.gz') or fileName.lower().endswith('.nii'):
         niftiFiles.append(fileName)
     if len(niftiFiles) == 1:
+     if self.__niftiOnDemand.checked and self.read4DNIfTISequence(niftiFiles[0]):
+       return
      self.read4DNIfTI(mvNode, niftiFiles[0])
      return
+    if len(niftiFiles) > 1:
+      # several 4D nifti files are imported as separate multivolumes
+      layouts = [NiftiFrames.readLayout(fileName) for fileName in niftiFiles]
+      if all(layout and layout.numberOfFrames > 1 for layout in layouts):
+        self.read4DNIfTIBatch(mvNode, niftiFiles, layouts)
+        return
+      skipped4DFiles = [os.path.basename(fileName) for fileName, layout in zip(niftiFiles, layouts)
+        if layout and layout.numberOfFrames > 1]
+      if skipped4DFiles:
+        # the files of the directory are read as the frames of one multivolume instead
+        self.__status.text = ('Status: not all files of the directory are 4D NIfTI files, these are not imported'
+          ' as multivolumes: '+', '.join(skipped4DFiles))
 
     # not 4D nifti, so keep trying
-    for fileName in fileNames:
-      (s,f) = self.readFrame(fileName)
-      if s:
-        if not frame0:
-          frame0 = f
-          frame0Image = frame0.GetImageData()
-          frame0Extent = frame0Image.GetExtent()
-        else:
-          frameImage = f.GetImageData()
-          frameExtent = frameImage.GetExtent()
-          if frameExtent[1]!=frame0Extent[1] or frameExtent[3]!=frame0Extent[3] or frameExtent[5]!=frame0Extent[5]:
-            continue
-        frames.append(f)
+    # only decode the files whose image information matches the first readable file
+    frameFileNames = self.probeFrames(fileNames)
+    nFrames = len(frameFileNames)
+    logging.debug(f'Found {nFrames} frames')
 
-    nFrames = len(frames)
-    print('Successfully read '+str(nFrames)+' frames')
+    if nFrames == 0:
+      self.__status.text = 'Status: No frames found!'
+      return
 
     if nFrames == 1:
       print('Single frame dataset - not reading as multivolume!')
@@ -225,30 +266,63 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
       frameLabelsAttr += str(frameId)+','
     frameLabelsAttr = frameLabelsAttr[:-1]
 
-    # allocate multivolume
-    mvImage = vtk.vtkImageData()
-    mvImage.SetExtent(frame0Extent)
-    mvImage.AllocateScalars(frame0.GetImageData().GetScalarType(), nFrames)
-
-    extent = frame0.GetImageData().GetExtent()
-    numPixels = float(extent[1]+1)*(extent[3]+1)*(extent[5]+1)*nFrames
-    scalarType = frame0.GetImageData().GetScalarType()
-    print('Will now try to allocate memory for '+str(numPixels)+' pixels of VTK scalar type '+str(scalarType))
-    print('Memory allocated successfully')
-    mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
-
-    mat = vtk.vtkMatrix4x4()
-    frame0.GetRASToIJKMatrix(mat)
-    mvNode.SetRASToIJKMatrix(mat)
-    frame0.GetIJKToRASMatrix(mat)
-    mvNode.SetIJKToRASMatrix(mat)
-
-    for frameId in range(nFrames):
-      # TODO: check consistent size and orientation!
-      frame = frames[frameId]
-      frameImage = frame.GetImageData()
-      frameImageArray = vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars())
-      mvImageArray.T[frameId] = frameImageArray
+    # decode the frames and copy each into its slot of the multivolume as soon as it
+    # is decoded. With one decoding thread each frame is written right away, so the
+    # peak memory is the multivolume plus one frame. With more threads the frames are
+    # assembled in batches (at most 256 MB each, usually one or two are filled at a
+    # time) to write them faster, and one decoded frame per thread is held as well
+    progressbar = slicer.util.createProgressDialog(labelText='Importing frames', value=0, maximum=nFrames,
+                                                   windowModality = qt.Qt.WindowModal)
+    try:
+      with ParallelFrameReader(self.__loadThreads.value) as frameReader:
+        # the first frame determines the size of the multivolume
+        frameImage, ijkToRAS = frameReader.threadFrameReader().read([frameFileNames[0]])
+        frame0Extent = frameImage.GetExtent()
+        frameImageArray = vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars())
+
+        # allocate multivolume
+        mvImage = vtk.vtkImageData()
+        mvImage.SetExtent(frame0Extent)
+
+        numPixels = float(frame0Extent[1]+1)*(frame0Extent[3]+1)*(frame0Extent[5]+1)*nFrames
+        scalarType = frameImage.GetScalarType()
+        print('Will now try to allocate memory for '+str(numPixels)+' pixels of VTK scalar type '+str(scalarType))
+        if ScalarStorage.allocateScalars(mvImage, scalarType, nFrames):
+          logging.debug('Multivolume scalars are memory-mapped to a scratch file')
+        print('Memory allocated successfully')
+        mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
+
+        mvNode.SetIJKToRASMatrix(ijkToRAS)
+
+        frameAssembler = FrameAssembler(mvImageArray, batchSize=1 if self.__loadThreads.value == 1 else 16)
+        frameAssembler.addFrame(0, frameImageArray)
+        del frameImage, frameImageArray
+
+        def copyFrame(frameId, frameImage, ijkToRAS):
+          # runs in a worker thread
+          frameExtent = frameImage.GetExtent()
+          if frameExtent[1]!=frame0Extent[1] or frameExtent[3]!=frame0Extent[3] or frameExtent[5]!=frame0Extent[5]:
+            raise OSError('Frame size of '+frameFileNames[frameId]+' does not match the first frame')
+          frameAssembler.addFrame(frameId, vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars()))
+
+        def continueImport():
+          slicer.app.processEvents()
+          return not progressbar.wasCanceled
+
+        decodedFrames = 1
+        for frameId, _ in frameReader.readFrames(range(1, nFrames), [[fileName] for fileName in frameFileNames[1:]],
+            copyFrame, continueImport):
+          decodedFrames += 1
+          progressbar.value = decodedFrames
+        if progressbar.wasCanceled:
+          self.__status.text = 'Status: Import canceled'
+          return
+        frameAssembler.flush()
+    except OSError as e:
+      self.__status.text = 'Status: '+str(e)
+      return
+    finally:
+      progressbar.close()
 
     mvDisplayNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLMultiVolumeDisplayNode')
     mvDisplayNode.SetScene(slicer.mrmlScene)
@@ -279,40 +353,125 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
     mvNode.SetName(str(nFrames)+' frames MultiVolume')
     Helper.SetBgFgVolumes(mvNode.GetID(),None)
 
-  def readFrame(self,file):
-    sNode = slicer.vtkMRMLVolumeArchetypeStorageNode()
-    sNode.ResetFileNameList()
-    sNode.SetFileName(file)
-    sNode.SetSingleFile(1)
-    frame = slicer.vtkMRMLScalarVolumeNode()
-    success = sNode.ReadData(frame)
-    return (success,frame)
-
-  # leave no trace of the temporary nodes
-  def annihilateScalarNode(self, node):
-    dn = node.GetDisplayNode()
-    sn = node.GetStorageNode()
-    node.SetAndObserveDisplayNodeID(None)
-    node.SetAndObserveStorageNodeID(None)
-    slicer.mrmlScene.RemoveNode(dn)
-    slicer.mrmlScene.RemoveNode(sn)
-    slicer.mrmlScene.RemoveNode(node)
-
-  def read4DNIfTI(self, mvNode, fileName):
-    """Try to read a 4D nifti file as a multivolume"""
+  def probeFrames(self, fileNames):
+    """Return the files that can be frames of the multivolume, reading only their image information.
+    Files that cannot be read, or that differ from the first readable file in size, scalar type,
+    number of components, spacing or directions, are skipped."""
+    frameReader = FrameReader()
+    frame0Info = None
+    frameFileNames = []
+    for fileName in fileNames:
+      try:
+        frameInfo = frameReader.probe(fileName)
+      except OSError:
+        print('Skipping '+fileName+': not a readable volume')
+        continue
+      if frame0Info is None:
+        frame0Info = frameInfo
+      else:
+        size = [frameInfo.extent[i+1]-frameInfo.extent[i] for i in (0, 2, 4)]
+        size0 = [frame0Info.extent[i+1]-frame0Info.extent[i] for i in (0, 2, 4)]
+        geometryMatches = all(abs(frameInfo.ijkToRAS.GetElement(row, column) - frame0Info.ijkToRAS.GetElement(row, column)) < 1e-3
+          for row in range(3) for column in range(3))
+        if (size != size0 or frameInfo.scalarType != frame0Info.scalarType
+            or frameInfo.numberOfComponents != frame0Info.numberOfComponents or not geometryMatches):
+          print('Skipping '+fileName+': image information does not match the first frame')
+          continue
+      frameFileNames.append(fileName)
+    return frameFileNames
+
+  @classmethod
+  def niftiProcessPool(cls):
+    """Worker processes of read4DNIfTIBatch, one per CPU. The pool is kept between imports
+    until it breaks or the application quits."""
+    numberOfProcesses = os.cpu_count() or 1
+    if cls.niftiPoolSize != numberOfProcesses:
+      cls.shutdownNiftiPool()
+    if cls.niftiPool is None:
+      cls.niftiPool = ProcessPool.processPool(numberOfProcesses)
+      cls.niftiPoolSize = numberOfProcesses
+      slicer.app.aboutToQuit.connect(cls.shutdownNiftiPool)
+    return cls.niftiPool
+
+  @classmethod
+  def shutdownNiftiPool(cls):
+    """Stop the worker processes of read4DNIfTIBatch, they are started again when needed."""
+    if cls.niftiPool is None:
+      return
+    slicer.app.aboutToQuit.disconnect(cls.shutdownNiftiPool)
+    cls.niftiPool.shutdown(wait=False, cancel_futures=True)
+    cls.niftiPool = None
+    cls.niftiPoolSize = 0
+
+  def read4DNIfTIBatch(self, mvNode, fileNames, layouts):
+    """Read each of several 4D nifti files as its own multivolume.
+    The voxels are decompressed into scratch files in worker processes, here the scratch
+    files are only mapped as the multivolume images and the nodes are created.
+    The first multivolume is read into mvNode, new nodes are created for the others."""
+    futures = {}
+    try:
+      pool = self.niftiProcessPool()
+      for fileName, layout in zip(fileNames, layouts):
+        # the reader flips the slices of images with negative qfac, the workers need to do the same
+        reader = vtk.vtkNIFTIImageReader()
+        reader.SetFileName(fileName)
+        reader.UpdateInformation()
+        scratchFile, scratchFileName = tempfile.mkstemp(dir=ScalarStorage.scratchDirectory(), prefix='MultiVolume-', suffix='.raw')
+        os.close(scratchFile)
+        future = pool.submit(NiftiBatch.decompressToScratchFile, fileName, layout, reader.GetQFac() < 0, scratchFileName)
+        futures[future] = (fileName, scratchFileName)
+
+      importedFiles = 0
+      pending = set(futures)
+      while pending:
+        done, pending = concurrent.futures.wait(pending, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED)
+        slicer.app.processEvents()
+        for future in done:
+          fileName, scratchFileName = futures[future]
+          try:
+            future.result()
+            if mvNode is None:
+              mvNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMultiVolumeNode')
+            self.read4DNIfTI(mvNode, fileName, scratchFileName)
+            mvNode.SetName(os.path.basename(fileName).split('.')[0]+' - '+mvNode.GetName())
+            mvNode = None
+            importedFiles += 1
+            self.__status.text = f'Status: Imported {importedFiles} of {len(fileNames)} NIfTI files'
+          except Exception as e:
+            print(f'Failed to read {fileName}: {e}')
+            if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+              self.shutdownNiftiPool()
+          finally:
+            NiftiBatch.removeScratchFile(scratchFileName)
+    finally:
+      # scratch files of files that were not imported
+      for _, scratchFileName in futures.values():
+        NiftiBatch.removeScratchFile(scratchFileName)
+
+  def read4DNIfTI(self, mvNode, fileName, scratchFileName=None):
+    """Try to read a 4D nifti file as a multivolume.
+    If scratchFileName is set then that file, as written by NiftiBatch.decompressToScratchFile(),
+    is mapped as the voxels of the multivolume (the caller removes it if this fails)"""
     print('trying to read %s' % fileName)
 
     # use the vtk reader which seems to handle most nifti variants well
     reader = vtk.vtkNIFTIImageReader()
     reader.SetFileName(fileName)
     reader.SetTimeAsVector(True)
-    reader.Update()
+    # the voxels of 4D scalar images are read frame by frame,
+    # the reader is then only used for the geometry
+    layout = NiftiFrames.readLayout(fileName)
+    if layout:
+      reader.UpdateInformation()
+      if reader.GetTimeDimension() != layout.numberOfFrames:
+        layout = None
+    if not layout:
+      reader.Update()
     header = reader.GetNIFTIHeader()
-    qFormMatrix = reader.GetQFormMatrix()
-    if not qFormMatrix:
-      print('Warning: %s does not have a QFormMatrix - using Identity')
-      qFormMatrix = vtk.vtkMatrix4x4()
-    spacing = reader.GetOutputDataObject(0).GetSpacing()
+    if layout:
+      spacing = reader.GetDataSpacing()
+    else:
+      spacing = reader.GetOutputDataObject(0).GetSpacing()
     timeSpacing = reader.GetTimeSpacing()
     nFrames = reader.GetTimeDimension()
     if header.GetIntentCode() != header.IntentTimeSeries:
@@ -329,12 +488,6 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
       timeSpacing /= 1000.
     if units & header.UnitsUSec == header.UnitsUSec:
       timeSpacing /= 1000. / 1000.
-    spaceScaling = 1.
-    if units & header.UnitsMeter == header.UnitsMeter:
-      spaceScaling *= 1000.
-    if units & header.UnitsMicron == header.UnitsMicron:
-      spaceScaling /= 1000.
-    spacing = [e * spaceScaling for e in spacing]
 
     # create frame labels using the timing info from the file
     # but use the advanced info so user can specify offset and scale
@@ -354,24 +507,20 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
     mvDisplayNode.SetReferenceCount(mvDisplayNode.GetReferenceCount()-1)
     mvDisplayNode.SetDefaultColorMap()
 
-    # spacing and origin are in the ijkToRAS, so clear them from image data
-    imageChangeInformation = vtk.vtkImageChangeInformation()
-    imageChangeInformation.SetInputConnection(reader.GetOutputPort())
-    imageChangeInformation.SetOutputSpacing( 1, 1, 1 )
-    imageChangeInformation.SetOutputOrigin( 0, 0, 0 )
-    imageChangeInformation.Update()
-
-    # QForm includes directions and origin, but not spacing so add that
-    # here by multiplying by a diagonal matrix with the spacing
-    scaleMatrix = vtk.vtkMatrix4x4()
-    for diag in range(3):
-      scaleMatrix.SetElement(diag, diag, spacing[diag])
-    ijkToRAS = vtk.vtkMatrix4x4()
-    ijkToRAS.DeepCopy(qFormMatrix)
-    vtk.vtkMatrix4x4.Multiply4x4(ijkToRAS, scaleMatrix, ijkToRAS)
-    mvNode.SetIJKToRASMatrix(ijkToRAS)
+    if layout:
+      mvImage = self.readNIfTIFrames(fileName, layout, reader, scratchFileName)
+    else:
+      # spacing and origin are in the ijkToRAS, so clear them from image data
+      imageChangeInformation = vtk.vtkImageChangeInformation()
+      imageChangeInformation.SetInputConnection(reader.GetOutputPort())
+      imageChangeInformation.SetOutputSpacing( 1, 1, 1 )
+      imageChangeInformation.SetOutputOrigin( 0, 0, 0 )
+      imageChangeInformation.Update()
+      mvImage = imageChangeInformation.GetOutputDataObject(0)
+
+    mvNode.SetIJKToRASMatrix(self.niftiIJKToRAS(reader, spacing))
     mvNode.SetAndObserveDisplayNodeID(mvDisplayNode.GetID())
-    mvNode.SetAndObserveImageData(imageChangeInformation.GetOutputDataObject(0))
+    mvNode.SetAndObserveImageData(mvImage)
     mvNode.SetNumberOfFrames(nFrames)
 
     # set the labels and other attributes, then display the volume
@@ -385,3 +534,114 @@ class MultiVolumeImporterWidget(ScriptedLoadableModuleWidget):
 
     mvNode.SetName(str(nFrames)+' frames NIfTI MultiVolume')
     Helper.SetBgFgVolumes(mvNode.GetID(),None)
+
+  @staticmethod
+  def niftiIJKToRAS(reader, spacing):
+    """IJK to RAS matrix of a nifti file read by reader, spacing being the spacing of its voxels
+    in the spatial units of the file"""
+    header = reader.GetNIFTIHeader()
+    qFormMatrix = reader.GetQFormMatrix()
+    if not qFormMatrix:
+      print('Warning: %s does not have a QFormMatrix - using Identity' % reader.GetFileName())
+      qFormMatrix = vtk.vtkMatrix4x4()
+
+    # try to account for some of the unit options
+    units = header.GetXYZTUnits()
+    spaceScaling = 1.
+    if units & header.UnitsMeter == header.UnitsMeter:
+      spaceScaling *= 1000.
+    if units & header.UnitsMicron == header.UnitsMicron:
+      spaceScaling /= 1000.
+
+    # QForm includes directions and origin, but not spacing so add that
+    # here by multiplying by a diagonal matrix with the spacing
+    scaleMatrix = vtk.vtkMatrix4x4()
+    for diag in range(3):
+      scaleMatrix.SetElement(diag, diag, spacing[diag] * spaceScaling)
+    ijkToRAS = vtk.vtkMatrix4x4()
+    ijkToRAS.DeepCopy(qFormMatrix)
+    vtk.vtkMatrix4x4.Multiply4x4(ijkToRAS, scaleMatrix, ijkToRAS)
+    return ijkToRAS
+
+  def read4DNIfTISequence(self, fileName):
+    """Load a 4D nifti file as a volume sequence whose frames are read when they are displayed.
+    Compressed files are indexed first (decompressing the file once), so that their frames
+    can be decompressed one by one. Returns False if the frames of the file cannot be read
+    one by one (then nothing is loaded)."""
+    layout = NiftiFrames.readLayout(fileName)
+    if not layout:
+      return False
+    reader = vtk.vtkNIFTIImageReader()
+    reader.SetFileName(fileName)
+    reader.SetTimeAsVector(True)
+    reader.UpdateInformation()
+    if reader.GetTimeDimension() != layout.numberOfFrames:
+      return False
+
+    frameIndex = None
+    if layout.compressed:
+      frameIndex = NiftiFrameIndex(fileName, layout, self.niftiFrameIndexDirectory())
+      if not frameIndex.load():
+        self.__status.text = 'Status: Indexing '+os.path.basename(fileName)
+        slicer.app.processEvents()
+        NiftiFrames.writeFrameIndex(fileName, layout, frameIndex)
+
+    name = os.path.basename(fileName).split('.')[0]
+    volumeSequenceNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceNode', slicer.mrmlScene.GenerateUniqueName(name))
+    volumeSequenceNode.SetIndexName('frame')
+    volumeSequenceNode.SetIndexUnit('')
+    # the reader flips the slices of images with negative qfac, do the same
+    frameSource = NiftiFrameSource(fileName, layout, frameIndex, reader.GetQFac() < 0, reader.GetDataExtent(),
+      self.niftiIJKToRAS(reader, reader.GetDataSpacing()))
+    lazySequence = LazyVolumeSequence(volumeSequenceNode, frameSource)
+
+    sequenceBrowserNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceBrowserNode',
+      slicer.mrmlScene.GenerateUniqueName(name + ' browser'))
+    sequenceBrowserNode.SetAndObserveMasterSequenceNodeID(volumeSequenceNode.GetID())
+    sequenceBrowserNode.SetSaveChanges(volumeSequenceNode, True)
+    sequenceBrowserNode.SetOverwriteProxyName(volumeSequenceNode, True)
+    lazySequence.setBrowserNode(sequenceBrowserNode)
+
+    Helper.SetBgFgVolumes(sequenceBrowserNode.GetProxyNode(volumeSequenceNode).GetID(), None)
+    sequencesModule = slicer.modules.sequences
+    if sequencesModule.autoShowToolBar:
+      sequencesModule.setToolBarActiveBrowserNode(sequenceBrowserNode)
+      sequencesModule.setToolBarVisible(True)
+    self.__status.text = f'Status: Loaded {layout.numberOfFrames} frames of {os.path.basename(fileName)} on demand'
+    return True
+
+  def readNIfTIFrames(self, fileName, layout, reader, scratchFileName=None):
+    """Read the voxels of a 4D nifti file frame by frame into a new multivolume image.
+    Uncompressed files are memory-mapped and compressed files are decompressed one
+    frame at a time, so the whole file is never held in memory next to the multivolume.
+    The multivolume of an uncompressed file is memory-mapped too (unless memory mapping
+    is disabled in the settings): the frames of the file cannot be used in place, because
+    the multivolume interleaves them, but then neither of them needs to fit in RAM."""
+    import vtk.util.numpy_support
+
+    mvImage = vtk.vtkImageData()
+    mvImage.SetExtent(reader.GetDataExtent())
+    if scratchFileName:
+      ScalarStorage.mapScratchFile(mvImage, reader.GetDataScalarType(), layout.numberOfFrames, scratchFileName)
+      return mvImage
+
+    memoryMapped = True if not layout.compressed and ScalarStorage.memoryMapThreshold() is not None else None
+    ScalarStorage.allocateScalars(mvImage, reader.GetDataScalarType(), layout.numberOfFrames, memoryMapped)
+    mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
+
+    frameIndex = None
+    if layout.compressed and self.__niftiFrameIndex.checked:
+      frameIndex = NiftiFrameIndex(fileName, layout, self.niftiFrameIndexDirectory())
+      frameIndex.load()
+
+    # the reader flips the slices of images with negative qfac, do the same
+    frameAssembler = FrameAssembler(mvImageArray)
+    for frameNumber, frameArray in NiftiFrames.readFrames(fileName, layout, reader.GetQFac() < 0, frameIndex,
+        self.__loadThreads.value):
+      frameAssembler.addFrame(frameNumber, frameArray)
+    frameAssembler.flush()
+    return mvImage
+
+  @staticmethod
+  def niftiFrameIndexDirectory():
+    return os.path.join(slicer.app.cachePath, 'MultiVolumeImporter', 'NIfTIFrameIndex')
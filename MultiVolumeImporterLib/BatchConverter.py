@@ -0,0 +1,182 @@
+import argparse
+import concurrent.futures
+import logging
+import os
+import subprocess
+import tempfile
+
+import vtk
+import slicer
+from DICOMLib import DICOMUtils
+
+#
+# Headless conversion of DICOM multivolumes to 4D NRRD or NIfTI files.
+#
+# Every series of a DICOM folder or database is examined with the
+# multivolume importer plugin, the multivolume loadable with the highest
+# confidence is loaded and written to the output directory. The series are
+# distributed over several Slicer processes, each converting a chunk of the
+# series list. See Util/convert_multivolumes.py for the command line.
+#
+
+FILE_FORMATS = {'nrrd': '.nrrd', 'nii': '.nii.gz'}
+
+
+def openDatabase(databaseDirectory):
+  """ Open (or create) the DICOM database in databaseDirectory as slicer.dicomDatabase.
+  """
+  DICOMUtils.openDatabase(databaseDirectory)
+  if not slicer.dicomDatabase.isOpen:
+    raise OSError(f"Failed to open DICOM database in {databaseDirectory}")
+
+
+def allSeries(database):
+  return [series for patient in database.patients() for study in database.studiesForPatient(patient)
+    for series in database.seriesForStudy(study)]
+
+
+def bestLoadable(loadables):
+  """ The multivolume loadable with the highest confidence, None if there is none.
+
+  Volume sequence loadables are the same multivolumes loaded into a sequence
+  node, so only the multivolume loadables are considered; their image is
+  already in the 4D layout that is written.
+  """
+  multiVolumeLoadables = [loadable for loadable in loadables if not getattr(loadable, 'loadAsVolumeSequence', False)]
+  if not multiVolumeLoadables:
+    return None
+  return max(multiVolumeLoadables, key=lambda loadable: loadable.confidence)
+
+
+def writeNIfTI(mvNode, fileName):
+  """ Write a multivolume node as a 4D NIfTI file (frames as time points).
+  """
+  image = vtk.vtkImageData()
+  image.ShallowCopy(mvNode.GetImageData())
+  image.SetSpacing(mvNode.GetSpacing())
+  image.SetOrigin(0, 0, 0)
+
+  # the qform holds directions and origin, spacing is in the image
+  qFormMatrix = vtk.vtkMatrix4x4()
+  mvNode.GetIJKToRASDirectionMatrix(qFormMatrix)
+  origin = mvNode.GetOrigin()
+  for row in range(3):
+    qFormMatrix.SetElement(row, 3, origin[row])
+
+  writer = vtk.vtkNIFTIImageWriter()
+  writer.SetInputData(image)
+  writer.SetFileName(fileName)
+  writer.SetTimeDimension(mvNode.GetNumberOfFrames())
+  writer.SetQFormMatrix(qFormMatrix)
+  writer.SetSFormMatrix(qFormMatrix)
+  writer.Write()
+  if writer.GetErrorCode() != 0:
+    raise OSError(f"Failed to write {fileName}")
+
+
+def convertSeries(seriesInstanceUID, outputDirectory, fileFormat='nrrd'):
+  """ Convert one series of slicer.dicomDatabase. Returns the written file name,
+  None if the series does not contain a multivolume.
+  """
+  from MultiVolumeImporterPlugin import MultiVolumeImporterPluginClass
+
+  files = slicer.dicomDatabase.filesForSeries(seriesInstanceUID)
+  if not files:
+    return None
+  plugin = MultiVolumeImporterPluginClass()
+  loadable = bestLoadable(plugin.examine([files]))
+  if loadable is None:
+    return None
+
+  try:
+    # read all frames now, the lazy and progressive load settings are for interactive use
+    mvNode = plugin.load(loadable, synchronous=True)
+    if mvNode is None:
+      raise OSError(f"Failed to load {loadable.name}")
+    fileName = os.path.join(outputDirectory, seriesInstanceUID + FILE_FORMATS[fileFormat])
+    if fileFormat == 'nii':
+      writeNIfTI(mvNode, fileName)
+    elif not slicer.util.saveNode(mvNode, fileName):
+      raise OSError(f"Failed to write {fileName}")
+    return fileName
+  finally:
+    slicer.mrmlScene.Clear(0)
+
+
+def convertSeriesList(seriesInstanceUIDs, outputDirectory, fileFormat='nrrd'):
+  """ Convert the series one after the other in this process. Returns the number of series that failed.
+  """
+  failures = 0
+  for seriesInstanceUID in seriesInstanceUIDs:
+    try:
+      fileName = convertSeries(seriesInstanceUID, outputDirectory, fileFormat)
+      if fileName:
+        logging.info(f"Converted series {seriesInstanceUID} to {fileName}")
+      else:
+        logging.info(f"Series {seriesInstanceUID} does not contain a multivolume")
+    except Exception as e:
+      logging.error(f"Failed to convert series {seriesInstanceUID}: {str(e)}")
+      failures += 1
+  return failures
+
+
+def runWorkers(scriptPath, databaseDirectory, seriesInstanceUIDs, outputDirectory, fileFormat, numberOfWorkers):
+  """ Convert the series in numberOfWorkers Slicer processes running scriptPath in worker mode.
+  Returns the number of worker processes that failed.
+  """
+  # a few chunks per worker, so that workers that get easy series pick up more work
+  numberOfChunks = min(len(seriesInstanceUIDs), numberOfWorkers * 4)
+  chunks = [seriesInstanceUIDs[i::numberOfChunks] for i in range(numberOfChunks)]
+
+  def runChunk(chunk):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as seriesListFile:
+      seriesListFile.write('\n'.join(chunk))
+    try:
+      args = [slicer.app.applicationFilePath(), '--no-splash', '--no-main-window', '--disable-cli-modules',
+        '--python-script', scriptPath, '--worker', seriesListFile.name,
+        '--database', databaseDirectory, '--format', fileFormat, outputDirectory]
+      return subprocess.run(args).returncode
+    finally:
+      os.remove(seriesListFile.name)
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfWorkers) as executor:
+    return sum(1 for returnCode in executor.map(runChunk, chunks) if returnCode != 0)
+
+
+def main(argv, scriptPath):
+  """ Command line entry point. Returns the exit code.
+  """
+  parser = argparse.ArgumentParser(description="Convert DICOM multivolumes to 4D NRRD or NIfTI files.")
+  parser.add_argument('input', nargs='?', help='DICOM folder to import (not needed if --database is an existing database)')
+  parser.add_argument('output', help='output directory')
+  parser.add_argument('--database', help='DICOM database directory (a temporary database is used for a folder by default)')
+  parser.add_argument('--format', choices=sorted(FILE_FORMATS), default='nrrd', help='output file format')
+  parser.add_argument('--workers', type=int, default=2,
+    help='number of Slicer worker processes (each one holds a whole multivolume in memory)')
+  parser.add_argument('--worker', metavar='SERIES_LIST', help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  os.makedirs(args.output, exist_ok=True)
+
+  if args.worker:
+    # worker mode: convert the series listed in the file
+    openDatabase(args.database)
+    with open(args.worker) as f:
+      seriesInstanceUIDs = [line.strip() for line in f if line.strip()]
+    return 1 if convertSeriesList(seriesInstanceUIDs, args.output, args.format) else 0
+
+  databaseDirectory = args.database or tempfile.mkdtemp(prefix='MultiVolumeConverter-')
+  openDatabase(databaseDirectory)
+  if args.input:
+    logging.info(f"Importing {args.input} into the DICOM database in {databaseDirectory}")
+    DICOMUtils.importDicom(args.input, slicer.dicomDatabase)
+  seriesInstanceUIDs = allSeries(slicer.dicomDatabase)
+  logging.info(f"Converting {len(seriesInstanceUIDs)} series with {args.workers} workers")
+
+  if args.workers <= 1:
+    failures = convertSeriesList(seriesInstanceUIDs, args.output, args.format)
+  else:
+    # the workers open the database themselves
+    slicer.dicomDatabase.closeDatabase()
+    failures = runWorkers(scriptPath, databaseDirectory, seriesInstanceUIDs, args.output, args.format, args.workers)
+  return 1 if failures else 0
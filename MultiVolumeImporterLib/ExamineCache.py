@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+
+class ExamineCache:
+  """ On-disk cache of the multivolume loadables found by examine().
+
+  Each entry holds the JSON-serializable description of the loadables found
+  for a set of series (frame partitions, frame labels, file ordering,
+  strategy, multivolume attributes) and is stored in its own file, named
+  after the series instance UIDs and a fingerprint of the examined files.
+  The fingerprint covers the file paths, their SOP instance UIDs and
+  modification times, so an entry is not used after files are added,
+  removed or modified. The key also covers the examine parameters (e.g. the
+  frame identifying tags and epsilon) and a digest of the source code of
+  examine, so entries are not used after a settings change or an update of
+  the plugin. The least recently used entries are removed when there are
+  more than maximumEntries.
+  """
+
+  VERSION = 2
+
+  # source digests by (path, size, modification time)
+  sourceDigests = {}
+
+  def __init__(self, directory, maximumEntries=500):
+    self.directory = directory
+    self.maximumEntries = maximumEntries
+
+  @staticmethod
+  def fingerprint(fileLists, instanceUIDs):
+    """ Fingerprint of the examined files. instanceUIDs maps each file to its SOP instance UID.
+    Returns None if a file cannot be accessed.
+    """
+    digest = hashlib.sha1()
+    for files in fileLists:
+      digest.update(b'\0')
+      for f in files:
+        try:
+          mtime = os.stat(f).st_mtime_ns
+        except OSError:
+          return None
+        digest.update(f'{f}\t{instanceUIDs.get(f, "")}\t{mtime}\n'.encode())
+    return digest.hexdigest()
+
+  @staticmethod
+  def sourceDigest(paths):
+    """ Digest of the contents of the source files, None if a file cannot be read.
+    Each file is only read again when it was modified.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+      try:
+        stat = os.stat(path)
+        sourceKey = (path, stat.st_size, stat.st_mtime_ns)
+        if sourceKey not in ExamineCache.sourceDigests:
+          with open(path, 'rb') as f:
+            ExamineCache.sourceDigests[sourceKey] = hashlib.sha1(f.read()).hexdigest()
+      except OSError:
+        return None
+      digest.update(ExamineCache.sourceDigests[sourceKey].encode())
+    return digest.hexdigest()
+
+  @staticmethod
+  def key(seriesInstanceUIDs, fingerprint, parameters=None):
+    """ Key of the entry of the series, the fingerprint of their files and the
+    examine parameters (JSON-serializable, e.g. settings and the source digest).
+    """
+    seriesDigest = hashlib.sha1('\n'.join(sorted(set(seriesInstanceUIDs))).encode()).hexdigest()
+    parametersDigest = hashlib.sha1(json.dumps([ExamineCache.VERSION, parameters], sort_keys=True).encode()).hexdigest()
+    return f'{seriesDigest}-{fingerprint}-{parametersDigest}'
+
+  def entryPath(self, key):
+    return os.path.join(self.directory, key + '.json')
+
+  def get(self, key):
+    """ Return the cached loadable descriptions, None if there is no (valid) entry.
+    """
+    path = self.entryPath(key)
+    try:
+      with open(path) as f:
+        entry = json.load(f)
+    except (OSError, ValueError):
+      return None
+    if entry.get('version') != self.VERSION:
+      return None
+    try:
+      # mark as recently used
+      os.utime(path)
+    except OSError:
+      pass
+    return entry['loadables']
+
+  def put(self, key, loadables):
+    """ Store the loadable descriptions (list of JSON-serializable dicts).
+    """
+    os.makedirs(self.directory, exist_ok=True)
+    path = self.entryPath(key)
+    with open(path + '.part', 'w') as f:
+      json.dump({'version': self.VERSION, 'loadables': loadables}, f)
+    os.replace(path + '.part', path)
+    self.prune()
+
+  def prune(self):
+    try:
+      entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.json')]
+    except OSError:
+      return
+    if len(entries) <= self.maximumEntries:
+      return
+    entries.sort(key=lambda path: os.path.getmtime(path))
+    for path in entries[:len(entries) - self.maximumEntries]:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+
+
+class FrameAssembler:
+  """ Interleaves frames into a multivolume scalar array.
+
+  The multivolume array has one row per voxel and one column per frame
+  (nVoxels x nFrames, as returned by vtk_to_numpy for the multivolume
+  scalars). Writing one frame at a time into its column is a strided
+  write that touches every cache line of the whole array for each frame.
+  Instead, frames are collected in batches of consecutive frames and each
+  batch is written block by block: a block of voxel rows is small enough
+  to stay in cache while the values of all frames of the batch are
+  written into it.
+
+  Frames may be added in any order and from several threads.
+
+  A batch buffer holds at most maximumBatchBytes (but at least one frame),
+  so large frames are assembled in smaller batches. Frames that arrive out
+  of order may keep more than one batch buffer allocated at a time.
+  Batches of one frame (batchSize=1 or maximumBatchBytes=0) are written
+  directly from the added frame, without a batch buffer.
+  """
+
+  def __init__(self, mvImageArray, batchSize=16, blockSize=1<<14, maximumBatchBytes=256*1024*1024):
+    if mvImageArray.ndim == 1:
+      mvImageArray = mvImageArray.reshape(-1, 1)
+    self.mvImageArray = mvImageArray
+    self.numberOfVoxels, self.numberOfFrames = mvImageArray.shape
+    self.batchSize = batchFrames(self.numberOfVoxels * mvImageArray.itemsize, self.numberOfFrames,
+      batchSize, maximumBatchBytes)
+    self.blockSize = blockSize
+    self.lock = threading.Lock()
+    self.batches = {}  # batch number: [frame buffer, number of frames added]
+
+  def batchRange(self, batchNumber):
+    firstFrame = batchNumber * self.batchSize
+    return firstFrame, min(firstFrame + self.batchSize, self.numberOfFrames)
+
+  def addFrame(self, frameNumber, frameArray):
+    """ Add the voxels of a frame. The batch of the frame is written
+    to the multivolume array as soon as all of its frames are added.
+    """
+    if self.batchSize == 1:
+      interleaveFrames(self.mvImageArray, frameNumber, frameArray.reshape(1, -1), self.blockSize)
+      return
+    batchNumber = frameNumber // self.batchSize
+    firstFrame, lastFrame = self.batchRange(batchNumber)
+    with self.lock:
+      if batchNumber not in self.batches:
+        self.batches[batchNumber] = [np.zeros((lastFrame - firstFrame, self.numberOfVoxels), dtype=self.mvImageArray.dtype), 0]
+      batch = self.batches[batchNumber]
+    batch[0][frameNumber - firstFrame] = frameArray.reshape(-1)
+    with self.lock:
+      batch[1] += 1
+      complete = batch[1] == lastFrame - firstFrame
+      if complete:
+        del self.batches[batchNumber]
+    if complete:
+      interleaveFrames(self.mvImageArray, firstFrame, batch[0], self.blockSize)
+
+  def flush(self):
+    """ Write the frames of incomplete batches (e.g. after loading was canceled).
+    Frames that were not added are left as zero.
+    """
+    with self.lock:
+      batches = self.batches
+      self.batches = {}
+    for batchNumber, batch in batches.items():
+      firstFrame, _ = self.batchRange(batchNumber)
+      interleaveFrames(self.mvImageArray, firstFrame, batch[0], self.blockSize)
+
+
+def batchFrames(frameSize, numberOfFrames, batchSize=16, maximumBatchBytes=256*1024*1024):
+  """ Number of frames of a batch of frames of frameSize bytes, limited so that
+  the batch buffer does not exceed maximumBatchBytes (but at least one frame).
+  """
+  return max(1, min(batchSize, numberOfFrames, maximumBatchBytes // max(frameSize, 1)))
+
+
+def interleaveFrames(mvImageArray, firstFrame, frames, blockSize=1<<14):
+  """ Write consecutive frames (nBatchFrames x nVoxels) into the columns
+  firstFrame... of the multivolume array (nVoxels x nFrames), one block of
+  voxel rows at a time.
+  """
+  lastFrame = firstFrame + frames.shape[0]
+  numberOfVoxels = mvImageArray.shape[0]
+  for blockStart in range(0, numberOfVoxels, blockSize):
+    blockEnd = min(blockStart + blockSize, numberOfVoxels)
+    mvImageArray[blockStart:blockEnd, firstFrame:lastFrame] = frames[:, blockStart:blockEnd].T
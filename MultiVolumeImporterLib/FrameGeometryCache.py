@@ -0,0 +1,90 @@
+import math
+
+
+class FrameGeometry:
+  """ Geometry of a single frame, as determined by the scalar volume plugin.
+
+  loadable is the scalar volume loadable of the frame (files sorted in
+  geometric order, warning set by the scalar volume plugin), so the frame
+  can be loaded later without examining it again.
+  """
+
+  def __init__(self, loadable, headerTable):
+    self.loadable = loadable
+    self.files = loadable.files
+    self.warning = getattr(loadable, 'warning', '')
+    self.origin = self.parseVector(headerTable.value(self.files[0], 'position'))
+    self.spacing = self.computeSpacing(headerTable)
+
+  @classmethod
+  def fromFiles(cls, files, warning=''):
+    """ Frame geometry restored from the examine cache. Only the file
+    ordering and the warning are known, loadable, origin and spacing are None.
+    """
+    frameGeometry = cls.__new__(cls)
+    frameGeometry.loadable = None
+    frameGeometry.files = files
+    frameGeometry.warning = warning
+    frameGeometry.origin = None
+    frameGeometry.spacing = None
+    return frameGeometry
+
+  @staticmethod
+  def parseVector(valueStr):
+    try:
+      return [float(v) for v in valueStr.split('\\')]
+    except ValueError:
+      return None
+
+  def computeSpacing(self, headerTable):
+    """ Column, row and slice spacing; None if it cannot be determined
+    from the header.
+    """
+    pixelSpacing = self.parseVector(headerTable.value(self.files[0], 'pixelSpacing'))
+    if not pixelSpacing or len(pixelSpacing) != 2 or self.origin is None:
+      return None
+    sliceSpacing = 0.
+    if len(self.files) > 1:
+      secondPosition = self.parseVector(headerTable.value(self.files[1], 'position'))
+      if secondPosition is None:
+        return None
+      sliceSpacing = math.sqrt(sum((a - b) ** 2 for a, b in zip(self.origin, secondPosition)))
+    return [pixelSpacing[1], pixelSpacing[0], sliceSpacing]
+
+
+class FrameGeometryCache:
+  """ Memoized scalar volume examine() results of individual frames.
+
+  Entries are keyed by the set of files of the frame, so the same frame
+  found by different strategies (or by examine and then load) is only
+  examined once. Frames that could not be parsed as a scalar volume are
+  cached as None.
+  """
+
+  def __init__(self, scalarVolumePlugin):
+    self.scalarVolumePlugin = scalarVolumePlugin
+    self.__entries = {}
+
+  def frameGeometry(self, frameFiles, headerTable):
+    """ Return the FrameGeometry of the frame, examining it if needed.
+    """
+    key = frozenset(frameFiles)
+    try:
+      return self.__entries[key]
+    except KeyError:
+      pass
+    svs = self.scalarVolumePlugin.examine([list(frameFiles)])
+    geometry = FrameGeometry(svs[0], headerTable) if svs else None
+    self.__entries[key] = geometry
+    return geometry
+
+  def addFrameGeometry(self, frameGeometry):
+    """ Add a frame geometry that is already known (e.g. restored from the examine cache).
+    """
+    self.__entries[frozenset(frameGeometry.files)] = frameGeometry
+
+  def cachedFrameGeometry(self, frameFiles):
+    """ Return the FrameGeometry of the frame if it has been examined
+    already, None otherwise.
+    """
+    return self.__entries.get(frozenset(frameFiles))
@@ -0,0 +1,216 @@
+import collections
+
+import numpy as np
+
+from MultiVolumeImporterLib import Geometry
+from MultiVolumeImporterLib import ValueParsing
+from MultiVolumeImporterLib.IncrementalExamine import PositionPartition, TagPartition
+
+#
+# Grouping of the files of a series into multivolume frames, using the
+# header values only. This is the core of the examine strategies of the
+# multivolume importer plugin (initMultiVolumes, examineFilesIPPAcqTime,
+# examineFilesIPPInstanceNumber); the plugin checks the frames with the
+# scalar volume plugin and turns the groups into loadables.
+#
+# groupSeries() runs in worker processes, so this module must not import
+# Slicer, Qt or VTK.
+#
+
+# frames of one frame identifying tag: file lists and labels, ordered by tag value
+TagGroup = collections.namedtuple('TagGroup', ['frameTag', 'frameFileLists', 'frameLabels'])
+
+# groups of the files of one series, as computed by groupSeries()
+SeriesGroups = collections.namedtuple('SeriesGroups', ['files', 'subseries', 'acquisitionTimeFrames', 'instanceNumberFrames'])
+
+TIME_TAGS = ('AcquisitionTime', 'SeriesTime', 'ContentTime')
+
+
+def splitSeries(files, headerTable):
+  """ The files grouped by series instance UID, in the order of first appearance.
+  """
+  subseriesLists = {}
+  for f, value in zip(files, headerTable.values(files, 'seriesInstanceUID')):
+    if value == "":
+      value = "Unknown"
+    if value not in subseriesLists:
+      subseriesLists[value] = []
+    subseriesLists[value].append(f)
+  return list(subseriesLists.values())
+
+
+def frameTagValues(files, headerTable, frameTag):
+  """ Parsed values of a frame identifying tag for the files, the mask of the values
+  that could be parsed and whether any of the files does not have the tag.
+  Each distinct header value is parsed only once.
+  """
+  values, valid = headerTable.parsedColumn(frameTag, ValueParsing.frameTagParser(frameTag), headerTable.rows(files))
+  return values, valid, headerTable.hasEmptyValue(files, frameTag)
+
+
+def tagPartition(files, headerTable, consideredTags, partition=None):
+  """ Partition the files by the values of each of the considered tags.
+  New files are added to partition if it is given.
+  """
+  if partition is None:
+    partition = TagPartition(consideredTags)
+  partition.addFiles(files, lambda newFiles, frameTag: frameTagValues(newFiles, headerTable, frameTag))
+  return partition
+
+
+def checkFrameGeometry(headerTable, frameFileLists, epsilon):
+  """ Geometry checks of each frame: whether the slice positions are unique and the
+  orientations consistent within the frame. Returns a list of (positionsUnique, orientationsConsistent).
+  """
+  frameIds = np.repeat(np.arange(len(frameFileLists)), [len(frameFileList) for frameFileList in frameFileLists])
+  rows = headerTable.rows([f for frameFileList in frameFileLists for f in frameFileList])
+  positions, positionsValid = headerTable.floatVectors('position', 3, rows)
+  orientations, orientationsValid = headerTable.floatVectors('orientation', 6, rows)
+  positionsUnique = Geometry.framePositionsUnique(frameIds, positions, positionsValid, epsilon)
+  orientationsConsistent = Geometry.frameOrientationsConsistent(frameIds, orientations, orientationsValid, epsilon)
+  return list(zip(positionsUnique.tolist(), orientationsConsistent.tolist()))
+
+
+def tagGroups(files, headerTable, partition, epsilon):
+  """ Frames of each tag of the partition that separates the files into a multivolume.
+
+  Returns the list of TagGroups and a list of (frameTag, reason) for the
+  tags that have several values but whose frames do not have a consistent
+  geometry (same number of slices, same orientation, no repeated slice
+  positions within epsilon).
+
+  The geometry of a frame is only checked if it changed since the last call
+  with the same partition, so folding new files into a partition costs time
+  in proportion to the frames they touch.
+  """
+  groups = []
+  rejections = []
+
+  for frameTag in partition.consideredTags:
+    tagValue2FileList = partition.tagValue2FileLists[frameTag]
+    if len(tagValue2FileList)<2:
+      # not enough frames for this tag to be a multivolume
+      continue
+
+    tagValues = sorted(tagValue2FileList.keys())
+    frameFileLists = [tagValue2FileList[tagValue] for tagValue in tagValues]
+    slicesPerFrame = np.array([len(frameFileList) for frameFileList in frameFileLists])
+    if np.any(slicesPerFrame != slicesPerFrame[0]):
+      reason = Geometry.partitionRejection(slicesPerFrame, True, True)
+    else:
+      frameChecks = partition.geometryChecks(frameTag, epsilon)
+      uncheckedValues = [tagValue for tagValue in tagValues if tagValue not in frameChecks]
+      if uncheckedValues:
+        frameChecks.update(zip(uncheckedValues,
+          checkFrameGeometry(headerTable, [tagValue2FileList[tagValue] for tagValue in uncheckedValues], epsilon)))
+      checks = [frameChecks[tagValue] for tagValue in tagValues]
+      reason = Geometry.partitionRejection(slicesPerFrame,
+        [positionsUnique for positionsUnique, _ in checks], [orientationsConsistent for _, orientationsConsistent in checks])
+    if reason is not None:
+      if np.any(slicesPerFrame != slicesPerFrame[0]):
+        for numberOfSlices in np.unique(slicesPerFrame):
+          reason += f"{numberOfSlices} slices are found for {frameTag}={[tagValues[i] for i in np.flatnonzero(slicesPerFrame == numberOfSlices)]}."
+      rejections.append((frameTag, reason))
+      continue
+
+    frameLabels = np.array(tagValues, dtype=np.float64)
+    # if mv was parsed by series time, probably makes sense to start from 0
+    if frameTag in TIME_TAGS:
+      frameLabels -= frameLabels[0]
+    groups.append(TagGroup(frameTag, frameFileLists, frameLabels))
+
+  return groups, rejections
+
+
+def positionPartition(files, headerTable, timeTag, partition=None):
+  """ Group the files by ImagePositionPatient and then by the time value
+  ('AcquisitionTime' or 'instanceNumber'). New files are added to partition if it is given.
+  """
+  if partition is None:
+    partition = PositionPartition()
+  newFiles = [f for f in files if f not in partition.files]
+  parse = ValueParsing.parseTM if timeTag == 'AcquisitionTime' else ValueParsing.parseIntegers
+  times, valid = headerTable.parsedColumn(timeTag, parse, headerTable.rows(newFiles))
+  # files whose time cannot be parsed are not assigned to any frame
+  newFiles = [f for f, timeValid in zip(newFiles, valid) if timeValid]
+  partition.addFiles(newFiles, headerTable.values(newFiles, 'position'), times[valid].tolist())
+  return partition
+
+
+def positionFrameFileLists(partition):
+  """ Frames of the IPP strategies: the n-th file (by time) of each position is in frame n.
+  None if the number of files is not the same at each position or there are less than 2 frames.
+  """
+  subseriesLists = partition.subseriesLists
+  framesPerPosition = {len(timeFiles) for timeFiles in subseriesLists.values()}
+  if len(framesPerPosition) != 1:
+    return None
+  nFrames = framesPerPosition.pop()
+  if nFrames<2:
+    return None
+  frameFileLists = [[] for _ in range(nFrames)]
+  for timeFiles in subseriesLists.values():
+    for frameNumber, time in enumerate(sorted(timeFiles.keys())):
+      frameFileLists[frameNumber].append(timeFiles[time])
+  return frameFileLists
+
+
+def distinctValues(files, headerTable, tagName):
+  """ The distinct header values of the files for a tag.
+  """
+  uniqueValues = headerTable.uniqueValues(tagName)
+  return [uniqueValues[code] for code in np.unique(headerTable.codes(tagName, headerTable.rows(files)))]
+
+
+def strategySkipReasons(files, headerTable, frameTags):
+  """ Cheap check of which examine strategies cannot find a multivolume in the files,
+  using only the number of distinct header values. Returns {strategy name: reason}
+  for the strategies that can be skipped; the tag based strategies (examineFiles,
+  examineFilesMultiseries) are checked with frameTags.
+
+  The checks are necessary conditions only: a strategy that is not skipped may
+  still not find a multivolume.
+  """
+  reasons = {}
+
+  # a tag can only separate frames if it has at least two (non-empty) values
+  if not any(len([value for value in distinctValues(files, headerTable, frameTag) if value != '']) > 1
+      for frameTag in frameTags):
+    reason = "none of the frame identifying tags has more than one value"
+    reasons['examineFiles'] = reason
+    reasons['examineFilesMultiseries'] = reason
+
+  # the IPP strategies need several files at the same position
+  if len(distinctValues(files, headerTable, 'position')) == len(files):
+    reason = "each file has a distinct ImagePositionPatient"
+    reasons['examineFilesIPPAcqTime'] = reason
+    reasons['examineFilesIPPInstanceNumber'] = reason
+  else:
+    if len(distinctValues(files, headerTable, 'AcquisitionTime')) < 2:
+      reasons['examineFilesIPPAcqTime'] = "AcquisitionTime does not vary"
+    for tag in ('instanceNumber', 'position', 'repetitionTime'):
+      if headerTable.hasEmptyValue(files, tag):
+        reasons['examineFilesIPPInstanceNumber'] = f"{tag} is missing in some files"
+        break
+
+  return reasons
+
+
+def groupSeries(files, headerTable, consideredTags, epsilon):
+  """ Group the files of one series the way examineFiles(), examineFilesIPPAcqTime()
+  and examineFilesIPPInstanceNumber() of the plugin do. Runs in a worker process,
+  headerTable only needs to cover the files.
+  """
+  subseries = []
+  for subseriesFiles in splitSeries(files, headerTable):
+    partition = tagPartition(subseriesFiles, headerTable, consideredTags)
+    groups, rejections = tagGroups(subseriesFiles, headerTable, partition, epsilon)
+    subseries.append((subseriesFiles, groups, rejections))
+
+  acquisitionTimeFrames = positionFrameFileLists(positionPartition(files, headerTable, 'AcquisitionTime'))
+
+  instanceNumberFrames = None
+  if not any(headerTable.hasEmptyValue(files, tag) for tag in ('instanceNumber', 'position', 'repetitionTime')):
+    instanceNumberFrames = positionFrameFileLists(positionPartition(files, headerTable, 'instanceNumber'))
+
+  return SeriesGroups(files, subseries, acquisitionTimeFrames, instanceNumberFrames)
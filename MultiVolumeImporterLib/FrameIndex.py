@@ -0,0 +1,77 @@
+import sys
+
+import numpy as np
+
+
+class FrameIndex:
+  """ Compact description of the files and labels of the frames of a multivolume.
+
+  paths is the table of distinct (interned) file paths, order holds the
+  int32 index into paths of every file in frame order, and the files of
+  frame i are order[offsets[i]:offsets[i+1]]. labels holds the float64
+  frame label of every frame.
+
+  The index is built once during examine and passed to load; the comma
+  separated MRML attributes are only produced from it when needed.
+  """
+
+  def __init__(self, frameFileLists, frameLabels):
+    self.paths = []
+    pathIds = {}
+    order = []
+    offsets = [0]
+    for frameFileList in frameFileLists:
+      for path in frameFileList:
+        pathId = pathIds.get(path)
+        if pathId is None:
+          pathId = len(self.paths)
+          pathIds[path] = pathId
+          self.paths.append(sys.intern(path))
+        order.append(pathId)
+      offsets.append(len(order))
+    self.order = np.array(order, dtype=np.int32)
+    self.offsets = np.array(offsets, dtype=np.int64)
+    self.labels = np.array(frameLabels, dtype=np.float64)
+    assert len(self.labels) == self.numberOfFrames(), \
+      f"{len(self.labels)} frame labels are given for {self.numberOfFrames()} frames"
+
+  @staticmethod
+  def fromAttributes(frameFileListStr, frameLabelsStr, nFrames):
+    """ Create a frame index from the MultiVolume.FrameFileList and
+    MultiVolume.FrameLabels attributes of a multivolume node, assuming
+    the same number of files in each frame. Frames are labeled by their
+    number if the node has no frame labels.
+    """
+    files = frameFileListStr.split(',')
+    filesPerFrame = int(len(files)/nFrames)
+    frameFileLists = [files[frameNumber*filesPerFrame:(frameNumber+1)*filesPerFrame] for frameNumber in range(nFrames)]
+    frameLabels = [float(label) for label in frameLabelsStr.split(',')] if frameLabelsStr else range(nFrames)
+    return FrameIndex(frameFileLists, frameLabels)
+
+  def numberOfFrames(self):
+    return len(self.offsets) - 1
+
+  def numberOfFiles(self):
+    return len(self.order)
+
+  def frameFiles(self, frameNumber):
+    """ File paths of the given frame, in the order they were added.
+    """
+    paths = self.paths
+    return [paths[pathId] for pathId in self.order[self.offsets[frameNumber]:self.offsets[frameNumber+1]].tolist()]
+
+  def files(self):
+    """ File paths of all frames, in frame order.
+    """
+    paths = self.paths
+    return [paths[pathId] for pathId in self.order.tolist()]
+
+  def fileListAttribute(self):
+    """ Value of the MultiVolume.FrameFileList attribute.
+    """
+    return ','.join(self.files())
+
+  def labelsAttribute(self):
+    """ Value of the MultiVolume.FrameLabels attribute.
+    """
+    return ','.join(str(label) for label in self.labels.tolist())
@@ -0,0 +1,153 @@
+import collections
+import concurrent.futures
+import threading
+
+import vtk
+import vtkITK
+
+from MultiVolumeImporterLib.Metrics import Metrics
+
+
+FrameInfo = collections.namedtuple('FrameInfo', ['extent', 'scalarType', 'numberOfComponents', 'ijkToRAS'])
+
+
+class FrameReader:
+  """ Reads a scalar volume from a list of files without creating MRML nodes.
+
+  This uses the same ITK archetype reader as the volume storage node, but
+  does not touch the scene, so it can be used from worker threads. A reader
+  must not be shared between threads.
+  """
+
+  def __init__(self, imageIOName='GDCM'):
+    self.reader = vtkITK.vtkITKArchetypeImageSeriesScalarReader()
+    self.reader.SetOutputScalarTypeToNative()
+    self.reader.SetDesiredCoordinateOrientationToNative()
+    self.reader.SetUseNativeOriginOn()
+    if imageIOName == 'DCMTK':
+      self.reader.SetDICOMImageIOApproachToDCMTK()
+    else:
+      self.reader.SetDICOMImageIOApproachToGDCM()
+
+  def probe(self, fileName):
+    """ Read only the image information of a single-file volume, without decoding the voxels.
+
+    Returns a FrameInfo with the extent, the (native) scalar type, the number
+    of components and the IJK to RAS matrix (including spacing and directions).
+    """
+    reader = self.reader
+    reader.ResetFileNames()
+    reader.SetArchetype(fileName)
+    reader.SetSingleFile(1)
+    reader.UpdateInformation()
+    if reader.GetErrorCode() != 0:
+      raise OSError(f"Failed to read image information from {fileName}")
+
+    ijkToRAS = vtk.vtkMatrix4x4()
+    vtk.vtkMatrix4x4.Invert(reader.GetRasToIjkMatrix(), ijkToRAS)
+    extent = reader.GetOutputInformation(0).Get(vtk.vtkStreamingDemandDrivenPipeline.WHOLE_EXTENT())
+    return FrameInfo(tuple(extent), reader.GetOutputScalarType(), reader.GetNumberOfComponents(), ijkToRAS)
+
+  def read(self, files):
+    """ Read the volume stored in files (sorted in geometric order).
+
+    Returns the image data (origin 0, spacing 1, like in volume nodes) and
+    the IJK to RAS matrix of the volume.
+    """
+    reader = self.reader
+    reader.ResetFileNames()
+    reader.SetArchetype(files[0])
+    if len(files) > 1:
+      reader.SetSingleFile(0)
+      for f in files:
+        reader.AddFileName(f)
+    else:
+      reader.SetSingleFile(1)
+    reader.Update()
+    if reader.GetErrorCode() != 0 or reader.GetOutput().GetPointData().GetScalars() is None:
+      raise OSError(f"Failed to read volume from {files[0]}")
+
+    image = vtk.vtkImageData()
+    image.ShallowCopy(reader.GetOutput())
+    image.SetOrigin(0, 0, 0)
+    image.SetSpacing(1, 1, 1)
+
+    ijkToRAS = vtk.vtkMatrix4x4()
+    vtk.vtkMatrix4x4.Invert(reader.GetRasToIjkMatrix(), ijkToRAS)
+    return image, ijkToRAS
+
+
+class ParallelFrameReader:
+  """ Reads frames in a pool of worker threads, each worker with its own FrameReader.
+
+  Only the reading (and the optional per-frame processing, such as copying
+  the voxels into a preallocated buffer) is done in the workers; results
+  are handed back to the calling thread, which remains responsible for
+  all scene updates. With a single worker the frames are read in the
+  calling thread, reusing one reader for all frames.
+
+  The read and process times of each frame are recorded in metrics, if given.
+  """
+
+  def __init__(self, numberOfWorkers, imageIOName='GDCM', metrics=None):
+    self.imageIOName = imageIOName
+    self.metrics = metrics or Metrics()
+    self.executor = None
+    if numberOfWorkers > 1:
+      self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=numberOfWorkers)
+    self.local = threading.local()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.shutdown()
+
+  def shutdown(self):
+    if self.executor:
+      self.executor.shutdown(wait=True, cancel_futures=True)
+
+  def threadFrameReader(self):
+    if not hasattr(self.local, 'frameReader'):
+      self.local.frameReader = FrameReader(self.imageIOName)
+    return self.local.frameReader
+
+  def readFrame(self, frameNumber, files, process):
+    with self.metrics.phase('read', 'load', frame=frameNumber):
+      image, ijkToRAS = self.threadFrameReader().read(files)
+    if process:
+      with self.metrics.phase('copy', 'load', frame=frameNumber):
+        return process(frameNumber, image, ijkToRAS)
+    return image, ijkToRAS
+
+  def readFrames(self, frameNumbers, frameFileLists, process=None, idle=None):
+    """ Read the given frames and yield (frameNumber, result) as the frames complete.
+
+    The result is the return value of process(frameNumber, image, ijkToRAS),
+    called in the worker thread, or (image, ijkToRAS) if process is None.
+    idle() is called regularly on the calling thread while waiting (e.g. to
+    process GUI events); if it returns False the remaining frames are
+    canceled and the generator returns, once the frames that are being read
+    are done (so process is not called after that).
+    """
+    if self.executor is None:
+      for frameNumber, frameFileList in zip(frameNumbers, frameFileLists):
+        if idle and not idle():
+          return
+        yield frameNumber, self.readFrame(frameNumber, frameFileList, process)
+      return
+
+    pending = {self.executor.submit(self.readFrame, frameNumber, frameFileList, process): frameNumber
+      for frameNumber, frameFileList in zip(frameNumbers, frameFileLists)}
+    try:
+      while pending:
+        done, _ = concurrent.futures.wait(pending, timeout=0.1, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+          yield pending.pop(future), future.result()
+        if idle and not idle():
+          return
+    finally:
+      for future in pending:
+        future.cancel()
+      # wait for the frames that could not be canceled, their results are dropped
+      concurrent.futures.wait(pending)
@@ -0,0 +1,57 @@
+import numpy as np
+
+#
+# Array based checks of the acquisition geometry of candidate frame
+# partitions. A partition is given by the frame index of every slice,
+# together with the parsed ImagePositionPatient (N x 3) and
+# ImageOrientationPatient (N x 6) of the slices.
+#
+
+def frameSliceCounts(frameIds):
+  """ Number of slices in each frame.
+  """
+  return np.bincount(frameIds)
+
+
+def frameOrientationsConsistent(frameIds, orientations, orientationsValid, epsilon):
+  """ For each frame, True if all its slices have the same orientation, within
+  epsilon. A frame where only some of the slices have an orientation is
+  not consistent.
+  """
+  numberOfFrames = frameIds.max() + 1
+  frameNumbers, firstRows = np.unique(frameIds, return_index=True)
+  frameFirstRow = np.zeros(numberOfFrames, dtype=np.int64)
+  frameFirstRow[frameNumbers] = firstRows
+  referenceRows = frameFirstRow[frameIds]
+
+  difference = np.abs(orientations - orientations[referenceRows])
+  inconsistent = (orientationsValid != orientationsValid[referenceRows]) | (orientationsValid & np.any(difference > epsilon, axis=1))
+  return np.bincount(frameIds[inconsistent], minlength=numberOfFrames) == 0
+
+
+def framePositionsUnique(frameIds, positions, positionsValid, epsilon):
+  """ For each frame, True if no two of its slices are at the same position
+  (within epsilon). Slices without a position count as the same position.
+  """
+  numberOfFrames = frameIds.max() + 1
+  quantized = np.round(positions / epsilon)
+  quantized[~positionsValid] = np.inf
+  keys = np.column_stack((frameIds, quantized))
+  uniqueFrameIds = np.unique(keys, axis=0)[:, 0].astype(np.int64)
+  return np.bincount(uniqueFrameIds, minlength=numberOfFrames) == np.bincount(frameIds, minlength=numberOfFrames)
+
+
+def partitionRejection(sliceCounts, positionsUnique, orientationsConsistent):
+  """ Check the geometry of a candidate frame partition, given the number of
+  slices and the results of the geometry checks of each frame.
+
+  Returns None if the partition is valid, otherwise a short description
+  of the reason why it was rejected.
+  """
+  if np.any(sliceCounts != sliceCounts[0]):
+    return "number of slices varies across frames."
+  if not np.all(positionsUnique):
+    return "there are multiple frames at the same position within a frame."
+  if not np.all(orientationsConsistent):
+    return "orientation of slices are not the same within a frame."
+  return None
@@ -0,0 +1,181 @@
+import sys
+
+import numpy as np
+
+from MultiVolumeImporterLib import ValueParsing
+
+
+class HeaderTable:
+  """ Column store of DICOM header values for a set of files.
+
+  Every tag is fetched once per file when the table is built. Each column
+  is dictionary-encoded: the distinct (interned) strings of the column are
+  kept in a list and every file holds an int32 code into that list.
+  Strategies that only care about distinct values (grouping, parsing)
+  can therefore work on the short list of unique strings and index the
+  result with the codes.
+
+  The table has no Slicer dependency; the database only has to provide
+  fileValue(file, tag), like ctkDICOMDatabase does.
+
+  Files can be added to an existing table (e.g. instances of a series that
+  is still being acquired); only the headers of the new files are read.
+  """
+
+  def __init__(self, files, tags, database):
+    self.files = []
+    self.tags = dict(tags)
+    self.fileIndex = {}
+    self.__values = {}
+    self.__codes = {}
+    self.__lookups = {}
+    self.__parsed = {}
+
+    for tagName in self.tags:
+      self.__values[tagName] = []
+      self.__codes[tagName] = np.empty(0, dtype=np.int32)
+      self.__lookups[tagName] = {}
+
+    self.addFiles(files, database)
+
+  def addFiles(self, files, database):
+    """ Read the headers of the files that are not in the table yet and add them as new rows.
+    """
+    newFiles = [f for f in dict.fromkeys(files) if f not in self.fileIndex]
+    if not newFiles:
+      return
+    firstRow = len(self.files)
+    for row, f in enumerate(newFiles, firstRow):
+      self.fileIndex[f] = row
+    self.files += newFiles
+
+    newCodes = {tagName: np.empty(len(newFiles), dtype=np.int32) for tagName in self.tags}
+
+    # one pass over the files, all tags of a file fetched together
+    tagItems = list(self.tags.items())
+    for row, f in enumerate(newFiles):
+      for tagName, tag in tagItems:
+        value = database.fileValue(f, tag)
+        if value is None:
+          value = ''
+        lookup = self.__lookups[tagName]
+        code = lookup.get(value)
+        if code is None:
+          code = len(lookup)
+          lookup[value] = code
+          self.__values[tagName].append(sys.intern(value))
+        newCodes[tagName][row] = code
+
+    for tagName in self.tags:
+      self.__codes[tagName] = np.concatenate([self.__codes[tagName], newCodes[tagName]])
+
+  def select(self, files):
+    """ New table with the rows of the given files only, e.g. to send the
+    headers of one series to a worker process. No headers are read.
+    """
+    files = list(dict.fromkeys(files))
+    rows = self.rows(files)
+    table = HeaderTable([], self.tags, None)
+    table.files = files
+    table.fileIndex = {f: row for row, f in enumerate(files)}
+    for tagName in self.tags:
+      uniqueCodes, codes = np.unique(self.__codes[tagName][rows], return_inverse=True)
+      values = [self.__values[tagName][code] for code in uniqueCodes]
+      table.__values[tagName] = values
+      table.__codes[tagName] = codes.astype(np.int32).reshape(-1)
+      table.__lookups[tagName] = {value: code for code, value in enumerate(values)}
+    return table
+
+  def __len__(self):
+    return len(self.files)
+
+  def __contains__(self, f):
+    return f in self.fileIndex
+
+  def covers(self, files):
+    """ True if every file in files has a row in the table.
+    """
+    return all(f in self.fileIndex for f in files)
+
+  def rows(self, files):
+    """ Row indices (int array) of the given files.
+    """
+    return np.fromiter((self.fileIndex[f] for f in files), dtype=np.int64, count=len(files))
+
+  def codes(self, tagName, rows=None):
+    """ Dictionary codes of the column, optionally restricted to rows.
+    """
+    codes = self.__codes[tagName]
+    if rows is None:
+      return codes
+    return codes[rows]
+
+  def uniqueValues(self, tagName):
+    """ Distinct strings of the column; codes index into this list.
+    """
+    return self.__values[tagName]
+
+  def column(self, tagName, rows=None):
+    """ Column values as a NumPy object array of interned strings.
+    """
+    values = np.array(self.__values[tagName], dtype=object)
+    return values[self.codes(tagName, rows)]
+
+  def value(self, f, tagName):
+    """ Header value of a single file, '' if the tag is not present.
+    """
+    return self.__values[tagName][self.__codes[tagName][self.fileIndex[f]]]
+
+  def values(self, files, tagName):
+    """ Header values of the given files as a list of strings.
+    """
+    uniqueValues = self.__values[tagName]
+    codes = self.__codes[tagName]
+    return [uniqueValues[codes[self.fileIndex[f]]] for f in files]
+
+  def hasEmptyValue(self, files, tagName):
+    """ True if any of the files has an empty value for the tag.
+    """
+    uniqueValues = self.__values[tagName]
+    emptyCodes = [code for code, value in enumerate(uniqueValues) if value == '']
+    if not emptyCodes:
+      return False
+    return bool(np.isin(self.codes(tagName, self.rows(files)), emptyCodes).any())
+
+  def parsedColumn(self, tagName, parse, rows=None):
+    """ Parse a column with parse(strings), a column parser of ValueParsing
+    that returns a values and a validity array for a sequence of strings.
+
+    Returns the values and validity of the rows (all rows by default). Each
+    distinct string is parsed only once: the parsed distinct values are kept,
+    and when files are added only the new distinct strings are parsed.
+    """
+    uniqueParsed, uniqueValid = self.__parseUniqueValues((tagName, parse), tagName, parse)
+    codes = self.codes(tagName, rows)
+    return uniqueParsed[codes], uniqueValid[codes]
+
+  def floatVectors(self, tagName, size, rows=None):
+    """ Parse a multi-valued numeric column (e.g. ImagePositionPatient)
+    into an N x size float64 array.
+
+    Returns the array and a boolean mask of the rows that could be parsed;
+    rows that could not be parsed are NaN. Each distinct string is parsed
+    only once, and the parsed column is kept for subsequent calls.
+    """
+    uniqueVectors, uniqueValid = self.__parseUniqueValues((tagName, size), tagName,
+      lambda strings: ValueParsing.parseMultiValued(strings, size))
+    codes = self.codes(tagName, rows)
+    return uniqueVectors[codes], uniqueValid[codes]
+
+  def __parseUniqueValues(self, key, tagName, parse):
+    uniqueValues = self.__values[tagName]
+    parsed = self.__parsed.get(key)
+    parsedCount = len(parsed[1]) if parsed else 0
+    if parsed is None or parsedCount < len(uniqueValues):
+      newParsed, newValid = parse(uniqueValues[parsedCount:])
+      if parsed is not None:
+        newParsed = np.concatenate([parsed[0], newParsed])
+        newValid = np.concatenate([parsed[1], newValid])
+      parsed = (newParsed, newValid)
+      self.__parsed[key] = parsed
+    return parsed
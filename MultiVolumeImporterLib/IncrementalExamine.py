@@ -0,0 +1,135 @@
+import collections
+
+import numpy as np
+
+
+class TagPartition:
+  """ Files of a series partitioned by the values of the frame identifying tags.
+
+  This is the state that initMultiVolumes() builds while iterating over the
+  files: for every considered tag, the files grouped by the parsed tag
+  value. A tag is dropped as soon as one file does not have it. New files
+  can be folded into an existing partition.
+
+  The results of the geometry checks of each frame (see FrameGrouping.tagGroups)
+  are kept until files are added to the frame, so that only the frames
+  touched by new files are checked again.
+  """
+
+  def __init__(self, consideredTags):
+    self.files = set()
+    self.consideredTags = list(consideredTags)
+    self.tagValue2FileLists = {frameTag: {} for frameTag in consideredTags}
+    self.frameChecks = {frameTag: {} for frameTag in consideredTags}  # tag value: check results
+    self.checkedEpsilon = None
+
+  def addFiles(self, files, tagValues):
+    """ Add files to the partition. tagValues(files, frameTag) returns the parsed
+    values of the files (float array), the mask of the values that could be parsed
+    (the other files are not assigned to any frame of the tag) and whether any of
+    the files does not have the tag.
+    """
+    files = [f for f in files if f not in self.files]
+    self.files.update(files)
+    if not files:
+      return
+    for frameTag in list(self.consideredTags):
+      values, valid, missing = tagValues(files, frameTag)
+      if missing:
+        # not found, the tag cannot be used to separate the frames
+        self.consideredTags.remove(frameTag)
+        del self.tagValue2FileLists[frameTag]
+        del self.frameChecks[frameTag]
+        continue
+      # group the files by value, keeping the order of the files within each group
+      validRows = np.flatnonzero(valid)
+      tagValuesOfFiles, inverse = np.unique(values[validRows], return_inverse=True)
+      inverse = inverse.reshape(-1)
+      groupRows = np.split(validRows[np.argsort(inverse, kind='stable')],
+        np.cumsum(np.bincount(inverse, minlength=len(tagValuesOfFiles)))[:-1])
+      tagValue2FileList = self.tagValue2FileLists[frameTag]
+      frameChecks = self.frameChecks[frameTag]
+      for tagValue, rows in zip(tagValuesOfFiles.tolist(), groupRows):
+        tagValue2FileList.setdefault(tagValue, []).extend(files[row] for row in rows)
+        frameChecks.pop(tagValue, None)
+
+  def geometryChecks(self, frameTag, epsilon):
+    """ Check results of the frames of the tag (by tag value) that did not change
+    since they were checked. The checks are discarded if epsilon changes.
+    """
+    if epsilon != self.checkedEpsilon:
+      self.frameChecks = {tag: {} for tag in self.consideredTags}
+      self.checkedEpsilon = epsilon
+    return self.frameChecks[frameTag]
+
+
+class PositionPartition:
+  """ Files of a series grouped by ImagePositionPatient and then by a time value,
+  as used by the IPP strategies. New files can be folded into an existing partition.
+  """
+
+  def __init__(self):
+    self.files = set()
+    self.subseriesLists = {}
+
+  def addFiles(self, files, positions, times):
+    for f, ipp, time in zip(files, positions, times):
+      if f in self.files:
+        continue
+      self.files.add(f)
+      if ipp not in self.subseriesLists:
+        self.subseriesLists[ipp] = {}
+      self.subseriesLists[ipp][time] = f
+
+
+class ExamineState:
+  """ State of examine() that is kept for the next examine() of the same, grown, set of files:
+  the header table, the frame geometry cache and the partitions of the strategies.
+  """
+
+  def __init__(self, headerTable, frameGeometryCache):
+    self.headerTable = headerTable
+    self.frameGeometryCache = frameGeometryCache
+    self.partitions = {}
+
+  def files(self):
+    return self.headerTable.files
+
+  def partition(self, key, files, create):
+    """ Return the partition stored under key if it only contains files
+    of the given files (i.e. new files can be folded in), else a new one.
+    """
+    partition = self.partitions.get(key)
+    if partition is None or not partition.files.issubset(files):
+      partition = create()
+      self.partitions[key] = partition
+    return partition
+
+
+class IncrementalExamine:
+  """ The most recently used examine states. A state is reused if all the files it
+  was built for are among the files examined now (e.g. a series that is still arriving).
+  """
+
+  def __init__(self, maximumStates=4):
+    self.maximumStates = maximumStates
+    self.states = collections.OrderedDict()  # id: state, least recently used first
+
+  def findState(self, files):
+    """ Return the largest state whose files are all among files, None if there is none.
+    """
+    files = set(files)
+    bestState = None
+    for state in self.states.values():
+      stateFiles = state.files()
+      if stateFiles and len(stateFiles) <= len(files) and files.issuperset(stateFiles):
+        if bestState is None or len(stateFiles) > len(bestState.files()):
+          bestState = state
+    if bestState is not None:
+      self.states.move_to_end(id(bestState))
+    return bestState
+
+  def addState(self, state):
+    self.states[id(state)] = state
+    while len(self.states) > self.maximumStates:
+      self.states.popitem(last=False)
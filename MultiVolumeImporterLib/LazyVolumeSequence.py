@@ -0,0 +1,240 @@
+import collections
+import concurrent.futures
+import logging
+
+import qt
+import vtk
+import vtk.util.numpy_support
+import slicer
+
+from MultiVolumeImporterLib import NiftiFrames
+from MultiVolumeImporterLib.FrameReader import FrameReader
+
+
+class DicomFrameSource:
+  """ Frames of a lazy volume sequence read from the DICOM files of each frame.
+  """
+
+  def __init__(self, frameFileLists, imageIOName='GDCM'):
+    self.frameFileLists = frameFileLists
+    self.numberOfFrames = len(frameFileLists)
+    self.frameReader = FrameReader(imageIOName)
+
+  def read(self, frameNumber):
+    return self.frameReader.read(self.frameFileLists[frameNumber])
+
+
+class NiftiFrameSource:
+  """ Frames of a lazy volume sequence read from a 4D NIfTI file that is
+  uncompressed or indexed (see NiftiFrames.readFrame).
+  """
+
+  def __init__(self, fileName, layout, frameIndex, reverseSlices, extent, ijkToRAS):
+    self.fileName = fileName
+    self.layout = layout
+    self.frameIndex = frameIndex
+    self.reverseSlices = reverseSlices
+    self.extent = extent
+    self.ijkToRAS = ijkToRAS
+    self.numberOfFrames = layout.numberOfFrames
+
+  def read(self, frameNumber):
+    frameArray = NiftiFrames.readFrame(self.fileName, self.layout, frameNumber, self.frameIndex, self.reverseSlices)
+    # a contiguous copy in native byte order, referenced by the VTK array
+    frameArray = frameArray.astype(frameArray.dtype.newbyteorder('='))
+    frameImage = vtk.vtkImageData()
+    frameImage.SetExtent(self.extent)
+    frameImage.GetPointData().SetScalars(vtk.util.numpy_support.numpy_to_vtk(frameArray.reshape(-1), deep=False))
+    return frameImage, self.ijkToRAS
+
+
+class LazyVolumeSequence:
+  """ Volume sequence whose frames are decoded when they are first displayed.
+
+  Every frame is registered in the sequence node as an empty volume and is
+  only read from the frame source (e.g. a DicomFrameSource) when the
+  sequence browser selects it. At most
+  cacheSize frames are kept decoded (least recently displayed ones are
+  released again), and the neighbors of the displayed frame are read in a
+  background thread so that stepping through the sequence stays smooth.
+
+  All frames are read by one background thread (the frame source is not
+  shared between threads), but the sequence node is only modified from the
+  main thread. Frames that are not decoded are empty, so all frames are
+  decoded (and no longer released) when the scene is saved. Code that saves
+  the sequence node by other means must call materializeAll() first.
+  """
+
+  # lazy sequences of the scene, by sequence node ID
+  instances = {}
+  sceneObserverTags = []
+
+  def __init__(self, volumeSequenceNode, frameSource, cacheSize=16, prefetchSize=2):
+    self.volumeSequenceNode = volumeSequenceNode
+    self.frameSource = frameSource
+    self.numberOfFrames = frameSource.numberOfFrames
+    self.cacheSize = max(cacheSize, 2*prefetchSize+1)
+    self.prefetchSize = prefetchSize
+    self.sequenceBrowserNode = None
+    self.browserObserverTag = None
+    self.updatingProxyNodes = False
+
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    self.pendingFrames = {}  # frame number: future of the background read
+    self.decodedFrames = collections.OrderedDict()  # frame numbers, least recently displayed first
+
+    self.pollTimer = qt.QTimer()
+    self.pollTimer.setInterval(50)
+    self.pollTimer.connect('timeout()', self.addPrefetchedFrames)
+
+    # register all frames as empty volumes
+    placeholder = slicer.vtkMRMLScalarVolumeNode()
+    for frameNumber in range(self.numberOfFrames):
+      self.volumeSequenceNode.SetDataNodeAtValue(placeholder, str(frameNumber))
+
+    # the first frame is needed right away for display
+    self.materialize(0)
+
+    LazyVolumeSequence.instances[volumeSequenceNode.GetID()] = self
+    LazyVolumeSequence.observeScene()
+
+  def setBrowserNode(self, sequenceBrowserNode):
+    """ Start decoding frames as they are selected in the browser node.
+    """
+    self.sequenceBrowserNode = sequenceBrowserNode
+    self.browserObserverTag = sequenceBrowserNode.AddObserver(vtk.vtkCommand.ModifiedEvent, self.onBrowserModified)
+    self.prefetch(sequenceBrowserNode.GetSelectedItemNumber())
+
+  def shutdown(self):
+    """ Stop background reading and observing the browser node.
+    """
+    self.pollTimer.stop()
+    self.executor.shutdown(wait=True, cancel_futures=True)
+    self.pendingFrames = {}
+    if self.sequenceBrowserNode and self.browserObserverTag is not None:
+      self.sequenceBrowserNode.RemoveObserver(self.browserObserverTag)
+    self.browserObserverTag = None
+    LazyVolumeSequence.instances.pop(self.volumeSequenceNode.GetID(), None)
+
+  @staticmethod
+  def shutdownAll(caller=None, event=None):
+    for lazySequence in list(LazyVolumeSequence.instances.values()):
+      lazySequence.shutdown()
+
+  @staticmethod
+  def materializeAllSequences(caller=None, event=None):
+    """ Decode all frames of all lazy sequences (before the scene is saved).
+    """
+    for lazySequence in list(LazyVolumeSequence.instances.values()):
+      lazySequence.materializeAll()
+
+  @staticmethod
+  @vtk.calldata_type(vtk.VTK_OBJECT)
+  def onNodeRemoved(caller, event, node):
+    lazySequence = LazyVolumeSequence.instances.get(node.GetID())
+    if lazySequence:
+      lazySequence.shutdown()
+
+  @staticmethod
+  def observeScene():
+    """ Stop lazy loading when the sequence node is removed or the scene is closed,
+    decode all frames when the scene is saved.
+    """
+    if LazyVolumeSequence.sceneObserverTags:
+      return
+    LazyVolumeSequence.sceneObserverTags = [
+      slicer.mrmlScene.AddObserver(slicer.mrmlScene.StartSaveEvent, LazyVolumeSequence.materializeAllSequences),
+      slicer.mrmlScene.AddObserver(slicer.mrmlScene.StartCloseEvent, LazyVolumeSequence.shutdownAll),
+      slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeRemovedEvent, LazyVolumeSequence.onNodeRemoved)]
+
+  def readFrame(self, frameNumber):
+    # runs in the background thread
+    return self.frameSource.read(frameNumber)
+
+  def setFrame(self, frameNumber, frameImage, ijkToRAS):
+    frame = slicer.vtkMRMLScalarVolumeNode()
+    frame.SetAndObserveImageData(frameImage)
+    frame.SetIJKToRASMatrix(ijkToRAS)
+    self.volumeSequenceNode.UpdateDataNodeAtValue(frame, str(frameNumber), True)
+
+  def releaseFrame(self, frameNumber):
+    self.volumeSequenceNode.UpdateDataNodeAtValue(slicer.vtkMRMLScalarVolumeNode(), str(frameNumber), True)
+
+  def markUsed(self, frameNumber):
+    """ Update the least recently used order and release frames above the cache size.
+    """
+    self.decodedFrames[frameNumber] = True
+    self.decodedFrames.move_to_end(frameNumber)
+    while len(self.decodedFrames) > self.cacheSize:
+      releasedFrameNumber, _ = self.decodedFrames.popitem(last=False)
+      self.releaseFrame(releasedFrameNumber)
+
+  def materialize(self, frameNumber):
+    """ Make sure the frame is decoded in the sequence node.
+    """
+    if frameNumber in self.decodedFrames:
+      self.markUsed(frameNumber)
+      return
+    # read in the background thread as well, which owns the frame source
+    future = self.pendingFrames.pop(frameNumber, None) or self.executor.submit(self.readFrame, frameNumber)
+    frameImage, ijkToRAS = future.result()
+    self.setFrame(frameNumber, frameImage, ijkToRAS)
+    self.markUsed(frameNumber)
+
+  def materializeAll(self):
+    """ Decode all frames (e.g. before saving the sequence). Frames are not released after this.
+    """
+    if len(self.decodedFrames) == self.numberOfFrames:
+      return
+    logging.info(f"Reading all {self.numberOfFrames} frames of {self.volumeSequenceNode.GetName()}")
+    self.cacheSize = self.numberOfFrames
+    for frameNumber in range(self.numberOfFrames):
+      self.materialize(frameNumber)
+
+  def prefetch(self, frameNumber):
+    """ Start reading the neighbors of the frame in the background.
+    """
+    numberOfFrames = self.numberOfFrames
+    for offset in range(1, self.prefetchSize+1):
+      for neighbor in (frameNumber+offset, frameNumber-offset):
+        neighbor %= numberOfFrames
+        if neighbor in self.decodedFrames or neighbor in self.pendingFrames:
+          continue
+        self.pendingFrames[neighbor] = self.executor.submit(self.readFrame, neighbor)
+    if self.pendingFrames:
+      self.pollTimer.start()
+
+  def addPrefetchedFrames(self):
+    """ Add frames read in the background to the sequence node (main thread).
+    """
+    for frameNumber, future in list(self.pendingFrames.items()):
+      if not future.done():
+        continue
+      del self.pendingFrames[frameNumber]
+      try:
+        frameImage, ijkToRAS = future.result()
+      except Exception as e:
+        logging.error(f"Failed to read frame {frameNumber}: {str(e)}")
+        continue
+      self.setFrame(frameNumber, frameImage, ijkToRAS)
+      self.markUsed(frameNumber)
+    if not self.pendingFrames:
+      self.pollTimer.stop()
+
+  def onBrowserModified(self, caller, event):
+    if self.updatingProxyNodes:
+      return
+    frameNumber = self.sequenceBrowserNode.GetSelectedItemNumber()
+    if frameNumber < 0:
+      return
+    if frameNumber in self.decodedFrames:
+      self.markUsed(frameNumber)
+    else:
+      self.materialize(frameNumber)
+      # the proxy node was updated from the empty frame, update it again
+      self.updatingProxyNodes = True
+      try:
+        slicer.modules.sequences.logic().UpdateProxyNodesFromSequences(self.sequenceBrowserNode)
+      finally:
+        self.updatingProxyNodes = False
+    self.prefetch(frameNumber)
@@ -0,0 +1,115 @@
+import os
+import shutil
+
+from MultiVolumeImporterLib.FrameAssembler import batchFrames
+
+#
+# Memory admission of multivolume loads. The size of a loadable is estimated
+# from its DICOM headers during examine, and before loading the estimate is
+# compared with the available memory to decide how (and whether) the
+# multivolume can be loaded.
+#
+
+# strategies
+IN_MEMORY = 'memory'
+MEMORY_MAPPED = 'memoryMapped'
+LAZY_SEQUENCE = 'lazySequence'
+REFUSE = 'refuse'
+
+# fraction of the available memory that a load may use
+MEMORY_FRACTION = 0.8
+
+
+def estimatedSize(rows, columns, bitsAllocated, numberOfSlices, numberOfFrames, floatRescaled=False):
+  """ Estimated peak memory in bytes of loading a multivolume: its voxels,
+  the batch buffer of the frame assembler and the frame being decoded.
+
+  Voxels with a non-integer rescale slope or intercept (floatRescaled) are
+  loaded as float32, and the reader keeps the stored values of the frame
+  next to the rescaled copy.
+  """
+  storedFrameSize = rows * columns * ((bitsAllocated + 7) // 8) * numberOfSlices
+  frameSize = rows * columns * 4 * numberOfSlices if floatRescaled else storedFrameSize
+  size = frameSize * numberOfFrames
+  size += batchFrames(frameSize, numberOfFrames) * frameSize
+  size += frameSize
+  if floatRescaled:
+    size += storedFrameSize
+  return size
+
+
+def formatSize(size):
+  """ Human readable size, e.g. '1.5 GB'.
+  """
+  for unit in ['bytes', 'KB', 'MB', 'GB']:
+    if size < 1024:
+      return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+    size /= 1024
+  return f'{size:.1f} TB'
+
+
+def availableMemory():
+  """ Memory in bytes available to new allocations without swapping, None if it cannot be determined.
+  """
+  try:
+    import psutil
+    return psutil.virtual_memory().available
+  except ImportError:
+    pass
+  memory = memInfoAvailable()
+  if memory is not None:
+    return memory
+  try:
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+  except (AttributeError, ValueError, OSError):
+    return None
+
+
+def memInfoAvailable(path='/proc/meminfo'):
+  """ MemAvailable of /proc/meminfo in bytes (Linux), None if it cannot be read.
+  Unlike the free memory, it includes the page cache that can be reclaimed.
+  """
+  try:
+    with open(path) as f:
+      for line in f:
+        if line.startswith('MemAvailable:'):
+          return int(line.split()[1]) * 1024
+  except (OSError, ValueError, IndexError):
+    pass
+  return None
+
+
+def availableDiskSpace(directory):
+  """ Free space in bytes in directory, None if it cannot be determined.
+  """
+  try:
+    return shutil.disk_usage(directory).free
+  except OSError:
+    return None
+
+
+def admissionStrategy(size, loadAsVolumeSequence, lazySequencePossible, scratchDirectory,
+    memory=None, diskSpace=None):
+  """ Choose how a multivolume of the given estimated size is loaded.
+
+  Returns (strategy, message), where message explains the choice if the
+  multivolume does not fit in memory. Multivolumes are memory-mapped to a
+  scratch file if that has enough space, volume sequences are loaded lazily
+  if their frames can be read on demand; otherwise loading is refused.
+  If the size or the available memory is unknown then the load is admitted.
+  """
+  if memory is None:
+    memory = availableMemory()
+  if not size or memory is None or size <= memory * MEMORY_FRACTION:
+    return IN_MEMORY, None
+
+  message = f'about {formatSize(size)} is needed but only {formatSize(memory)} of memory is available'
+  if loadAsVolumeSequence:
+    if lazySequencePossible:
+      return LAZY_SEQUENCE, f'{message}, frames are loaded when they are displayed'
+  else:
+    if diskSpace is None:
+      diskSpace = availableDiskSpace(scratchDirectory)
+    if diskSpace is not None and size <= diskSpace:
+      return MEMORY_MAPPED, f'{message}, a scratch file in {scratchDirectory} is used instead'
+  return REFUSE, message
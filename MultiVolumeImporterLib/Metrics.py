@@ -0,0 +1,151 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Metrics:
+  """ Wall time of named phases and call counts, to see where the time of
+  examine and load goes.
+
+  Each phase is recorded as an event (name, category, start, duration,
+  thread and arguments such as the frame number). asDict() summarizes the
+  events per phase name, writeChromeTrace() writes them in the Chrome trace
+  event format (chrome://tracing, https://ui.perfetto.dev).
+
+  Nothing is recorded unless enabled is set, then phase() and count() are
+  cheap no-ops. Phases and counts may be recorded from worker threads.
+  At most maximumEvents events are kept, the phase totals are always updated.
+  """
+
+  def __init__(self, maximumEvents=100000):
+    self.enabled = False
+    self.maximumEvents = maximumEvents
+    self.lock = threading.Lock()
+    self.reset()
+
+  def reset(self):
+    with self.lock:
+      self.startTime = time.perf_counter()
+      self.events = []
+      self.droppedEvents = 0
+      self.phases = {}  # name: [calls, seconds]
+      self.counters = {}
+
+  def phase(self, name, category='examine', **args):
+    """ Context manager that records the wall time of the enclosed code as phase name.
+    """
+    if not self.enabled:
+      return contextlib.nullcontext()
+    return self.recordPhase(name, category, args)
+
+  @contextlib.contextmanager
+  def recordPhase(self, name, category, args):
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.addPhase(name, category, start, time.perf_counter(), args)
+
+  def addPhase(self, name, category, start, end, args=None):
+    """ Record a phase measured with time.perf_counter().
+    """
+    with self.lock:
+      totals = self.phases.setdefault(name, [0, 0.])
+      totals[0] += 1
+      totals[1] += end - start
+      if len(self.events) < self.maximumEvents:
+        self.events.append((name, category, start, end, threading.get_ident(), args))
+      else:
+        self.droppedEvents += 1
+
+  def count(self, name, increment=1):
+    if not self.enabled:
+      return
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + increment
+
+  def countCalls(self, target, methodCounters):
+    """ Return target, or if enabled a proxy of it that counts the calls of some methods.
+    methodCounters maps method names to counter names.
+    """
+    if not self.enabled:
+      return target
+    return CountedCalls(target, self, methodCounters)
+
+  def asDict(self):
+    """ Totals of the phases ({name: {'calls', 'seconds'}}) and the counters.
+    """
+    with self.lock:
+      return {
+        'phases': {name: {'calls': calls, 'seconds': seconds} for name, (calls, seconds) in self.phases.items()},
+        'counters': dict(self.counters),
+        'droppedEvents': self.droppedEvents,
+        }
+
+  def chromeTrace(self):
+    """ The recorded events in the Chrome trace event format (times in microseconds).
+    """
+    pid = os.getpid()
+    with self.lock:
+      traceEvents = [{
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': (start - self.startTime) * 1e6,
+        'dur': (end - start) * 1e6,
+        'pid': pid,
+        'tid': tid,
+        'args': args or {},
+        } for name, category, start, end, tid, args in self.events]
+      if self.counters:
+        traceEvents.append({'name': 'counters', 'ph': 'C', 'ts': (time.perf_counter() - self.startTime) * 1e6,
+          'pid': pid, 'tid': threading.get_ident(), 'args': dict(self.counters)})
+    return {'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}
+
+  def writeChromeTrace(self, fileName):
+    with open(fileName, 'w') as f:
+      json.dump(self.chromeTrace(), f)
+
+
+class CountedCalls:
+  """ Proxy that counts the calls of some methods of the target object in metrics.
+  The counting wrappers are created once per method.
+  """
+
+  def __init__(self, target, metrics, methodCounters):
+    self.target = target
+    self.metrics = metrics
+    self.methodCounters = methodCounters
+    self.countedMethods = {}
+
+  def __getattr__(self, name):
+    countedMethod = self.countedMethods.get(name)
+    if countedMethod is not None:
+      return countedMethod
+    attribute = getattr(self.target, name)
+    counterName = self.methodCounters.get(name)
+    if counterName is None:
+      return attribute
+
+    @functools.wraps(attribute)
+    def countedCall(*args, **kwargs):
+      self.metrics.count(counterName)
+      return attribute(*args, **kwargs)
+    self.countedMethods[name] = countedCall
+    return countedCall
+
+
+def timed(category):
+  """ Decorator of methods that records their wall time in self.metrics,
+  as a phase named after the method.
+  """
+  def decorator(method):
+    @functools.wraps(method)
+    def timedMethod(self, *args, **kwargs):
+      with self.metrics.phase(method.__name__, category):
+        return method(self, *args, **kwargs)
+    return timedMethod
+  return decorator
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+from MultiVolumeImporterLib import NiftiFrames
+from MultiVolumeImporterLib.FrameAssembler import FrameAssembler
+
+#
+# Batch import of 4D NIfTI files in a pool of worker processes. The workers
+# decompress and reorder the voxels of each file into the layout of the
+# multivolume scalars and write them to a scratch file; the main process
+# then maps the scratch file as the scalars of the multivolume image
+# (ScalarStorage.mapScratchFile) and creates the nodes, the voxels are not
+# read again. The workers are a ProcessPool.processPool().
+#
+# This module is imported by the worker processes, so it must not import
+# Slicer, Qt or VTK.
+#
+
+def decompressToScratchFile(fileName, layout, reverseSlices, scratchFileName):
+  """ Write the voxels of a 4D NIfTI file to scratchFileName as multivolume
+  scalars (nVoxels x nFrames, native byte order). Runs in a worker process.
+  """
+  nColumns, nRows, nSlices = layout.dimensions
+  mvImageArray = np.memmap(scratchFileName, dtype=layout.dtype.newbyteorder('='), mode='w+',
+    shape=(nColumns*nRows*nSlices, layout.numberOfFrames))
+  frameAssembler = FrameAssembler(mvImageArray)
+  for frameNumber, frameArray in NiftiFrames.readFrames(fileName, layout, reverseSlices):
+    frameAssembler.addFrame(frameNumber, frameArray)
+  frameAssembler.flush()
+  # not synced to disk, the main process maps the same pages
+  del mvImageArray
+  return scratchFileName
+
+
+def removeScratchFile(scratchFileName):
+  """ Remove a scratch file if it still exists (it is removed already, or pending removal, once it is mapped).
+  """
+  try:
+    os.remove(scratchFileName)
+  except OSError:
+    pass
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+
+class NiftiFrameIndex:
+  """ Sidecar cache for random access to the frames of a gzip-compressed 4D NIfTI file.
+
+  A gzip stream can only be decompressed from its beginning, and Python's
+  zlib cannot resume inflating at an arbitrary bit position, so a seek
+  index into the original stream is not possible. Instead, while the file
+  is decompressed once (e.g. when it is loaded), each frame is compressed
+  again as an independent zlib stream into a sidecar file. The offsets of
+  the frames are stored next to it, so that later any single frame can be
+  decompressed on its own (see NiftiFrames.readFrame, used to load the
+  frames on demand), and the frames of the file can be decompressed in
+  parallel (see NiftiFrames.readFrames).
+
+  The sidecar is a second compressed copy of the voxels (compressed faster,
+  so usually somewhat larger than the NIfTI file itself).
+
+  The sidecar files are named after the path, size and modification time
+  of the NIfTI file, so a modified file is indexed again.
+  """
+
+  VERSION = 1
+
+  def __init__(self, fileName, layout, indexDirectory, compressionLevel=1):
+    self.fileName = os.path.abspath(fileName)
+    self.layout = layout
+    self.compressionLevel = compressionLevel
+    stat = os.stat(self.fileName)
+    self.source = {'path': self.fileName, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    key = hashlib.sha1(json.dumps(self.source, sort_keys=True).encode()).hexdigest()
+    self.indexPath = os.path.join(indexDirectory, key + '.json')
+    self.dataPath = os.path.join(indexDirectory, key + '.frames')
+    self.offsets = None
+
+    # frames added while the index is written
+    self.dataFile = None
+    self.writtenOffsets = None
+
+  def load(self):
+    """ Load the frame offsets, returns False if the file is not indexed (or the index is outdated).
+    """
+    try:
+      with open(self.indexPath) as f:
+        index = json.load(f)
+    except (OSError, ValueError):
+      return False
+    if (index.get('version') != self.VERSION or index.get('source') != self.source
+        or len(index.get('offsets', [])) != self.layout.numberOfFrames + 1
+        or not os.path.exists(self.dataPath)):
+      return False
+    self.offsets = index['offsets']
+    return True
+
+  def isLoaded(self):
+    return self.offsets is not None
+
+  def readFrame(self, frameNumber):
+    """ Decompress a single frame (nSlices x nRows x nColumns, in file order).
+    """
+    nColumns, nRows, nSlices = self.layout.dimensions
+    with open(self.dataPath, 'rb') as f:
+      f.seek(self.offsets[frameNumber])
+      compressed = f.read(self.offsets[frameNumber + 1] - self.offsets[frameNumber])
+    return np.frombuffer(zlib.decompress(compressed), dtype=self.layout.dtype).reshape(nSlices, nRows, nColumns)
+
+  def beginWrite(self):
+    os.makedirs(os.path.dirname(self.dataPath), exist_ok=True)
+    self.dataFile = open(self.dataPath + '.part', 'wb')
+    self.writtenOffsets = [0]
+
+  def addFrame(self, frameArray):
+    """ Append the next frame while the index is written.
+    """
+    compressed = zlib.compress(np.ascontiguousarray(frameArray).tobytes(), self.compressionLevel)
+    self.dataFile.write(compressed)
+    self.writtenOffsets.append(self.writtenOffsets[-1] + len(compressed))
+
+  def endWrite(self, complete=True):
+    """ Finish writing the index. If not all frames were added (complete is False) then it is discarded.
+    """
+    self.dataFile.close()
+    self.dataFile = None
+    if not complete or len(self.writtenOffsets) != self.layout.numberOfFrames + 1:
+      os.remove(self.dataPath + '.part')
+      return
+    os.replace(self.dataPath + '.part', self.dataPath)
+    index = {'version': self.VERSION, 'source': self.source, 'offsets': self.writtenOffsets}
+    with open(self.indexPath + '.part', 'w') as f:
+      json.dump(index, f)
+    os.replace(self.indexPath + '.part', self.indexPath)
+    self.offsets = self.writtenOffsets
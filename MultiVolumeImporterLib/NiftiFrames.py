@@ -0,0 +1,177 @@
+import collections
+import concurrent.futures
+import gzip
+import itertools
+import struct
+
+import numpy as np
+
+#
+# Frame by frame reading of the voxels of 4D NIfTI-1 files, so that a
+# multivolume can be filled without reading the whole file into memory
+# first. Uncompressed files are memory-mapped, gzip-compressed files are
+# decompressed one frame at a time, or from the frames of a NiftiFrameIndex
+# in several threads if the file was indexed before. Single frames can be
+# read from uncompressed and indexed files, to load the frames on demand.
+#
+# The geometry (qform, spacing, units) is still taken from
+# vtkNIFTIImageReader, only the voxels are read here.
+#
+
+# NIfTI datatype codes of the supported scalar types
+DATATYPES = {
+  2: np.uint8,
+  4: np.int16,
+  8: np.int32,
+  16: np.float32,
+  64: np.float64,
+  256: np.int8,
+  512: np.uint16,
+  768: np.uint32,
+  1024: np.int64,
+  1280: np.uint64,
+}
+
+NIFTI1_HEADER_SIZE = 348
+
+NiftiLayout = collections.namedtuple('NiftiLayout', ['dimensions', 'numberOfFrames', 'dtype', 'voxOffset', 'compressed'])
+
+
+def isCompressed(fileName):
+  return fileName.lower().endswith('.gz')
+
+
+def openFile(fileName):
+  return gzip.open(fileName, 'rb') if isCompressed(fileName) else open(fileName, 'rb')
+
+
+def readLayout(fileName):
+  """ Layout of the voxel block of a single-file 4D NIfTI-1 image,
+  None if the file is not one that can be read frame by frame
+  (e.g. NIfTI-2, separate header and image files, vector or RGB voxels).
+  """
+  with openFile(fileName) as f:
+    header = f.read(NIFTI1_HEADER_SIZE)
+  if len(header) < NIFTI1_HEADER_SIZE:
+    return None
+  for byteOrder in '<>':
+    if struct.unpack(byteOrder+'i', header[0:4])[0] == NIFTI1_HEADER_SIZE:
+      break
+  else:
+    return None
+  if header[344:348] != b'n+1\0':
+    return None
+
+  dim = struct.unpack(byteOrder+'8h', header[40:56])
+  datatype = struct.unpack(byteOrder+'h', header[70:72])[0]
+  voxOffset = int(struct.unpack(byteOrder+'f', header[108:112])[0])
+  if dim[0] < 4 or any(d > 1 for d in dim[5:dim[0]+1]) or datatype not in DATATYPES:
+    return None
+  dtype = np.dtype(DATATYPES[datatype]).newbyteorder(byteOrder)
+  return NiftiLayout(dimensions=(dim[1], dim[2], dim[3]), numberOfFrames=dim[4], dtype=dtype,
+    voxOffset=max(voxOffset, NIFTI1_HEADER_SIZE), compressed=isCompressed(fileName))
+
+
+def frameShape(layout):
+  nColumns, nRows, nSlices = layout.dimensions
+  return (nSlices, nRows, nColumns)
+
+
+def memoryMappedVoxels(fileName, layout):
+  return np.memmap(fileName, dtype=layout.dtype, mode='r', offset=layout.voxOffset,
+    shape=(layout.numberOfFrames,)+frameShape(layout))
+
+
+def decompressedFrames(fileName, layout, numberOfFrames=None):
+  """ Decompress the first numberOfFrames frames (all by default) one after the other.
+  The same array is returned for each frame.
+  """
+  if numberOfFrames is None:
+    numberOfFrames = layout.numberOfFrames
+  frameArray = np.empty(frameShape(layout), dtype=layout.dtype)
+  frameBuffer = memoryview(frameArray.reshape(-1).view(np.uint8))
+  with gzip.open(fileName, 'rb') as f:
+    f.seek(layout.voxOffset)
+    for frameNumber in range(numberOfFrames):
+      bytesRead = 0
+      while bytesRead < len(frameBuffer):
+        n = f.readinto(frameBuffer[bytesRead:])
+        if not n:
+          raise OSError(f"Unexpected end of file in frame {frameNumber} of {fileName}")
+        bytesRead += n
+      yield frameNumber, frameArray
+
+
+def indexedFrames(frameIndex, numberOfThreads=1):
+  """ Decompress the frames of a loaded NiftiFrameIndex, each frame on its own,
+  in numberOfThreads threads (zlib releases the GIL while inflating).
+  Frames are yielded in order, at most 2*numberOfThreads frames ahead are decompressed.
+  """
+  frameNumbers = iter(range(frameIndex.layout.numberOfFrames))
+  with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfThreads) as executor:
+    pending = collections.deque((frameNumber, executor.submit(frameIndex.readFrame, frameNumber))
+      for frameNumber in itertools.islice(frameNumbers, 2*numberOfThreads))
+    while pending:
+      frameNumber, future = pending.popleft()
+      frameArray = future.result()
+      for nextFrameNumber in itertools.islice(frameNumbers, 1):
+        pending.append((nextFrameNumber, executor.submit(frameIndex.readFrame, nextFrameNumber)))
+      yield frameNumber, frameArray
+
+
+def readFrame(fileName, layout, frameNumber, frameIndex=None, reverseSlices=False):
+  """ Read a single frame (nSlices x nRows x nColumns) of an uncompressed file,
+  or of a compressed file from its loaded frameIndex (a NiftiFrameIndex).
+  """
+  if not layout.compressed:
+    frameArray = memoryMappedVoxels(fileName, layout)[frameNumber]
+  elif frameIndex and frameIndex.isLoaded():
+    frameArray = frameIndex.readFrame(frameNumber)
+  else:
+    raise ValueError(f"{fileName} is compressed and not indexed, its frames cannot be read one by one")
+  return frameArray[::-1] if reverseSlices else frameArray
+
+
+def writeFrameIndex(fileName, layout, frameIndex):
+  """ Decompress a compressed file once to write its frameIndex, so that its frames can be read with readFrame().
+  """
+  for _ in readFrames(fileName, layout, frameIndex=frameIndex):
+    pass
+
+
+def readFrames(fileName, layout, reverseSlices=False, frameIndex=None, numberOfThreads=1):
+  """ Yield (frameNumber, frameArray) for each frame, frameArray being
+  nSlices x nRows x nColumns. The array may be reused for the next frame,
+  so it must be copied before the next frame is requested.
+
+  If reverseSlices is True then the slices are returned in reverse order
+  (vtkNIFTIImageReader does this for images with negative qfac).
+
+  For compressed files, frameIndex (a NiftiFrameIndex) is used to decompress
+  the frames in numberOfThreads threads if it is loaded, otherwise it is
+  written while the file is decompressed.
+  """
+  if not layout.compressed:
+    voxels = memoryMappedVoxels(fileName, layout)
+    for frameNumber in range(layout.numberOfFrames):
+      frameArray = voxels[frameNumber]
+      yield frameNumber, frameArray[::-1] if reverseSlices else frameArray
+    return
+
+  if frameIndex and frameIndex.isLoaded():
+    for frameNumber, frameArray in indexedFrames(frameIndex, numberOfThreads):
+      yield frameNumber, frameArray[::-1] if reverseSlices else frameArray
+    return
+
+  complete = False
+  if frameIndex:
+    frameIndex.beginWrite()
+  try:
+    for frameNumber, frameArray in decompressedFrames(fileName, layout):
+      if frameIndex:
+        frameIndex.addFrame(frameArray)
+      yield frameNumber, frameArray[::-1] if reverseSlices else frameArray
+    complete = True
+  finally:
+    if frameIndex:
+      frameIndex.endWrite(complete)
@@ -0,0 +1,20 @@
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+
+#
+# Worker processes for the parts of import and examine that do not need
+# Slicer (NIfTI decompression, grouping of DICOM headers). The functions
+# run in the workers must be in modules that do not import Slicer, Qt or VTK.
+#
+
+def processPool(numberOfWorkers):
+  """ Process pool whose workers are started with the Python interpreter
+  of Slicer (not the Slicer application itself).
+  """
+  context = multiprocessing.get_context('spawn')
+  pythonSlicer = os.path.join(os.path.dirname(sys.executable), 'PythonSlicer' + ('.exe' if os.name == 'nt' else ''))
+  if os.path.exists(pythonSlicer):
+    context.set_executable(pythonSlicer)
+  return concurrent.futures.ProcessPoolExecutor(max_workers=numberOfWorkers, mp_context=context)
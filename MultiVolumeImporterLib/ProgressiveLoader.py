@@ -0,0 +1,114 @@
+import logging
+import queue
+import threading
+
+import qt
+import slicer
+
+from MultiVolumeImporterLib.FrameReader import ParallelFrameReader
+
+
+class ProgressiveLoader:
+  """ Reads the remaining frames of a multivolume in the background after its node is shown.
+
+  The frames are read by a ParallelFrameReader running in a background
+  thread. process(frameNumber, image, ijkToRAS) is called in the reading
+  thread (e.g. to copy the voxels into the multivolume image), and its
+  result is handed to frameReady(frameNumber, result) on the main thread,
+  where the scene may be updated. finished(canceled) is called on the main
+  thread when all frames are read or loading was canceled. The read and
+  process times of the frames are recorded in metrics, if given.
+
+  Loading is canceled when the scene is closed.
+  """
+
+  # loaders that are still running, referenced here so that they are not garbage collected
+  instances = set()
+  sceneObserverTag = None
+
+  def __init__(self, name, frameNumbers, frameFileLists, numberOfWorkers=1, imageIOName='GDCM',
+      process=None, frameReady=None, finished=None, metrics=None):
+    self.name = name
+    self.frameNumbers = list(frameNumbers)
+    self.frameFileLists = frameFileLists
+    self.numberOfWorkers = numberOfWorkers
+    self.imageIOName = imageIOName
+    self.process = process
+    self.frameReady = frameReady
+    self.finished = finished
+    self.metrics = metrics
+
+    self.canceled = False
+    self.loadedFrames = 0
+    self.results = queue.Queue()
+    self.thread = None
+
+    self.pollTimer = qt.QTimer()
+    self.pollTimer.setInterval(100)
+    self.pollTimer.connect('timeout()', self.processResults)
+
+  def start(self):
+    ProgressiveLoader.instances.add(self)
+    ProgressiveLoader.observeScene()
+    self.thread = threading.Thread(target=self.readFrames, name=f"ProgressiveLoader {self.name}", daemon=True)
+    self.thread.start()
+    self.pollTimer.start()
+
+  def cancel(self):
+    """ Stop reading frames. Frames that are already read are still handed to frameReady.
+    """
+    self.canceled = True
+
+  @staticmethod
+  def cancelAll(caller=None, event=None):
+    for loader in list(ProgressiveLoader.instances):
+      loader.cancel()
+      loader.thread.join()
+      loader.processResults()
+
+  @staticmethod
+  def observeScene():
+    if ProgressiveLoader.sceneObserverTag is None:
+      ProgressiveLoader.sceneObserverTag = slicer.mrmlScene.AddObserver(
+        slicer.mrmlScene.StartCloseEvent, ProgressiveLoader.cancelAll)
+
+  def readFrames(self):
+    # runs in the background thread
+    try:
+      with ParallelFrameReader(self.numberOfWorkers, self.imageIOName, self.metrics) as frameReader:
+        for frameNumber, result in frameReader.readFrames(self.frameNumbers, self.frameFileLists,
+            self.process, lambda: not self.canceled):
+          self.results.put((frameNumber, result, None))
+    except Exception as e:
+      self.results.put((None, None, e))
+    self.results.put(None)
+
+  def processResults(self):
+    """ Hand the frames read since the last call to frameReady (main thread).
+    """
+    done = False
+    while True:
+      try:
+        item = self.results.get_nowait()
+      except queue.Empty:
+        break
+      if item is None:
+        done = True
+        break
+      frameNumber, result, error = item
+      if error is not None:
+        logging.error(f"Failed to read {self.name}: {str(error)}")
+        self.canceled = True
+        continue
+      self.loadedFrames += 1
+      if self.frameReady:
+        self.frameReady(frameNumber, result)
+
+    if not done:
+      slicer.util.showStatusMessage(f"Loading {self.name}: {self.loadedFrames}/{len(self.frameNumbers)} frames")
+      return
+    self.pollTimer.stop()
+    ProgressiveLoader.instances.discard(self)
+    slicer.util.showStatusMessage(f"Loading {self.name} {'canceled' if self.canceled else 'completed'}", 3000)
+    if self.finished:
+      self.finished(self.canceled)
@@ -0,0 +1,100 @@
+import logging
+import os
+import tempfile
+
+import numpy as np
+import vtk
+import vtk.util.numpy_support
+import slicer
+from slicer.util import settingsValue
+
+#
+# Allocation of the scalars of multivolume images. Images that are larger
+# than a configurable threshold are backed by a memory-mapped scratch file
+# instead of RAM, so that they can exceed the physical memory without the
+# whole system swapping.
+#
+
+def memoryMapThreshold():
+  """ Size in bytes above which scalars are memory-mapped, None if memory mapping is disabled.
+  """
+  thresholdMB = settingsValue('DICOM/MultiVolumeMemoryMapThresholdMB', 8192, converter=int)
+  if thresholdMB <= 0:
+    return None
+  return thresholdMB * 1024 * 1024
+
+
+def scratchDirectory():
+  """ Directory of the memory-mapped scratch files.
+  """
+  return settingsValue('DICOM/MultiVolumeScratchDirectory', '') or slicer.app.temporaryPath
+
+
+def scalarsSize(extent, scalarType, numberOfComponents):
+  """ Size in bytes of the scalars of an image with the given extent.
+  """
+  numberOfPoints = (extent[1]-extent[0]+1)*(extent[3]-extent[2]+1)*(extent[5]-extent[4]+1)
+  itemSize = np.dtype(vtk.util.numpy_support.get_numpy_array_type(scalarType)).itemsize
+  return numberOfPoints * numberOfComponents * itemSize
+
+
+def allocateScalars(imageData, scalarType, numberOfComponents, memoryMapped=None):
+  """ Allocate the scalars of imageData (extent must be set already).
+
+  If memoryMapped is None then the scalars are memory-mapped if their size
+  exceeds memoryMapThreshold(), otherwise they are allocated in RAM.
+  Returns True if the scalars are memory-mapped.
+  """
+  if memoryMapped is None:
+    threshold = memoryMapThreshold()
+    memoryMapped = threshold is not None and scalarsSize(imageData.GetExtent(), scalarType, numberOfComponents) > threshold
+  if memoryMapped:
+    allocateMemoryMappedScalars(imageData, scalarType, numberOfComponents, scratchDirectory())
+  else:
+    imageData.AllocateScalars(scalarType, numberOfComponents)
+  return memoryMapped
+
+
+def allocateMemoryMappedScalars(imageData, scalarType, numberOfComponents, directory):
+  """ Back the scalars of imageData with an anonymous scratch file in directory.
+
+  The file is removed by the operating system when the mapping is released,
+  i.e. when the scalars array is deleted.
+  """
+  dtype = vtk.util.numpy_support.get_numpy_array_type(scalarType)
+  numberOfPoints = imageData.GetNumberOfPoints()
+  size = scalarsSize(imageData.GetExtent(), scalarType, numberOfComponents)
+  logging.info(f"Memory-mapping {size/1024/1024:.0f} MB of image scalars in {directory}")
+
+  with tempfile.TemporaryFile(dir=directory, prefix='MultiVolume-') as scratchFile:
+    # the mapping keeps its own handle of the file
+    array = np.memmap(scratchFile, dtype=dtype, mode='w+', shape=(numberOfPoints, numberOfComponents))
+
+  # the VTK array keeps a reference to the memory map
+  scalars = vtk.util.numpy_support.numpy_to_vtk(array, deep=False, array_type=scalarType)
+  imageData.GetPointData().SetScalars(scalars)
+
+
+def mapScratchFile(imageData, scalarType, numberOfComponents, fileName):
+  """ Use a scratch file that already holds the scalars of imageData (extent must
+  be set), e.g. written by a worker process, as memory-mapped scalars. The file
+  is not read, its pages are shared with the process that wrote it.
+
+  The file is removed when the mapping is released: it is opened as a temporary
+  file on Windows, elsewhere it is removed right away (the mapping keeps the data).
+  """
+  dtype = vtk.util.numpy_support.get_numpy_array_type(scalarType)
+  numberOfPoints = imageData.GetNumberOfPoints()
+  if os.path.getsize(fileName) != scalarsSize(imageData.GetExtent(), scalarType, numberOfComponents):
+    raise OSError(f"Unexpected size of {fileName}")
+
+  fd = os.open(fileName, os.O_RDWR | getattr(os, 'O_BINARY', 0) | getattr(os, 'O_TEMPORARY', 0))
+  with os.fdopen(fd, 'r+b') as scratchFile:
+    # the mapping keeps its own handle of the file
+    array = np.memmap(scratchFile, dtype=dtype, mode='r+', shape=(numberOfPoints, numberOfComponents))
+  if not hasattr(os, 'O_TEMPORARY'):
+    os.remove(fileName)
+
+  # the VTK array keeps a reference to the memory map
+  scalars = vtk.util.numpy_support.numpy_to_vtk(array, deep=False, array_type=scalarType)
+  imageData.GetPointData().SetScalars(scalars)
@@ -0,0 +1,203 @@
+import re
+
+import numpy as np
+
+#
+# Conversion of whole columns of DICOM header strings (e.g. the distinct
+# values of a HeaderTable column) into float64 arrays. Every parser takes
+# a sequence of strings and returns the values and a boolean validity mask;
+# values that cannot be parsed are NaN and not valid.
+#
+# The common well-formed values are converted with NumPy string operations,
+# only the values that do not fit the fast path are parsed one at a time
+# (with the same rules as float(), int() and tm2ms()).
+#
+
+CARDIAC_CYCLE_PATTERN = re.compile(r"TP(\d+)PC(\d+)")
+
+
+def tm2ms(tm):
+  """ Convert a single DICOM TM value (HHMMSS.FFFFFF) to milliseconds.
+  """
+  if len(tm)<6:
+    return 0
+
+  try:
+    hhmmss = tm.split('.')[0]
+  except:
+    hhmmss = tm
+
+  try:
+    ssfrac = float('0.'+tm.split('.')[1])
+  except:
+    ssfrac = 0.
+
+  if len(hhmmss)==6: # HHMMSS
+    sec = float(hhmmss[0:2])*60.*60.+float(hhmmss[2:4])*60.+float(hhmmss[4:6])
+  elif len(hhmmss)==4: # HHMM
+    sec = float(hhmmss[0:2])*60.*60.+float(hhmmss[2:4])*60.
+  elif len(hhmmss)==2: # HH
+    sec = float(hhmmss[0:2])*60.*60.
+  else:
+    raise OSError("Invalid DICOM time string: "+tm+" (failed to parse HHMMSS)")
+
+  sec = sec+ssfrac
+
+  return sec*1000.
+
+
+def stringArray(strings):
+  return np.asarray(list(strings), dtype=str).reshape(-1)
+
+
+def parseEach(strings, parse, values, valid, rows):
+  """ Parse the given rows one at a time with parse(string), which returns None
+  or raises ValueError if the string cannot be parsed.
+  """
+  for row in rows:
+    try:
+      value = parse(strings[row])
+    except (ValueError, OverflowError):
+      value = None
+    if value is not None:
+      values[row] = value
+      valid[row] = True
+
+
+def parseDecimals(strings):
+  """ DS or single-valued IS strings (float() of the whole string).
+  """
+  strings = stringArray(strings)
+  try:
+    return strings.astype(np.float64), np.ones(len(strings), dtype=bool)
+  except ValueError:
+    pass
+  values = np.full(len(strings), np.nan)
+  valid = np.zeros(len(strings), dtype=bool)
+  parseEach(strings, float, values, valid, range(len(strings)))
+  return values, valid
+
+
+def parseIntegers(strings):
+  """ IS strings (int() of the whole string), as float64.
+  """
+  strings = stringArray(strings)
+  try:
+    return strings.astype(np.int64).astype(np.float64), np.ones(len(strings), dtype=bool)
+  except (ValueError, OverflowError):
+    pass
+  values = np.full(len(strings), np.nan)
+  valid = np.zeros(len(strings), dtype=bool)
+  parseEach(strings, lambda s: float(int(s)), values, valid, range(len(strings)))
+  return values, valid
+
+
+def parseMultiValued(strings, size):
+  """ Multi-valued DS or IS strings with size values separated by backslashes
+  (e.g. ImagePositionPatient), as an N x size array.
+  """
+  strings = stringArray(strings)
+  values = np.full((len(strings), size), np.nan)
+  valid = np.zeros(len(strings), dtype=bool)
+  candidates = np.flatnonzero((np.char.count(strings, '\\') == size - 1) & (np.char.str_len(strings) > 0))
+  if len(candidates):
+    try:
+      values[candidates] = np.array('\\'.join(strings[candidates]).split('\\')).astype(np.float64).reshape(-1, size)
+      valid[candidates] = True
+      return values, valid
+    except ValueError:
+      pass
+  for row in candidates:
+    try:
+      values[row] = [float(v) for v in strings[row].split('\\')]
+      valid[row] = True
+    except ValueError:
+      pass
+  return values, valid
+
+
+def parseTM(strings):
+  """ DICOM TM strings (HHMMSS.FFFFFF, HHMM or HH) in milliseconds.
+  Strings shorter than 6 characters are 0, like in tm2ms().
+  """
+  strings = stringArray(strings)
+  n = len(strings)
+  values = np.zeros(n)
+  valid = np.ones(n, dtype=bool)
+  if n == 0:
+    return values, valid
+
+  short = np.char.str_len(strings) < 6
+  parts = np.char.partition(strings, '.')
+  hhmmss = parts[:, 0]
+  fraction = np.char.partition(parts[:, 2], '.')[:, 0]
+
+  # digits of HHMMSS (HHMM, HH are padded with zeros)
+  hhmmssLength = np.char.str_len(hhmmss)
+  codePoints = np.char.ljust(hhmmss, 6, '0').astype('U6').view(np.uint32).reshape(n, 6)
+  digits = codePoints.astype(np.int64) - ord('0')
+  fast = (~short & np.isin(hhmmssLength, [2, 4, 6]) & np.all((digits >= 0) & (digits <= 9), axis=1)
+    & (np.char.isdigit(fraction) | (np.char.str_len(fraction) == 0)))
+
+  hours = (digits[:, 0] * 10 + digits[:, 1]).astype(np.float64)
+  minutes = (digits[:, 2] * 10 + digits[:, 3]).astype(np.float64)
+  seconds = (digits[:, 4] * 10 + digits[:, 5]).astype(np.float64)
+  fractionValues = np.zeros(n)
+  withFraction = fast & (np.char.str_len(fraction) > 0)
+  if withFraction.any():
+    fractionValues[withFraction] = np.char.add('0.', fraction[withFraction]).astype(np.float64)
+  sec = hours*60.*60.+minutes*60.+seconds
+  values[fast] = ((sec+fractionValues)*1000.)[fast]
+
+  slow = np.flatnonzero(~short & ~fast)
+  values[slow] = np.nan
+  valid[slow] = False
+
+  def parse(tm):
+    try:
+      return tm2ms(tm)
+    except OSError:
+      return None
+  parseEach(strings, parse, values, valid, slow)
+  return values, valid
+
+
+def parseGEBValue(strings):
+  """ GE B-value (0043,1039), e.g. 1000001250\\8\\0\\0: the first value modulo 100000.
+  """
+  strings = stringArray(strings)
+  firstValues = np.char.partition(strings, '\\')[:, 0]
+  values, valid = parseIntegers(firstValues)
+  values[valid] = np.mod(values[valid].astype(np.int64), 100000)
+  return values, valid
+
+
+def parseCardiacCycle(strings):
+  """ Siemens ScanOptions (0018,0022) with the cardiac phase, e.g. TP10PC0965\\PULSTART_P0020PC...:
+  the percentage after TP in the first value. The pattern is matched once per string.
+  """
+  strings = stringArray(strings)
+  firstValues = np.char.partition(strings, '\\')[:, 0]
+  values = np.full(len(strings), np.nan)
+  valid = np.zeros(len(strings), dtype=bool)
+  # most strings do not contain the pattern at all
+  candidates = np.flatnonzero(np.char.find(firstValues, 'TP') >= 0)
+
+  def parse(cardiacPhaseInfo):
+    matched = CARDIAC_CYCLE_PATTERN.search(cardiacPhaseInfo)
+    return float(matched.groups()[0]) if matched else None
+  parseEach(firstValues, parse, values, valid, candidates)
+  return values, valid
+
+
+def frameTagParser(frameTag):
+  """ The column parser of a frame identifying tag: times are converted to ms,
+  vendor specific tags are decoded and all other tags are parsed as decimal numbers.
+  """
+  if frameTag in ('AcquisitionTime', 'SeriesTime', 'ContentTime'):
+    return parseTM
+  elif frameTag == 'GE.B-value':
+    return parseGEBValue
+  elif frameTag == 'CardiacCycle':
+    return parseCardiacCycle
+  return parseDecimals
@@ -1,11 +1,27 @@
+import concurrent.futures
 import os
-import re
 import vtk, qt, ctk, slicer
 import DICOMLib
 from DICOMLib import DICOMPlugin
 from DICOMLib import DICOMLoadable
 import logging
+import numpy as np
 from slicer.util import settingsValue, toBool
+from MultiVolumeImporterLib import FrameGrouping
+from MultiVolumeImporterLib import MemoryAdmission
+from MultiVolumeImporterLib.Metrics import Metrics, timed
+from MultiVolumeImporterLib import ProcessPool
+from MultiVolumeImporterLib import ScalarStorage
+from MultiVolumeImporterLib import ValueParsing
+from MultiVolumeImporterLib.HeaderTable import HeaderTable
+from MultiVolumeImporterLib.ExamineCache import ExamineCache
+from MultiVolumeImporterLib.FrameGeometryCache import FrameGeometry, FrameGeometryCache
+from MultiVolumeImporterLib.FrameIndex import FrameIndex
+from MultiVolumeImporterLib.IncrementalExamine import ExamineState, IncrementalExamine, PositionPartition, TagPartition
+from MultiVolumeImporterLib.FrameReader import FrameReader, ParallelFrameReader
+from MultiVolumeImporterLib.FrameAssembler import FrameAssembler
+from MultiVolumeImporterLib.LazyVolumeSequence import DicomFrameSource, LazyVolumeSequence
+from MultiVolumeImporterLib.ProgressiveLoader import ProgressiveLoader
 
 #
 # This is the plugin to handle translation of DICOM objects
@@ -18,6 +34,19 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
   """ MV specific interpretation code
   """
 
+  # examine states kept for incremental examine (plugin instances are not reused between examine calls)
+  incrementalExamine = IncrementalExamine()
+  # worker processes for grouping the files of several series concurrently (kept between examine calls)
+  examinePool = None
+  examinePoolSize = 0
+  # below this number of instances the series are grouped in this process,
+  # where it takes less time than starting the workers
+  minimumWorkerInstances = 20000
+  # timing and call counts of examine and load, see MultiVolumeImporterLib.Metrics
+  metrics = Metrics()
+  # frame identifying tags considered when files of several series are examined together
+  multiseriesFrameTags = ['SeriesTime','AcquisitionTime','FlipAngle','CardiacCycle']
+
   def __init__(self,epsilon=0.01):
     super().__init__()
     self.loadType = "MultiVolume"
@@ -32,6 +61,12 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     self.tags['instanceNumber'] = "0020,0013"
     self.tags['repetitionTime'] = "0018,0080"
     self.tags['modality'] = "0008,0060"
+    self.tags['pixelSpacing'] = "0028,0030"
+    self.tags['rows'] = "0028,0010"
+    self.tags['columns'] = "0028,0011"
+    self.tags['bitsAllocated'] = "0028,0100"
+    self.tags['rescaleSlope'] = "0028,1053"
+    self.tags['rescaleIntercept'] = "0028,1052"
 
     # tags used to identify multivolumes
     self.multiVolumeTags = {}
@@ -80,6 +115,21 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     self.detailedLogging = False
 
+    # header values of all files of the current examine() call
+    self.headerTable = None
+    # scalar volume examine results of the frames of the current examine() call
+    self.frameGeometryCache = None
+    # frame indices of the multivolume nodes created by initMultiVolumes()
+    self.frameIndices = {}
+    # frame groups computed by worker processes in the current examine() call
+    self.frameGroups = {}
+    # header table, frame geometries and partitions kept from the previous examine() (incremental mode)
+    self.examineState = None
+    # (strategy name, number of files, reason) of the strategies skipped by the current examine() call
+    self.skippedStrategies = []
+
+    self.metrics.enabled = settingsValue('DICOM/MultiVolumeMetrics', False, converter=toBool)
+
   @staticmethod
   def settingsPanelEntry(panel, parent):
     """Create a settings panel entry for this plugin class.
@@ -99,6 +149,99 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       "DICOM/PreferredMultiVolumeImportFormat", importFormatsComboBox,
       "currentUserDataAsString", str(qt.SIGNAL("currentIndexChanged(int)")))
 
+    loadThreadsSpinBox = qt.QSpinBox()
+    loadThreadsSpinBox.toolTip = "Number of multi-volume frames read in parallel. If set to 1 then frames are read one after the other."
+    loadThreadsSpinBox.minimum = 1
+    loadThreadsSpinBox.maximum = 64
+    loadThreadsSpinBox.value = 1
+    formLayout.addRow("Multi-volume loading threads:", loadThreadsSpinBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeLoadThreads", loadThreadsSpinBox,
+      "value", str(qt.SIGNAL("valueChanged(int)")))
+
+    memoryMapThresholdSpinBox = qt.QSpinBox()
+    memoryMapThresholdSpinBox.toolTip = ("Multi-volumes larger than this size are stored in a memory-mapped scratch file"
+      " instead of RAM. If set to 0 then multi-volumes are always stored in RAM.")
+    memoryMapThresholdSpinBox.suffix = " MB"
+    memoryMapThresholdSpinBox.minimum = 0
+    memoryMapThresholdSpinBox.maximum = 1024 * 1024
+    memoryMapThresholdSpinBox.value = 8192
+    formLayout.addRow("Multi-volume memory mapping threshold:", memoryMapThresholdSpinBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeMemoryMapThresholdMB", memoryMapThresholdSpinBox,
+      "value", str(qt.SIGNAL("valueChanged(int)")))
+
+    scratchDirectoryButton = ctk.ctkDirectoryButton()
+    scratchDirectoryButton.toolTip = "Directory of the scratch files of memory-mapped multi-volumes. Slicer's temporary directory is used if not set."
+    formLayout.addRow("Multi-volume scratch directory:", scratchDirectoryButton)
+    panel.registerProperty(
+      "DICOM/MultiVolumeScratchDirectory", scratchDirectoryButton,
+      "directory", str(qt.SIGNAL("directoryChanged(QString)")))
+
+    lazySequenceCheckBox = qt.QCheckBox()
+    lazySequenceCheckBox.toolTip = ("Only read the frames of volume sequences when they are displayed."
+      " Loading is fast and uses little memory, but stepping to a frame that was not shown before takes longer."
+      " All frames are read when the scene is saved.")
+    formLayout.addRow("Load volume sequence frames on demand:", lazySequenceCheckBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeLazySequence", lazySequenceCheckBox,
+      "checked", str(qt.SIGNAL("toggled(bool)")))
+
+    incrementalExamineCheckBox = qt.QCheckBox()
+    incrementalExamineCheckBox.toolTip = ("Keep the results of parsing a series and only parse the new files"
+      " when the series is examined again, e.g. while its images are still being received.")
+    formLayout.addRow("Incremental multi-volume examine:", incrementalExamineCheckBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeIncrementalExamine", incrementalExamineCheckBox,
+      "checked", str(qt.SIGNAL("toggled(bool)")))
+
+    examineProcessesSpinBox = qt.QSpinBox()
+    examineProcessesSpinBox.toolTip = ("Number of worker processes that group the files of the series into multi-volume frames"
+      " when several series with many instances in total are examined together."
+      " If set to 1 then the series are examined one after the other.")
+    examineProcessesSpinBox.minimum = 1
+    examineProcessesSpinBox.maximum = 64
+    examineProcessesSpinBox.value = 4
+    formLayout.addRow("Multi-volume examine processes:", examineProcessesSpinBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeExamineProcesses", examineProcessesSpinBox,
+      "value", str(qt.SIGNAL("valueChanged(int)")))
+
+    examineCacheCheckBox = qt.QCheckBox()
+    examineCacheCheckBox.toolTip = ("Store the multi-volumes found in a series on disk,"
+      " so that they are not parsed again when the series is examined next time.")
+    examineCacheCheckBox.checked = True
+    formLayout.addRow("Cache multi-volume examine results:", examineCacheCheckBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeExamineCache", examineCacheCheckBox,
+      "checked", str(qt.SIGNAL("toggled(bool)")))
+
+    progressiveLoadCheckBox = qt.QCheckBox()
+    progressiveLoadCheckBox.toolTip = ("Show multi-volumes as soon as their first frame is read"
+      " and read the remaining frames in the background.")
+    formLayout.addRow("Load multi-volumes progressively:", progressiveLoadCheckBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeProgressiveLoad", progressiveLoadCheckBox,
+      "checked", str(qt.SIGNAL("toggled(bool)")))
+
+    metricsCheckBox = qt.QCheckBox()
+    metricsCheckBox.toolTip = ("Record the time spent in each examine strategy and in reading, copying"
+      " and adding the frames to the scene when loading. The results of the last examine or load"
+      " are available from MultiVolumeImporterPluginClass.metrics.asDict().")
+    formLayout.addRow("Record multi-volume metrics:", metricsCheckBox)
+    panel.registerProperty(
+      "DICOM/MultiVolumeMetrics", metricsCheckBox,
+      "checked", str(qt.SIGNAL("toggled(bool)")))
+
+    metricsTracePathLineEdit = ctk.ctkPathLineEdit()
+    metricsTracePathLineEdit.filters = ctk.ctkPathLineEdit.Files | ctk.ctkPathLineEdit.Writable
+    metricsTracePathLineEdit.toolTip = ("If set, the recorded metrics are written to this file"
+      " in Chrome trace format after each examine and load (can be opened in chrome://tracing).")
+    formLayout.addRow("Multi-volume metrics trace file:", metricsTracePathLineEdit)
+    panel.registerProperty(
+      "DICOM/MultiVolumeMetricsTraceFile", metricsTracePathLineEdit,
+      "currentPath", str(qt.SIGNAL("currentPathChanged(QString)")))
+
   def examine(self,fileLists):
     """ Returns a list of DICOMLoadable instances
     corresponding to ways of interpreting the
@@ -110,23 +253,31 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     self.detailedLogging = settingsValue('DICOM/detailedLogging', False, converter=toBool)
     timer = vtk.vtkTimerLog()
     timer.StartTimer()
-
-    loadables = []
-    allfiles = []
-    for files in fileLists:
-      loadables += self.examineFiles(files)
-      loadables += self.examineFilesIPPAcqTime(files)
-      loadables += self.examineFilesIPPInstanceNumber(files)
-      allfiles += files
-
-    # Here all files are lumped into one list for the situations when
-    # individual frames should be parsed from series.
-    # Only examine again if there are multiple file groups and no loadables were found
-    # when tried loading each series separately.
-    if (not loadables) and len(allfiles)>len(files):
-      loadables += self.examineFilesMultiseries(allfiles)
-      loadables += self.examineFilesIPPAcqTime(allfiles)
-      loadables += self.examineFilesIPPInstanceNumber(allfiles)
+    # each examine and load is recorded separately
+    self.metrics.reset()
+
+    self.headerTable = None
+    self.frameGeometryCache = None
+    self.frameIndices = {}
+    self.frameGroups = {}
+    self.skippedStrategies = []
+
+    allfiles = [f for files in fileLists for f in files]
+
+    # reuse the results of a previous examine() of the same files
+    with self.metrics.phase('examineCache'):
+      examineCache, examineCacheKey = self.examineCacheEntry(fileLists)
+      cachedLoadables = examineCache.get(examineCacheKey) if examineCache else None
+    if cachedLoadables is not None:
+      loadables = [self.loadableFromCache(cachedLoadable) for cachedLoadable in cachedLoadables]
+    else:
+      loadables = self.examineStrategies(fileLists, allfiles)
+      if examineCache:
+        try:
+          with self.metrics.phase('examineCache'):
+            examineCache.put(examineCacheKey, [self.loadableCacheEntry(loadable) for loadable in loadables])
+        except OSError as e:
+          logging.warning(f"MultiVolumeImporterPlugin: failed to store examine results: {str(e)}")
 
     # If Sequences module is available then duplicate all the loadables
     # for loading them as volume sequence.
@@ -142,6 +293,9 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
         seqLoadable.tooltip = loadable.tooltip.replace(' frames MultiVolume', ' frames Volume Sequence')
         seqLoadable.name = loadable.name.replace(' frames MultiVolume', ' frames Volume Sequence')
         seqLoadable.multivolume = loadable.multivolume
+        seqLoadable.frameIndex = loadable.frameIndex
+        seqLoadable.frameGeometryCache = loadable.frameGeometryCache
+        seqLoadable.estimatedSize = loadable.estimatedSize
         seqLoadable.selected = loadable.selected
 
         seqLoadable.confidence = loadable.confidence
@@ -161,24 +315,363 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
        # append
        loadables += seqLoadables
 
+    self.headerTable = None
+    self.frameGeometryCache = None
+    self.frameIndices = {}
+    self.frameGroups = {}
+    self.examineState = None
+
     timer.StopTimer()
     if self.detailedLogging:
       logging.debug(f"MultiVolumeImporterPlugin: found {len(loadables)} loadables in {len(allfiles)} files in {timer.GetElapsedTime():.1f}sec.")
+    self.writeMetricsTrace()
+
+    return loadables
+
+  def examineStrategies(self, fileLists, allfiles):
+    """ Run the examine strategies and return the multivolume loadables found.
+    """
+    if settingsValue('DICOM/MultiVolumeIncrementalExamine', False, converter=toBool):
+      # continue from the previous examine() of a subset of the files, if any
+      self.examineState = self.incrementalExamine.findState(allfiles)
+      with self.metrics.phase('headerTable'):
+        if self.examineState:
+          self.examineState.headerTable.addFiles(allfiles, self.database())
+        else:
+          self.examineState = ExamineState(HeaderTable(allfiles, self.tags, self.database()), self.getFrameGeometryCache())
+          self.incrementalExamine.addState(self.examineState)
+      self.headerTable = self.examineState.headerTable
+      self.frameGeometryCache = self.examineState.frameGeometryCache
+    else:
+      # read all the headers needed by the strategies in one pass
+      with self.metrics.phase('headerTable'):
+        self.headerTable = HeaderTable(allfiles, self.tags, self.database())
+
+    # skip the strategies that cannot find a multivolume in a series (e.g. a single volume)
+    seriesStrategies = [self.examineFiles, self.examineFilesIPPAcqTime, self.examineFilesIPPInstanceNumber]
+    seriesSkipReasons = [self.strategySkipReasons(files, list(self.multiVolumeTags.keys())) for files in fileLists]
+
+    if self.examineState is None:
+      # only the series where any strategy may apply are grouped in the workers
+      groupedFileLists = [files for files, skipReasons in zip(fileLists, seriesSkipReasons)
+        if len(skipReasons) < len(seriesStrategies)]
+      examineProcesses = settingsValue('DICOM/MultiVolumeExamineProcesses', 4, converter=int)
+      if (examineProcesses > 1 and len(groupedFileLists) > 1
+          and sum(len(files) for files in groupedFileLists) >= self.minimumWorkerInstances):
+        with self.metrics.phase('groupSeriesInWorkers'):
+          self.groupSeriesInWorkers(groupedFileLists, examineProcesses)
+
+    loadables = []
+    for files, skipReasons in zip(fileLists, seriesSkipReasons):
+      loadables += self.examineApplicable(seriesStrategies, files, skipReasons)
+
+    # Here all files are lumped into one list for the situations when
+    # individual frames should be parsed from series.
+    # Only examine again if there are multiple file groups and no loadables were found
+    # when tried loading each series separately.
+    if (not loadables) and len(allfiles)>len(files):
+      loadables += self.examineApplicable([self.examineFilesMultiseries, self.examineFilesIPPAcqTime, self.examineFilesIPPInstanceNumber],
+        allfiles, self.strategySkipReasons(allfiles, self.multiseriesFrameTags))
+
+    for loadable in loadables:
+      self.setEstimatedSize(loadable)
 
     return loadables
 
+  def strategySkipReasons(self, files, frameTags):
+    """ Strategies that cannot find a multivolume in the files, see FrameGrouping.strategySkipReasons.
+    """
+    with self.metrics.phase('strategySkipReasons'):
+      return FrameGrouping.strategySkipReasons(files, self.getHeaderTable(files), frameTags)
+
+  def examineApplicable(self, strategies, files, skipReasons):
+    """ Run the strategies that are not skipped (skipReasons maps strategy names
+    to the reason why they cannot apply) and record the skipped ones.
+    """
+    loadables = []
+    for strategy in strategies:
+      reason = skipReasons.get(strategy.__name__)
+      if reason is None:
+        loadables += self.examineWith(strategy, files)
+        continue
+      self.skippedStrategies.append((strategy.__name__, len(files), reason))
+      self.metrics.count(f'{strategy.__name__} skipped')
+      if self.detailedLogging:
+        logging.debug(f"MultiVolumeImporterPlugin: {strategy.__name__} skipped for {len(files)} files: {reason}")
+    return loadables
+
+  @staticmethod
+  def examineWith(strategy, files):
+    """ Run one examine strategy and record its name in the loadables.
+    """
+    with MultiVolumeImporterPluginClass.metrics.phase(strategy.__name__, files=len(files)):
+      loadables = strategy(files)
+    for loadable in loadables:
+      loadable.strategy = strategy.__name__
+    return loadables
+
+  def groupSeriesInWorkers(self, fileLists, numberOfProcesses):
+    """ Group the files of each series in worker processes (FrameGrouping.groupSeries),
+    so that the strategies only need to check the frames and create the loadables.
+    Series that fail in a worker are grouped by the strategies as usual.
+    The pool is kept until the number of processes of the settings changes,
+    the pool breaks or the application quits.
+    """
+    cls = MultiVolumeImporterPluginClass
+    if cls.examinePoolSize != numberOfProcesses:
+      cls.shutdownExaminePool()
+    if cls.examinePool is None:
+      cls.examinePool = ProcessPool.processPool(numberOfProcesses)
+      cls.examinePoolSize = numberOfProcesses
+      slicer.app.aboutToQuit.connect(cls.shutdownExaminePool)
+
+    consideredTags = list(self.multiVolumeTags.keys())
+    futures = [cls.examinePool.submit(FrameGrouping.groupSeries, files, self.headerTable.select(files), consideredTags, self.epsilon)
+      for files in fileLists if files]
+    for future in futures:
+      try:
+        seriesGroups = future.result()
+      except Exception as e:
+        logging.warning(f"MultiVolumeImporterPlugin: failed to group series in worker process: {str(e)}")
+        if isinstance(e, concurrent.futures.process.BrokenProcessPool):
+          cls.shutdownExaminePool()
+        continue
+      for subseriesFiles, groups, rejections in seriesGroups.subseries:
+        self.frameGroups[('tags', tuple(consideredTags), tuple(subseriesFiles))] = (groups, rejections)
+      filesKey = tuple(seriesGroups.files)
+      self.frameGroups[('position', 'AcquisitionTime', filesKey)] = seriesGroups.acquisitionTimeFrames
+      self.frameGroups[('position', 'instanceNumber', filesKey)] = seriesGroups.instanceNumberFrames
+
+  @classmethod
+  def shutdownExaminePool(cls):
+    """ Stop the worker processes of groupSeriesInWorkers, they are started again when needed.
+    """
+    if cls.examinePool is None:
+      return
+    slicer.app.aboutToQuit.disconnect(cls.shutdownExaminePool)
+    cls.examinePool.shutdown(wait=False, cancel_futures=True)
+    cls.examinePool = None
+    cls.examinePoolSize = 0
+
+  def frameTagGroups(self, files, consideredTags):
+    """ Frames of the files by each of the considered tags and the reasons why
+    tags were rejected (see FrameGrouping.tagGroups).
+    """
+    key = ('tags', tuple(consideredTags), tuple(files))
+    if key in self.frameGroups:
+      return self.frameGroups[key]
+    headerTable = self.getHeaderTable(files)
+    partition = self.examinePartition(('initMultiVolumes', tuple(consideredTags)), files,
+      lambda: TagPartition(consideredTags))
+    FrameGrouping.tagPartition(files, headerTable, consideredTags, partition)
+    return FrameGrouping.tagGroups(files, headerTable, partition, self.epsilon)
+
+  def positionFrames(self, files, timeTag, strategyName):
+    """ Frame file lists of the IPP strategies (see FrameGrouping.positionFrameFileLists), None if the files do not form frames.
+    """
+    key = ('position', timeTag, tuple(files))
+    if key in self.frameGroups:
+      return self.frameGroups[key]
+    headerTable = self.getHeaderTable(files)
+    partition = self.examinePartition(strategyName, files, PositionPartition)
+    FrameGrouping.positionPartition(files, headerTable, timeTag, partition)
+    return FrameGrouping.positionFrameFileLists(partition)
+
+  def examineCacheEntry(self, fileLists):
+    """ Return the examine cache and the key of the given files,
+    (None, None) if the cache is disabled or the files cannot be fingerprinted.
+    Only the DICOM database index is used, no headers are read.
+    """
+    if not settingsValue('DICOM/MultiVolumeExamineCache', True, converter=toBool):
+      return None, None
+    db = slicer.dicomDatabase
+    allfiles = [f for files in fileLists for f in files]
+    instanceUIDs = {f: db.instanceForFile(f) for f in allfiles}
+    fingerprint = ExamineCache.fingerprint(fileLists, instanceUIDs)
+    if fingerprint is None:
+      return None, None
+    parameters = self.examineCacheParameters()
+    if parameters is None:
+      return None, None
+    seriesInstanceUIDs = [db.seriesForFile(files[0]) for files in fileLists if files]
+    examineCache = ExamineCache(os.path.join(slicer.app.cachePath, 'MultiVolumeImporter', 'ExamineCache'))
+    return examineCache, ExamineCache.key(seriesInstanceUIDs, fingerprint, parameters)
+
+  def examineCacheParameters(self):
+    """ Everything besides the files that the examine results depend on: the source
+    code of the plugin and its library, the frame identifying tags, epsilon and the
+    scalar volume settings that affect the frame geometry. None if the source cannot be read.
+    """
+    libraryDirectory = os.path.dirname(FrameGrouping.__file__)
+    sourcePaths = [os.path.abspath(__file__)] + sorted(os.path.join(libraryDirectory, name)
+      for name in os.listdir(libraryDirectory) if name.endswith('.py'))
+    sourceDigest = ExamineCache.sourceDigest(sourcePaths)
+    if sourceDigest is None:
+      return None
+    return {
+      'source': sourceDigest,
+      'epsilon': self.epsilon,
+      'multiVolumeTags': self.multiVolumeTags,
+      'multiseriesFrameTags': self.multiseriesFrameTags,
+      'acquisitionGeometryRegularization': settingsValue('DICOM/ScalarVolume/AcquisitionGeometryRegularization', ''),
+      }
+
+  def loadableCacheEntry(self, loadable):
+    """ JSON-serializable description of a multivolume loadable, for the examine cache.
+    """
+    mvNode = loadable.multivolume
+    frameIndex = loadable.frameIndex
+    pathIds = {path: pathId for pathId, path in enumerate(frameIndex.paths)}
+    frameGeometries = None
+    if loadable.frameGeometryCache:
+      frameGeometries = []
+      for frameNumber in range(frameIndex.numberOfFrames()):
+        frameGeometry = loadable.frameGeometryCache.cachedFrameGeometry(frameIndex.frameFiles(frameNumber))
+        if frameGeometry is None:
+          frameGeometries = None
+          break
+        frameGeometries.append([[pathIds[f] for f in frameGeometry.files], frameGeometry.warning or ''])
+    attributes = {name: mvNode.GetAttribute(name) for name in mvNode.GetAttributeNames()
+      if name != 'MultiVolume.FrameFileList'}
+    return {
+      'strategy': loadable.strategy,
+      'name': loadable.name,
+      'tooltip': loadable.tooltip,
+      'selected': bool(loadable.selected),
+      'confidence': loadable.confidence,
+      'estimatedSize': loadable.estimatedSize,
+      'files': loadable.files,
+      'paths': frameIndex.paths,
+      'order': frameIndex.order.tolist(),
+      'offsets': frameIndex.offsets.tolist(),
+      'labels': frameIndex.labels.tolist(),
+      'frameGeometries': frameGeometries,
+      'nodeName': mvNode.GetName(),
+      'labelName': mvNode.GetLabelName(),
+      'attributes': attributes,
+      }
+
+  def loadableFromCache(self, entry):
+    """ Rebuild a multivolume loadable from its examine cache description.
+    """
+    paths = entry['paths']
+    order = entry['order']
+    offsets = entry['offsets']
+    frameIndex = FrameIndex([[paths[pathId] for pathId in order[offsets[i]:offsets[i+1]]] for i in range(len(offsets)-1)],
+      entry['labels'])
+
+    frameGeometryCache = self.getFrameGeometryCache()
+    if entry['frameGeometries'] is not None:
+      for frameFiles, warning in entry['frameGeometries']:
+        frameGeometryCache.addFrameGeometry(FrameGeometry.fromFiles([paths[pathId] for pathId in frameFiles], warning))
+
+    mvNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLMultiVolumeNode')
+    mvNode.UnRegister(None)
+    mvNode.SetScene(slicer.mrmlScene)
+    for name, value in entry['attributes'].items():
+      mvNode.SetAttribute(name, value)
+    mvNode.SetAttribute('MultiVolume.FrameFileList', frameIndex.fileListAttribute())
+    mvNode.SetNumberOfFrames(frameIndex.numberOfFrames())
+    if entry['labelName']:
+      mvNode.SetLabelName(entry['labelName'])
+    mvNode.SetLabelArray(self.frameLabelsArray(frameIndex))
+    if entry['nodeName']:
+      mvNode.SetName(entry['nodeName'])
+
+    loadable = DICOMLib.DICOMLoadable()
+    loadable.files = entry['files']
+    loadable.name = entry['name']
+    loadable.tooltip = entry['tooltip']
+    loadable.selected = entry['selected']
+    loadable.confidence = entry['confidence']
+    loadable.estimatedSize = entry['estimatedSize']
+    loadable.strategy = entry['strategy']
+    loadable.multivolume = mvNode
+    loadable.frameIndex = frameIndex
+    loadable.frameGeometryCache = frameGeometryCache
+    return loadable
+
+  def examinePartition(self, key, files, create):
+    """ Return the partition of the files built by a strategy: the one from the
+    previous examine() in incremental mode (new files still need to be added),
+    otherwise a new one made by create().
+    """
+    if self.examineState is None:
+      return create()
+    headerTable = self.getHeaderTable(files)
+    seriesCodes = np.unique(headerTable.codes('seriesInstanceUID', headerTable.rows(files)))
+    return self.examineState.partition((key, tuple(seriesCodes.tolist())), files, create)
+
+  def getHeaderTable(self, files):
+    """ Return the header table of the current examine() call, or
+    build one if the strategy is called directly with other files.
+    """
+    if self.headerTable is None or not self.headerTable.covers(files):
+      with self.metrics.phase('headerTable'):
+        self.headerTable = HeaderTable(files, self.tags, self.database())
+    return self.headerTable
+
+  def database(self):
+    """ The DICOM database, counting the fileValue calls if metrics are enabled.
+    """
+    return self.metrics.countCalls(slicer.dicomDatabase, {'fileValue': 'fileValue'})
+
+  def scalarVolumePlugin(self):
+    """ A new scalar volume plugin, counting its examine calls if metrics are enabled.
+    """
+    return self.metrics.countCalls(slicer.modules.dicomPlugins['DICOMScalarVolumePlugin'](),
+      {'examine': 'scalarVolumePlugin.examine', 'load': 'scalarVolumePlugin.load'})
+
+  def writeMetricsTrace(self):
+    """ Write the metrics as Chrome trace to the file set in the settings, if any.
+    """
+    traceFileName = settingsValue('DICOM/MultiVolumeMetricsTraceFile', '')
+    if not self.metrics.enabled or not traceFileName:
+      return
+    try:
+      self.metrics.writeChromeTrace(traceFileName)
+    except OSError as e:
+      logging.warning(f"MultiVolumeImporterPlugin: failed to write metrics trace {traceFileName}: {str(e)}")
+
+  def getFrameGeometryCache(self):
+    """ Return the frame geometry cache of the current examine() call.
+    The cache is attached to the loadables so that load() can reuse the
+    frame sorting done during examine.
+    """
+    if self.frameGeometryCache is None:
+      self.frameGeometryCache = FrameGeometryCache(self.scalarVolumePlugin())
+    return self.frameGeometryCache
+
+  def getFrameIndex(self, mvNode):
+    """ Return the frame index of a multivolume node created by
+    initMultiVolumes(), or parse it from the node attributes.
+    """
+    frameIndex = self.frameIndices.get(mvNode)
+    if frameIndex is None:
+      frameIndex = FrameIndex.fromAttributes(mvNode.GetAttribute('MultiVolume.FrameFileList'),
+        mvNode.GetAttribute('MultiVolume.FrameLabels'), mvNode.GetNumberOfFrames())
+    return frameIndex
+
+  @staticmethod
+  def frameLabelsArray(frameIndex):
+    """ Frame labels as a vtkDoubleArray, to be used as multivolume label array.
+    """
+    import vtk.util.numpy_support
+    return vtk.util.numpy_support.numpy_to_vtk(frameIndex.labels, deep=True, array_type=vtk.VTK_DOUBLE)
+
   def nameTooltipFromFile(self, dicomFilePath, nFrames, tagName, longTagName=None, descriptionLevel=None):
     """
     Get loadable name and tooltip.
     :param descriptionLevel: 'series' (default) or 'study'
     :return: name and tooltip text
     """
-    seriesNumber = slicer.dicomDatabase.fileValue(dicomFilePath, self.tags['seriesNumber'])
-    modality = slicer.dicomDatabase.fileValue(dicomFilePath, self.tags['modality'])
+    headerTable = self.getHeaderTable([dicomFilePath])
+    seriesNumber = headerTable.value(dicomFilePath, 'seriesNumber')
+    modality = headerTable.value(dicomFilePath, 'modality')
     if descriptionLevel=="study":
-      description = slicer.dicomDatabase.fileValue(dicomFilePath, self.tags['studyDescription'])
+      description = headerTable.value(dicomFilePath, 'studyDescription')
     else:
-      description = slicer.dicomDatabase.fileValue(dicomFilePath, self.tags['seriesDescription'])
+      description = headerTable.value(dicomFilePath, 'seriesDescription')
 
     name = ''
     if seriesNumber:
@@ -198,6 +691,38 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     return name, tooltip
 
+  def setEstimatedSize(self, loadable):
+    """
+    Estimate the memory needed to load the loadable from the headers of its
+    first file and mention it in the tooltip. The estimate is None if the
+    headers are incomplete.
+    """
+    loadable.estimatedSize = None
+    frameIndex = loadable.frameIndex
+    firstFile = frameIndex.frameFiles(0)[0]
+    headerTable = self.getHeaderTable([firstFile])
+    try:
+      rows, columns, bitsAllocated = [int(headerTable.value(firstFile, tag)) for tag in ['rows', 'columns', 'bitsAllocated']]
+    except ValueError:
+      return
+    loadable.estimatedSize = MemoryAdmission.estimatedSize(rows, columns, bitsAllocated,
+      len(frameIndex.frameFiles(0)), frameIndex.numberOfFrames(), self.floatRescaled(headerTable, firstFile))
+    loadable.tooltip = f'{loadable.tooltip} ({MemoryAdmission.formatSize(loadable.estimatedSize)})'
+
+  @staticmethod
+  def floatRescaled(headerTable, dicomFilePath):
+    """ True if the file has a non-integer rescale slope or intercept,
+    i.e. the voxels are loaded as floating point values.
+    """
+    for tag in ['rescaleSlope', 'rescaleIntercept']:
+      try:
+        value = float(headerTable.value(dicomFilePath, tag) or 0)
+      except ValueError:
+        continue
+      if not value.is_integer():
+        return True
+    return False
+
   def examineFilesMultiseries(self,files):
     """
     This strategy is similar to examineFiles(), but
@@ -210,14 +735,15 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     loadables = []
 
-    mvNodes = self.initMultiVolumes(files,prescribedTags=['SeriesTime','AcquisitionTime','FlipAngle','CardiacCycle'])
+    mvNodes = self.initMultiVolumes(files,prescribedTags=self.multiseriesFrameTags)
 
     if self.detailedLogging:
       logging.debug('MultiVolumeImporterPlugin: found {} multivolumes!'.format(len(mvNodes)))
 
     for mvNode in mvNodes:
       tagName = mvNode.GetAttribute('MultiVolume.FrameIdentifyingDICOMTagName')
-      orderedFiles = mvNode.GetAttribute('MultiVolume.FrameFileList').split(',')
+      frameIndex = self.getFrameIndex(mvNode)
+      orderedFiles = frameIndex.files()
 
       if self.isFrameOriginConsistent(orderedFiles, mvNode) == False:
         continue
@@ -225,10 +751,10 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       loadable = DICOMLib.DICOMLoadable()
       loadable.files = orderedFiles
       loadable.name, loadable.tooltip = self.nameTooltipFromFile(loadable.files[0], mvNode.GetNumberOfFrames(), tagName, descriptionLevel='study')
-      desc = slicer.dicomDatabase.fileValue(orderedFiles[0],self.tags['studyDescription'])
-      num = slicer.dicomDatabase.fileValue(orderedFiles[0],self.tags['seriesNumber'])
       loadable.selected = True
       loadable.multivolume = mvNode
+      loadable.frameIndex = frameIndex
+      loadable.frameGeometryCache = self.getFrameGeometryCache()
       if tagName == 'TemporalPositionIdentifier':
         loadable.confidence = 0.9
       else:
@@ -238,11 +764,10 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     return loadables
 
   def emptyTagValueFound(self,files,tags):
-    for f in files:
-      for tag in tags:
-        value = slicer.dicomDatabase.fileValue(f,self.tags[tag])
-        if value == None or value == "":
-          return True
+    headerTable = self.getHeaderTable(files)
+    for tag in tags:
+      if headerTable.hasEmptyValue(files, tag):
+        return True
     return False
 
   def examineFilesIPPInstanceNumber(self,files):
@@ -260,79 +785,37 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       return []
 
     loadables = []
-    subseriesLists = {}
-    orderedFiles = []
-
-    minTime = int(slicer.dicomDatabase.fileValue(files[0],self.tags['instanceNumber']))
-    for file in files:
-      ipp = slicer.dicomDatabase.fileValue(file,self.tags['position'])
-      time = int(slicer.dicomDatabase.fileValue(file,self.tags['instanceNumber']))
-      if time<minTime:
-        minTime = time
-      if ipp not in subseriesLists:
-        subseriesLists[ipp] = {}
-      subseriesLists[ipp][time] = file
-
-    nSlicesEqual = True
-    allIPPs = list(subseriesLists.keys())
-    for ipp in subseriesLists.keys():
-      if len(subseriesLists[allIPPs[0]].keys()) != len(subseriesLists[ipp].keys()):
-        nSlicesEqual = False
-        break
-
-    if len(subseriesLists[allIPPs[0]].keys())<2 or not nSlicesEqual:
+
+    headerTable = self.getHeaderTable(files)
+    frameFileLists = self.positionFrames(files, 'instanceNumber', 'examineFilesIPPInstanceNumber')
+    if frameFileLists is None:
       return []
 
-    if nSlicesEqual:
-      nFrames = len(subseriesLists[allIPPs[0]].keys())
-      nSlices = len(allIPPs)
-
-      orderedFiles = [0] * nFrames * nSlices
-
-      frameLabelsStr=""
-      frameFileListStr = ""
-      frameLabelsArray = vtk.vtkDoubleArray()
-
-      ippPositionCnt = 0
-      for ipp in subseriesLists.keys():
-        timesSorted = sorted(subseriesLists[ipp].keys())
-        timeCnt = 0
-        for time in timesSorted:
-          orderedFiles[timeCnt*nSlices+ippPositionCnt] = subseriesLists[ipp][time]
-          timeCnt = timeCnt+1
-          if ippPositionCnt == 0:
-            frameLabelsStr = frameLabelsStr+str(time-minTime)+','
-            frameLabelsArray.InsertNextValue(time-minTime)
-        ippPositionCnt = ippPositionCnt+1
-
-      scalarVolumePlugin = slicer.modules.dicomPlugins['DICOMScalarVolumePlugin']()
+    if frameFileLists:
+      nFrames = len(frameFileLists)
+      orderedFiles = [file for frameFileList in frameFileLists for file in frameFileList]
+      frameLabels = []
+
+      frameGeometryCache = self.getFrameGeometryCache()
       for f in range(nFrames):
-        frameFileList = orderedFiles[f*nSlices:(f+1)*nSlices]
+        frameFileList = frameFileLists[f]
         if len(frameFileList) < 2:
           # multivolume importer does not deal with single-slice volumes (that is left to DICOMImageSequencePlugin)
           return []
-        svs = scalarVolumePlugin.examine([frameFileList])
-        if len(svs)==0:
+        frameGeometry = frameGeometryCache.frameGeometry(frameFileList, headerTable)
+        if frameGeometry is None:
+          # frames and labels of the loadable must match, so a partial multivolume is not offered
           print('Failed to parse one of the multivolume frames as scalar volume!')
-          break
-        time = float(slicer.dicomDatabase.fileValue(svs[0].files[0],self.tags['repetitionTime']))*f
-        if f==0:
-            frameLabelsStr = '0,'
-            frameLabelsArray.InsertNextValue(0)
-        else:
-            frameLabelsStr = frameLabelsStr+str(time)+','
-            frameLabelsArray.InsertNextValue(time)
-
-      for file in orderedFiles:
-        frameFileListStr = frameFileListStr+str(file)+','
+          return []
+        time = float(headerTable.value(frameGeometry.files[0],'repetitionTime'))*f
+        frameLabels.append(time)
 
-      frameLabelsStr = frameLabelsStr[:-1]
-      frameFileListStr = frameFileListStr[:-1]
+      frameIndex = FrameIndex(frameFileLists, frameLabels)
 
       mvNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLMultiVolumeNode')
       mvNode.SetReferenceCount(mvNode.GetReferenceCount()-1)
       mvNode.SetScene(slicer.mrmlScene)
-      mvNode.SetAttribute("MultiVolume.FrameLabels",frameLabelsStr)
+      mvNode.SetAttribute("MultiVolume.FrameLabels",frameIndex.labelsAttribute())
       mvNode.SetAttribute("MultiVolume.FrameIdentifyingDICOMTagName","Time")
       mvNode.SetAttribute("MultiVolume.ParseStrategy","TemporalPosition_via_InstanceNumber*RepetitionTime")
       mvNode.SetAttribute('MultiVolume.NumberOfFrames',str(nFrames))
@@ -340,13 +823,13 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       # keep the files in the order by the detected tag
       # files are not ordered within the individual frames -- this will be
       # done by ScalarVolumePlugin later
-      mvNode.SetAttribute('MultiVolume.FrameFileList', frameFileListStr)
+      mvNode.SetAttribute('MultiVolume.FrameFileList', frameIndex.fileListAttribute())
 
       self.addAcquisitionAttributes(mvNode, frameFileList)
 
       mvNode.SetNumberOfFrames(nFrames)
       mvNode.SetLabelName("Time")
-      mvNode.SetLabelArray(frameLabelsArray)
+      mvNode.SetLabelArray(self.frameLabelsArray(frameIndex))
 
       loadable = DICOMLib.DICOMLoadable()
       loadable.files = orderedFiles
@@ -354,6 +837,8 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       mvNode.SetName(loadable.name)
       loadable.selected = True
       loadable.multivolume = mvNode
+      loadable.frameIndex = frameIndex
+      loadable.frameGeometryCache = frameGeometryCache
       loadable.confidence = 1.
       loadables.append(loadable)
 
@@ -373,80 +858,37 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     """
 
     loadables = []
-    subseriesLists = {}
-    orderedFiles = []
-
-    desc = slicer.dicomDatabase.fileValue(files[0],self.tags['seriesDescription']) # SeriesDescription
-
-    minTime = self.tm2ms(slicer.dicomDatabase.fileValue(files[0],self.tags['AcquisitionTime']))
-    for file in files:
-      ipp = slicer.dicomDatabase.fileValue(file,self.tags['position'])
-      time = self.tm2ms(slicer.dicomDatabase.fileValue(file,self.tags['AcquisitionTime']))
-      if time<minTime:
-        minTime = time
-      if ipp not in subseriesLists:
-        subseriesLists[ipp] = {}
-      subseriesLists[ipp][time] = file
-
-    nSlicesEqual = True
-    allIPPs = list(subseriesLists.keys())
-    for ipp in subseriesLists.keys():
-      if len(subseriesLists[allIPPs[0]].keys()) != len(subseriesLists[ipp].keys()):
-        nSlicesEqual = False
-        break
-
-    if len(subseriesLists[allIPPs[0]].keys())<2 or not nSlicesEqual:
+
+    headerTable = self.getHeaderTable(files)
+    frameFileLists = self.positionFrames(files, 'AcquisitionTime', 'examineFilesIPPAcqTime')
+    if frameFileLists is None:
       return []
 
-    if nSlicesEqual:
-      nFrames = len(subseriesLists[allIPPs[0]].keys())
-      nSlices = len(allIPPs)
-
-      orderedFiles = [0] * nFrames * nSlices
-
-      frameLabelsStr=""
-      frameFileListStr = ""
-      frameLabelsArray = vtk.vtkDoubleArray()
-
-      ippPositionCnt = 0
-      for ipp in subseriesLists.keys():
-        timesSorted = sorted(subseriesLists[ipp].keys())
-        timeCnt = 0
-        for time in timesSorted:
-          orderedFiles[timeCnt*nSlices+ippPositionCnt] = subseriesLists[ipp][time]
-          timeCnt = timeCnt+1
-          if ippPositionCnt == 0:
-            frameLabelsStr = frameLabelsStr+str(time-minTime)+','
-            frameLabelsArray.InsertNextValue(time-minTime)
-        ippPositionCnt = ippPositionCnt+1
-
-      scalarVolumePlugin = slicer.modules.dicomPlugins['DICOMScalarVolumePlugin']()
+    if frameFileLists:
+      nFrames = len(frameFileLists)
+      orderedFiles = [file for frameFileList in frameFileLists for file in frameFileList]
+      frameLabels = []
+
+      frameGeometryCache = self.getFrameGeometryCache()
       firstFrameTime = 0
       for f in range(nFrames):
-        frameFileList = orderedFiles[f*nSlices:(f+1)*nSlices]
-        svs = scalarVolumePlugin.examine([frameFileList])
-        if len(svs)==0:
+        frameFileList = frameFileLists[f]
+        frameGeometry = frameGeometryCache.frameGeometry(frameFileList, headerTable)
+        if frameGeometry is None:
+          # frames and labels of the loadable must match, so a partial multivolume is not offered
           print('Failed to parse one of the multivolume frames as scalar volume!')
-          break
-        time = self.tm2ms(slicer.dicomDatabase.fileValue(svs[0].files[0],self.tags['AcquisitionTime']))
+          return []
+        time = self.tm2ms(headerTable.value(frameGeometry.files[0],'AcquisitionTime'))
         if f==0:
-            frameLabelsStr = '0,'
-            frameLabelsArray.InsertNextValue(0)
-            firstFrameTime = time
-        else:
-            frameLabelsStr = frameLabelsStr+str(time-firstFrameTime)+','
-            frameLabelsArray.InsertNextValue(time)
-
-      for file in orderedFiles:
-        frameFileListStr = frameFileListStr+str(file)+','
+          firstFrameTime = time
+        frameLabels.append(time-firstFrameTime)
 
-      frameLabelsStr = frameLabelsStr[:-1]
-      frameFileListStr = frameFileListStr[:-1]
+      frameIndex = FrameIndex(frameFileLists, frameLabels)
 
       mvNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLMultiVolumeNode')
       mvNode.SetReferenceCount(mvNode.GetReferenceCount()-1)
       mvNode.SetScene(slicer.mrmlScene)
-      mvNode.SetAttribute("MultiVolume.FrameLabels",frameLabelsStr)
+      mvNode.SetAttribute("MultiVolume.FrameLabels",frameIndex.labelsAttribute())
       mvNode.SetAttribute("MultiVolume.FrameIdentifyingDICOMTagName","AcquisitionTime")
       mvNode.SetAttribute("MultiVolume.ParseStrategy","AcquisitionTime+ImagePositionPatient")
       mvNode.SetAttribute('MultiVolume.NumberOfFrames',str(nFrames))
@@ -454,13 +896,13 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       # keep the files in the order by the detected tag
       # files are not ordered within the individual frames -- this will be
       # done by ScalarVolumePlugin later
-      mvNode.SetAttribute('MultiVolume.FrameFileList', frameFileListStr)
+      mvNode.SetAttribute('MultiVolume.FrameFileList', frameIndex.fileListAttribute())
 
       self.addAcquisitionAttributes(mvNode, frameFileList)
 
       mvNode.SetNumberOfFrames(nFrames)
       mvNode.SetLabelName("AcquisitionTime")
-      mvNode.SetLabelArray(frameLabelsArray)
+      mvNode.SetLabelArray(self.frameLabelsArray(frameIndex))
 
       loadable = DICOMLib.DICOMLoadable()
       loadable.files = orderedFiles
@@ -468,6 +910,8 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       mvNode.SetName(loadable.name)
       loadable.selected = True
       loadable.multivolume = mvNode
+      loadable.frameIndex = frameIndex
+      loadable.frameGeometryCache = frameGeometryCache
       loadable.confidence = 1.
       loadables.append(loadable)
 
@@ -475,10 +919,11 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
   def addAcquisitionAttributes(self,mvNode,frameFileList):
     frameTag = mvNode.GetAttribute('MultiVolume.FrameIdentifyingDICOMTagName')
+    headerTable = self.getHeaderTable(frameFileList[:1])
 
     for tag in ['EchoTime','RepetitionTime','FlipAngle']:
       if tag != frameTag:
-        tagValue = slicer.dicomDatabase.fileValue(frameFileList[0],self.tags[tag])
+        tagValue = headerTable.value(frameFileList[0],tag)
         mvNode.SetAttribute('MultiVolume.DICOM.'+tag,tagValue)
 
   def examineFiles(self,files):
@@ -502,31 +947,21 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     # first separate individual series, then try to find multivolume in each
     # of the series (code from DICOMScalarVolumePlugin)
-    subseriesLists = {}
-
-    for file in files:
-      value = slicer.dicomDatabase.fileValue(file,self.tags['seriesInstanceUID']) # SeriesInstanceUID
-      if value == "":
-        value = "Unknown"
-      if value not in subseriesLists:
-        subseriesLists[value] = []
-      subseriesLists[value].append(file)
-
     # now iterate over all subseries file lists and try to parse the
     # multivolumes
 
-    for key in subseriesLists.keys():
+    for subseriesFiles in FrameGrouping.splitSeries(files, self.getHeaderTable(files)):
 
-      mvNodes = self.initMultiVolumes(subseriesLists[key])
+      mvNodes = self.initMultiVolumes(subseriesFiles)
 
       if self.detailedLogging:
         logging.debug('MultiVolumeImporterPlugin: found '+str(len(mvNodes))+' multivolumes!')
 
       for mvNode in mvNodes:
         tagName = mvNode.GetAttribute('MultiVolume.FrameIdentifyingDICOMTagName')
-        orderedFiles = mvNode.GetAttribute('MultiVolume.FrameFileList').split(',')
+        frameIndex = self.getFrameIndex(mvNode)
 
-        if self.isFrameOriginConsistent(orderedFiles, mvNode) == False:
+        if self.isFrameOriginConsistent(frameIndex.files(), mvNode) == False:
           continue
 
         loadable = DICOMLib.DICOMLoadable()
@@ -535,6 +970,8 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
         mvNode.SetName(loadable.name)
         loadable.selected = True
         loadable.multivolume = mvNode
+        loadable.frameIndex = frameIndex
+        loadable.frameGeometryCache = self.getFrameGeometryCache()
         if tagName == 'TemporalPositionIdentifier':
           loadable.confidence = 0.9
         else:
@@ -545,6 +982,7 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
   # return true is the origins for the individual frames are within
   # self.epsilon apart
+  @timed('examine')
   def isFrameOriginConsistent(self, files, mvNode):
 
     nFrames = mvNode.GetNumberOfFrames()
@@ -552,22 +990,21 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     # sort files for each frame
     nFiles = len(files)
     filesPerFrame = int(nFiles/nFrames)
-    frameOrigins = []
 
-    scalarVolumePlugin = slicer.modules.dicomPlugins['DICOMScalarVolumePlugin']()
+    headerTable = self.getHeaderTable(files)
+    frameGeometryCache = self.getFrameGeometryCache()
     firstFrameOrigin = None
     for frameNumber in range(nFrames):
       frameFileList = files[frameNumber*filesPerFrame:(frameNumber+1)*filesPerFrame]
 
       # sv plugin will sort the filenames by geometric order
-      svs = scalarVolumePlugin.examine([frameFileList])
-      if len(svs) == 0:
+      frameGeometry = frameGeometryCache.frameGeometry(frameFileList, headerTable)
+      if frameGeometry is None:
         return False
 
-      positionTag = slicer.dicomDatabase.fileValue(svs[0].files[0], self.tags['position'])
-      if positionTag == '':
+      origin = frameGeometry.origin
+      if origin is None:
         return False
-      origin = [float(zz) for zz in positionTag.split('\\')]
 
       if firstFrameOrigin is None:
         # this is the first frame, just record the origin
@@ -580,12 +1017,19 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     return True
 
-  def load(self,loadable):
+  def load(self,loadable,synchronous=False):
     """Load the selection as a MultiVolume, if multivolume attribute is
     present
+
+    If synchronous is True then all frames are read into memory before
+    returning, regardless of the lazy, progressive and memory mapping
+    settings (memory mapping is only used if the multivolume does not fit
+    in memory), and a multivolume that cannot be loaded raises MemoryError
+    instead of displaying an error (for batch processing).
     """
     import vtk.util.numpy_support
 
+    self.metrics.reset()
     mvNode = ''
     try:
       mvNode = loadable.multivolume
@@ -593,14 +1037,33 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       return None
 
     nFrames = int(mvNode.GetAttribute('MultiVolume.NumberOfFrames'))
-    files = mvNode.GetAttribute('MultiVolume.FrameFileList').split(',')
-    nFiles = len(files)
-    filesPerFrame = int(nFiles/nFrames)
-    frames = []
+    frameIndex = getattr(loadable, 'frameIndex', None)
+    if frameIndex is None:
+      frameIndex = FrameIndex.fromAttributes(mvNode.GetAttribute('MultiVolume.FrameFileList'),
+        mvNode.GetAttribute('MultiVolume.FrameLabels'), nFrames)
 
     baseName = loadable.name
 
     loadAsVolumeSequence = hasattr(loadable, 'loadAsVolumeSequence') and loadable.loadAsVolumeSequence
+    frameGeometryCache = getattr(loadable, 'frameGeometryCache', None)
+    frameGeometries = self.cachedFrameGeometries(frameGeometryCache, frameIndex)
+
+    # check that the multivolume fits in memory before anything is allocated
+    admission, admissionMessage = MemoryAdmission.admissionStrategy(getattr(loadable, 'estimatedSize', None),
+      loadAsVolumeSequence, frameGeometries is not None, ScalarStorage.scratchDirectory())
+    if admission == MemoryAdmission.REFUSE:
+      if synchronous:
+        raise MemoryError(f"Cannot load {baseName}: {admissionMessage}")
+      slicer.util.errorDisplay(f"Cannot load {baseName}: {admissionMessage}.")
+      return None
+    if admissionMessage:
+      logging.warning(f"Loading {baseName}: {admissionMessage}")
+    # memory-map the multivolume if needed, otherwise the threshold of the settings applies
+    if synchronous:
+      memoryMapped = admission == MemoryAdmission.MEMORY_MAPPED
+    else:
+      memoryMapped = True if admission == MemoryAdmission.MEMORY_MAPPED else None
+
     if loadAsVolumeSequence:
       volumeSequenceNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSequenceNode",
         slicer.mrmlScene.GenerateUniqueName(baseName))
@@ -613,157 +1076,181 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       mvImage = vtk.vtkImageData()
       mvImageArray = None
 
-    scalarVolumePlugin = slicer.modules.dicomPlugins['DICOMScalarVolumePlugin']()
-    instanceUIDs = ""
-    for file in files:
-      uid = slicer.dicomDatabase.fileValue(file,self.tags['instanceUID'])
-      if uid == "":
-        uid = "Unknown"
-      instanceUIDs += uid+" "
-    instanceUIDs = instanceUIDs[:-1]
-    mvNode.SetAttribute("DICOM.instanceUIDs", instanceUIDs)
+    scalarVolumePlugin = self.scalarVolumePlugin()
+    database = self.database()
+    pathUIDs = [database.fileValue(file,self.tags['instanceUID']) or "Unknown" for file in frameIndex.paths]
+    mvNode.SetAttribute("DICOM.instanceUIDs", " ".join([pathUIDs[pathId] for pathId in frameIndex.order.tolist()]))
 
     progressbar = slicer.util.createProgressDialog(labelText="Loading "+baseName,
                                                    value=0, maximum=nFrames,
                                                    windowModality = qt.Qt.WindowModal)
 
+    loadThreads = settingsValue('DICOM/MultiVolumeLoadThreads', 1, converter=int)
+    lazySequence = None
+    progressiveLoader = None
+
     try:
-      # read each frame into scalar volume
-      for frameNumber in range(nFrames):
+      if not synchronous and loadAsVolumeSequence and frameGeometries is not None and (admission == MemoryAdmission.LAZY_SEQUENCE
+          or settingsValue('DICOM/MultiVolumeLazySequence', False, converter=toBool)):
+        # only the first frame is read now, the others when they are displayed
+        lazySequence = LazyVolumeSequence(volumeSequenceNode,
+          DicomFrameSource([frameGeometry.files for frameGeometry in frameGeometries], self.dicomImageIOName()))
+
+      elif not synchronous and frameGeometries is not None and settingsValue('DICOM/MultiVolumeProgressiveLoad', False, converter=toBool):
+        # only the first frame is read now, the others in the background once the node is shown
+        if loadAsVolumeSequence:
+          progressiveLoader = self.startSequenceFrames(baseName, volumeSequenceNode, frameGeometries, loadThreads)
+        else:
+          progressiveLoader = self.startMultiVolumeFrames(baseName, mvNode, mvImage, frameGeometries, loadThreads, memoryMapped)
 
-        progressbar.value = frameNumber
-        slicer.app.processEvents()
-        if progressbar.wasCanceled:
-          break
+      elif frameGeometries is not None:
+        # decode the frames directly, without creating temporary nodes in the scene
+        # (in worker threads if enabled, the scene is only updated from this thread)
+        if loadAsVolumeSequence:
+          self.readSequenceFrames(volumeSequenceNode, frameGeometries, loadThreads, progressbar)
+        else:
+          self.readMultiVolumeFrames(mvNode, mvImage, frameGeometries, loadThreads, progressbar, memoryMapped)
 
-        sNode = slicer.vtkMRMLVolumeArchetypeStorageNode()
-        sNode.ResetFileNameList()
+      else:
+        # read each frame into scalar volume using the scalar volume plugin
+        for frameNumber in range(nFrames):
+
+          progressbar.value = frameNumber
+          slicer.app.processEvents()
+          if progressbar.wasCanceled:
+            break
+
+          frameFileList = frameIndex.frameFiles(frameNumber)
+          # reuse the frame sorting done during examine, if available
+          frameGeometry = None
+          if frameGeometryCache:
+            frameGeometry = frameGeometryCache.cachedFrameGeometry(frameFileList)
+          if frameGeometry and frameGeometry.loadable:
+            svLoadables = [frameGeometry.loadable]
+          else:
+            # sv plugin will sort the filenames by geometric order
+            svLoadables = scalarVolumePlugin.examine([frameFileList])
+
+          if len(svLoadables) == 0:
+            raise OSError(f"volume frame {frameNumber} is invalid")
+
+          with self.metrics.phase('read', 'load', frame=frameNumber):
+            frame = scalarVolumePlugin.load(svLoadables[0])
+
+          # Harden the acquisition transform if there is any
+          # (for example due to varying slice spacing)
+          # and then remove the transform from the scene
+          parentTransformNode = frame.GetParentTransformNode()
+          if parentTransformNode:
+            frame.HardenTransform()
+            slicer.mrmlScene.RemoveNode(parentTransformNode)
+
+          if frame == None or frame.GetImageData() == None:
+            raise OSError(f"Volume frame {frameNumber} is invalid - {svLoadables[0].warning}")
+          if loadAsVolumeSequence:
+            # Load into volume sequence
+            self.addSequenceFrame(volumeSequenceNode, frame, frameNumber)
+
+          else:
+            # Load into multi-volume
+
+            if frameNumber == 0:
+              frameImage = frame.GetImageData()
+              frameExtent = frameImage.GetExtent()
+
+              mvImage.SetExtent(frameExtent)
+              ScalarStorage.allocateScalars(mvImage, frame.GetImageData().GetScalarType(), nFrames, memoryMapped)
+
+              mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
+              frameAssembler = FrameAssembler(mvImageArray)
+
+              mvNode.SetScene(slicer.mrmlScene)
+
+              mat = vtk.vtkMatrix4x4()
+              frame.GetRASToIJKMatrix(mat)
+              mvNode.SetRASToIJKMatrix(mat)
+              frame.GetIJKToRASMatrix(mat)
+              mvNode.SetIJKToRASMatrix(mat)
 
-        frameFileList = files[frameNumber*filesPerFrame:(frameNumber+1)*filesPerFrame]
-        # sv plugin will sort the filenames by geometric order
-        svLoadables = scalarVolumePlugin.examine([frameFileList])
+            frameImage = frame.GetImageData()
+            frameImageArray = vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars())
 
-        if len(svLoadables) == 0:
-          raise OSError(f"volume frame {frameNumber} is invalid")
+            with self.metrics.phase('copy', 'load', frame=frameNumber):
+              frameAssembler.addFrame(frameNumber, frameImageArray)
 
-        frame = scalarVolumePlugin.load(svLoadables[0])
+          # Remove temporary volume node
+          with self.metrics.phase('sceneUpdate', 'load', frame=frameNumber):
+            if frame.GetDisplayNode():
+              slicer.mrmlScene.RemoveNode(frame.GetDisplayNode())
+            if frame.GetStorageNode():
+              slicer.mrmlScene.RemoveNode(frame.GetStorageNode())
+            slicer.mrmlScene.RemoveNode(frame)
 
-        # Harden the acquisition transform if there is any
-        # (for example due to varying slice spacing)
-        # and then remove the transform from the scene
-        parentTransformNode = frame.GetParentTransformNode()
-        if parentTransformNode:
-          frame.HardenTransform()
-          slicer.mrmlScene.RemoveNode(parentTransformNode)
+        if not loadAsVolumeSequence and mvImageArray is not None:
+          frameAssembler.flush()
 
-        if frame == None or frame.GetImageData() == None:
-          raise OSError(f"Volume frame {frameNumber} is invalid - {svLoadables[0].warning}")
+      with self.metrics.phase('sceneUpdate', 'load'):
         if loadAsVolumeSequence:
-          # Load into volume sequence
-
-          # volumeSequenceNode.SetDataNodeAtValue would deep-copy the volume frame.
-          # To avoid memory reallocation, add an empty node and shallow-copy the contents
-          # of the volume frame.
-
-          # Create an empty volume node in the sequence node
-          proxyVolume = slicer.mrmlScene.AddNewNodeByClass(frame.GetClassName())
-          indexValue = str(frameNumber)
-          volumeSequenceNode.SetDataNodeAtValue(proxyVolume, indexValue)
-          slicer.mrmlScene.RemoveNode(proxyVolume)
-
-          # Update the data node
-          shallowCopy = True
-          volumeSequenceNode.UpdateDataNodeAtValue(frame, indexValue, shallowCopy)
+          # Finalize volume sequence import
+          # For user convenience, add a browser node and show the volume in the slice viewer.
+
+          # Add browser node
+          sequenceBrowserNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceBrowserNode',
+            slicer.mrmlScene.GenerateUniqueName(baseName + " browser"))
+          sequenceBrowserNode.SetAndObserveMasterSequenceNodeID(volumeSequenceNode.GetID())
+          # If save changes are allowed then proxy nodes are updated using shallow copy, which is much
+          # faster for images. Images are usually not modified, so the risk of accidentally modifying
+          # data in the sequence is low.
+          sequenceBrowserNode.SetSaveChanges(volumeSequenceNode, True)
+          # Show frame number in proxy volume node name
+          sequenceBrowserNode.SetOverwriteProxyName(volumeSequenceNode, True);
+          if lazySequence:
+            lazySequence.setBrowserNode(sequenceBrowserNode)
+
+          # Automatically select the volume to display
+          imageProxyVolumeNode = sequenceBrowserNode.GetProxyNode(volumeSequenceNode)
+          appLogic = slicer.app.applicationLogic()
+          selNode = appLogic.GetSelectionNode()
+          selNode.SetReferenceActiveVolumeID(imageProxyVolumeNode.GetID())
+          appLogic.PropagateVolumeSelection()
+
+          # Show under the right patient/study in subject hierarchy
+          self.addSeriesInSubjectHierarchy(loadable, imageProxyVolumeNode)
+
+          # Show sequence browser toolbar
+          sequencesModule = slicer.modules.sequences
+          if sequencesModule.autoShowToolBar:
+            sequencesModule.setToolBarActiveBrowserNode(sequenceBrowserNode)
+            sequencesModule.setToolBarVisible(True)
 
         else:
-          # Load into multi-volume
+          # Finalize multi-volume import
 
-          if frameNumber == 0:
-            frameImage = frame.GetImageData()
-            frameExtent = frameImage.GetExtent()
-            frameSize = frameExtent[1]*frameExtent[3]*frameExtent[5]
-
-            mvImage.SetExtent(frameExtent)
-            mvImage.AllocateScalars(frame.GetImageData().GetScalarType(), nFrames)
-
-            mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
-
-            mvNode.SetScene(slicer.mrmlScene)
-
-            mat = vtk.vtkMatrix4x4()
-            frame.GetRASToIJKMatrix(mat)
-            mvNode.SetRASToIJKMatrix(mat)
-            frame.GetIJKToRASMatrix(mat)
-            mvNode.SetIJKToRASMatrix(mat)
-
-          frameImage = frame.GetImageData()
-          frameImageArray = vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars())
-
-          mvImageArray.T[frameNumber] = frameImageArray
-
-        # Remove temporary volume node
-        if frame.GetDisplayNode():
-          slicer.mrmlScene.RemoveNode(frame.GetDisplayNode())
-        if frame.GetStorageNode():
-          slicer.mrmlScene.RemoveNode(frame.GetStorageNode())
-        slicer.mrmlScene.RemoveNode(frame)
-
-      if loadAsVolumeSequence:
-        # Finalize volume sequence import
-        # For user convenience, add a browser node and show the volume in the slice viewer.
-
-        # Add browser node
-        sequenceBrowserNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSequenceBrowserNode',
-          slicer.mrmlScene.GenerateUniqueName(baseName + " browser"))
-        sequenceBrowserNode.SetAndObserveMasterSequenceNodeID(volumeSequenceNode.GetID())
-        # If save changes are allowed then proxy nodes are updated using shallow copy, which is much
-        # faster for images. Images are usually not modified, so the risk of accidentally modifying
-        # data in the sequence is low.
-        sequenceBrowserNode.SetSaveChanges(volumeSequenceNode, True)
-        # Show frame number in proxy volume node name
-        sequenceBrowserNode.SetOverwriteProxyName(volumeSequenceNode, True);
-
-        # Automatically select the volume to display
-        imageProxyVolumeNode = sequenceBrowserNode.GetProxyNode(volumeSequenceNode)
-        appLogic = slicer.app.applicationLogic()
-        selNode = appLogic.GetSelectionNode()
-        selNode.SetReferenceActiveVolumeID(imageProxyVolumeNode.GetID())
-        appLogic.PropagateVolumeSelection()
-
-        # Show under the right patient/study in subject hierarchy
-        self.addSeriesInSubjectHierarchy(loadable, imageProxyVolumeNode)
-
-        # Show sequence browser toolbar
-        sequencesModule = slicer.modules.sequences
-        if sequencesModule.autoShowToolBar:
-          sequencesModule.setToolBarActiveBrowserNode(sequenceBrowserNode)
-          sequencesModule.setToolBarVisible(True)
+          mvDisplayNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMultiVolumeDisplayNode')
+          mvDisplayNode.SetDefaultColorMap()
 
-      else:
-        # Finalize multi-volume import
+          mvNode.SetAndObserveDisplayNodeID(mvDisplayNode.GetID())
+          mvNode.SetAndObserveImageData(mvImage)
+          mvNode.SetNumberOfFrames(nFrames)
+          mvNode.SetName(loadable.name)
+          slicer.mrmlScene.AddNode(mvNode)
 
-        mvDisplayNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMultiVolumeDisplayNode')
-        mvDisplayNode.SetDefaultColorMap()
+          # Show under the right patient/study in subject hierarchy
+          self.addSeriesInSubjectHierarchy(loadable, mvNode)
 
-        mvNode.SetAndObserveDisplayNodeID(mvDisplayNode.GetID())
-        mvNode.SetAndObserveImageData(mvImage)
-        mvNode.SetNumberOfFrames(nFrames)
-        mvNode.SetName(loadable.name)
-        slicer.mrmlScene.AddNode(mvNode)
+          #
+          # automatically select the volume to display
+          #
+          appLogic = slicer.app.applicationLogic()
+          selNode = appLogic.GetSelectionNode()
+          selNode.SetReferenceActiveVolumeID(mvNode.GetID())
+          appLogic.PropagateVolumeSelection()
 
-        # Show under the right patient/study in subject hierarchy
-        self.addSeriesInSubjectHierarchy(loadable, mvNode)
+          # file list is no longer needed - remove the attribute
+          mvNode.RemoveAttribute('MultiVolume.FrameFileList')
 
-        #
-        # automatically select the volume to display
-        #
-        appLogic = slicer.app.applicationLogic()
-        selNode = appLogic.GetSelectionNode()
-        selNode.SetReferenceActiveVolumeID(mvNode.GetID())
-        appLogic.PropagateVolumeSelection()
-
-        # file list is no longer needed - remove the attribute
-        mvNode.RemoveAttribute('MultiVolume.FrameFileList')
+      if progressiveLoader:
+        progressiveLoader.start()
 
     except Exception as e:
       logging.error(f"Failed to read a multivolume: {str(e)}")
@@ -773,39 +1260,172 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
 
     finally:
       progressbar.close()
+      self.writeMetricsTrace()
 
     return mvNode
 
-  def tm2ms(self,tm):
+  def addSequenceFrame(self, volumeSequenceNode, frame, frameNumber):
+    """Add a volume node as the given frame of a volume sequence.
+    """
+    # volumeSequenceNode.SetDataNodeAtValue would deep-copy the volume frame.
+    # To avoid memory reallocation, add an empty node and shallow-copy the contents
+    # of the volume frame.
+
+    with self.metrics.phase('sceneUpdate', 'load', frame=frameNumber):
+      # Create an empty volume node in the sequence node
+      proxyVolume = slicer.mrmlScene.AddNewNodeByClass(frame.GetClassName())
+      indexValue = str(frameNumber)
+      volumeSequenceNode.SetDataNodeAtValue(proxyVolume, indexValue)
+      slicer.mrmlScene.RemoveNode(proxyVolume)
+
+      # Update the data node
+      shallowCopy = True
+      volumeSequenceNode.UpdateDataNodeAtValue(frame, indexValue, shallowCopy)
+
+  def cachedFrameGeometries(self, frameGeometryCache, frameIndex):
+    """Return the geometry of all frames found during examine, or None if
+    any of the frames was not examined or needs the acquisition geometry
+    regularization of the scalar volume plugin (i.e. cannot be read directly).
+    """
+    if not frameGeometryCache:
+      return None
+    frameGeometries = []
+    for frameNumber in range(frameIndex.numberOfFrames()):
+      frameGeometry = frameGeometryCache.cachedFrameGeometry(frameIndex.frameFiles(frameNumber))
+      if frameGeometry is None or frameGeometry.warning:
+        return None
+      frameGeometries.append(frameGeometry)
+    return frameGeometries
 
-    if len(tm)<6:
-      return 0
+  @staticmethod
+  def dicomImageIOName():
+    """Name of the DICOM image IO preferred for reading scalar volumes.
+    """
+    return 'DCMTK' if settingsValue('DICOM/ScalarVolume/ReaderApproach', 'GDCM') == 'DCMTK' else 'GDCM'
 
-    try:
-      hhmmss = tm.split('.')[0]
-    except:
-      hhmmss = tm
+  @staticmethod
+  def continueLoading(progressbar):
+    """Keep the application responsive while frames are read in the background.
+    Returns False if loading was canceled.
+    """
+    slicer.app.processEvents()
+    return not progressbar.wasCanceled
 
-    try:
-      ssfrac = float('0.'+tm.split('.')[1])
-    except:
-      ssfrac = 0.
-
-    if len(hhmmss)==6: # HHMMSS
-      sec = float(hhmmss[0:2])*60.*60.+float(hhmmss[2:4])*60.+float(hhmmss[4:6])
-    elif len(hhmmss)==4: # HHMM
-      sec = float(hhmmss[0:2])*60.*60.+float(hhmmss[2:4])*60.
-    elif len(hhmmss)==2: # HH
-      sec = float(hhmmss[0:2])*60.*60.
-    else:
-      raise OSError("Invalid DICOM time string: "+tm+" (failed to parse HHMMSS)")
+  @staticmethod
+  def initMultiVolumeImage(mvNode, mvImage, frameImage, ijkToRAS, nFrames, batchSize=16, memoryMapped=None):
+    """Allocate the multivolume image for frames like frameImage (the first frame)
+    and add the first frame. Returns the frame assembler and a function
+    copyFrame(frameNumber, frameImage, ijkToRAS) that adds a frame and may be
+    called from worker threads.
+    """
+    import vtk.util.numpy_support
+
+    frameExtent = frameImage.GetExtent()
+    mvImage.SetExtent(frameExtent)
+    ScalarStorage.allocateScalars(mvImage, frameImage.GetScalarType(), nFrames, memoryMapped)
+    mvImageArray = vtk.util.numpy_support.vtk_to_numpy(mvImage.GetPointData().GetScalars())
+    frameAssembler = FrameAssembler(mvImageArray, batchSize)
+    frameAssembler.addFrame(0, vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars()))
 
-    sec = sec+ssfrac
+    mvNode.SetScene(slicer.mrmlScene)
+    mvNode.SetIJKToRASMatrix(ijkToRAS)
 
-    return sec*1000.
+    def copyFrame(frameNumber, frameImage, ijkToRAS):
+      if frameImage.GetExtent() != frameExtent:
+        raise OSError(f"Volume frame {frameNumber} has a different extent than the first frame")
+      frameAssembler.addFrame(frameNumber, vtk.util.numpy_support.vtk_to_numpy(frameImage.GetPointData().GetScalars()))
+
+    return frameAssembler, copyFrame
+
+  def readMultiVolumeFrames(self, mvNode, mvImage, frameGeometries, loadThreads, progressbar, memoryMapped=None):
+    """Decode the frames straight into the multivolume image.
+    """
+    nFrames = len(frameGeometries)
+    with ParallelFrameReader(loadThreads, self.dicomImageIOName(), self.metrics) as frameReader:
+      # the first frame determines the size of the multivolume
+      with self.metrics.phase('read', 'load', frame=0):
+        frameImage, ijkToRAS = frameReader.threadFrameReader().read(frameGeometries[0].files)
+      with self.metrics.phase('allocate', 'load'):
+        frameAssembler, copyFrame = self.initMultiVolumeImage(mvNode, mvImage, frameImage, ijkToRAS, nFrames, memoryMapped=memoryMapped)
+
+      loadedFrames = 1
+      for frameNumber, _ in frameReader.readFrames(range(1, nFrames),
+          [frameGeometry.files for frameGeometry in frameGeometries[1:]],
+          copyFrame, lambda: self.continueLoading(progressbar)):
+        loadedFrames += 1
+        progressbar.value = loadedFrames
+    # after the reader is shut down, no frame is added while flushing (e.g. when loading was canceled)
+    with self.metrics.phase('copy', 'load'):
+      frameAssembler.flush()
+
+  def readSequenceFrames(self, volumeSequenceNode, frameGeometries, loadThreads, progressbar):
+    """Decode the frames and add them to the volume sequence in frame order.
+    """
+    nextFrameNumber = 0
+    readFrames = {}
+    with ParallelFrameReader(loadThreads, self.dicomImageIOName(), self.metrics) as frameReader:
+      for frameNumber, readFrame in frameReader.readFrames(range(len(frameGeometries)),
+          [frameGeometry.files for frameGeometry in frameGeometries],
+          None, lambda: self.continueLoading(progressbar)):
+        readFrames[frameNumber] = readFrame
+        while nextFrameNumber in readFrames:
+          frameImage, ijkToRAS = readFrames.pop(nextFrameNumber)
+          frame = slicer.vtkMRMLScalarVolumeNode()
+          frame.SetAndObserveImageData(frameImage)
+          frame.SetIJKToRASMatrix(ijkToRAS)
+          self.addSequenceFrame(volumeSequenceNode, frame, nextFrameNumber)
+          nextFrameNumber += 1
+          progressbar.value = nextFrameNumber
+
+  def startMultiVolumeFrames(self, name, mvNode, mvImage, frameGeometries, loadThreads, memoryMapped=None):
+    """Decode the first frame into the multivolume image and return a loader
+    that decodes the other frames in the background.
+    """
+    nFrames = len(frameGeometries)
+    with self.metrics.phase('read', 'load', frame=0):
+      frameImage, ijkToRAS = FrameReader(self.dicomImageIOName()).read(frameGeometries[0].files)
+    # frames are written to the image one by one, so that each frame is shown as soon as it is read
+    frameAssembler, copyFrame = self.initMultiVolumeImage(mvNode, mvImage, frameImage, ijkToRAS, nFrames, batchSize=1, memoryMapped=memoryMapped)
+
+    def frameReady(frameNumber, result):
+      with self.metrics.phase('sceneUpdate', 'load', frame=frameNumber):
+        mvImage.Modified()
+
+    def finished(canceled):
+      frameAssembler.flush()
+      mvImage.Modified()
+
+    return ProgressiveLoader(name, range(1, nFrames), [frameGeometry.files for frameGeometry in frameGeometries[1:]],
+      loadThreads, self.dicomImageIOName(), copyFrame, frameReady, finished, self.metrics)
+
+  def startSequenceFrames(self, name, volumeSequenceNode, frameGeometries, loadThreads):
+    """Add the first frame to the volume sequence and return a loader
+    that adds the other frames in frame order as they are decoded in the background.
+    """
+    def addFrame(frameNumber, frameImage, ijkToRAS):
+      frame = slicer.vtkMRMLScalarVolumeNode()
+      frame.SetAndObserveImageData(frameImage)
+      frame.SetIJKToRASMatrix(ijkToRAS)
+      self.addSequenceFrame(volumeSequenceNode, frame, frameNumber)
+
+    addFrame(0, *FrameReader(self.dicomImageIOName()).read(frameGeometries[0].files))
+
+    readFrames = {}
+    nextFrameNumber = [1]
+    def frameReady(frameNumber, readFrame):
+      readFrames[frameNumber] = readFrame
+      while nextFrameNumber[0] in readFrames:
+        addFrame(nextFrameNumber[0], *readFrames.pop(nextFrameNumber[0]))
+        nextFrameNumber[0] += 1
+
+    return ProgressiveLoader(name, range(1, len(frameGeometries)),
+      [frameGeometry.files for frameGeometry in frameGeometries[1:]],
+      loadThreads, self.dicomImageIOName(), None, frameReady, metrics=self.metrics)
+
+  def tm2ms(self,tm):
+    return ValueParsing.tm2ms(tm)
 
   def initMultiVolumes(self, files, prescribedTags=None):
-    tag2ValueFileList = {}
     multivolumes = []
 
     if prescribedTags == None:
@@ -813,126 +1433,19 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
     else:
       consideredTags = list(prescribedTags)
 
-    # iterate over all files
-    tagsToIgnore = []
-    for file in files:
-
-      # Remove tags that were not found in the previous iteration
-      for frameTag in tagsToIgnore:
-        consideredTags.remove(frameTag)
-      tagsToIgnore = []
-
-      # iterate over the tags that can be used to separate individual frames
-      for frameTag in consideredTags:
-        try:
-          tagValue2FileList = tag2ValueFileList[frameTag]
-        except:
-          tagValue2FileList = {}
-          tag2ValueFileList[frameTag] = tagValue2FileList
-
-        tagValueStr = slicer.dicomDatabase.fileValue(file,self.tags[frameTag])
-        if tagValueStr == '':
-          # not found?
-          tagsToIgnore.append(frameTag)
-          continue
-
-        if frameTag == 'AcquisitionTime' or frameTag == 'SeriesTime' or frameTag == 'ContentTime':
-          # extra parsing is needed to convert from DICOM TM VR into ms
-          tagValue = self.tm2ms(tagValueStr) # convert to ms
-        elif frameTag == "GE.B-value":
-          try:
-            # Parse this:
-            # (0043,1039) IS [1000001250\8\0\0] #  16, 4 Unknown Tag & Data
-            # GE Discovery w750
-            tagValue = float(int(tagValueStr.split('\\')[0]) % 100000)
-          except:
-            continue
-        elif frameTag == "CardiacCycle":
-          try:
-            # Parse this:
-            #  TP0PC0965, PULSTART_P0020PC, PULSEND_P0080PC...
-            #  TP10PC0965, PULSTART_P0020PC, PULSEND_P0080PC...
-            #  TP30PC0965, PULSTART_P0020PC, PULSEND_P0080PC...
-            cardiacPhaseInfo = tagValueStr.split('\\')[0] # TP0PC0965
-            matched = re.search(r"TP(\d+)PC(\d+)", cardiacPhaseInfo)
-            tagValue = float(matched.groups()[0])
-          except:
-            continue
-        else:
-          try:
-            tagValue = float(tagValueStr)
-          except:
-            continue
-
-        try:
-          tagValue2FileList[tagValue].append(file)
-        except:
-          tagValue2FileList[tagValue] = [file]
-
-    # iterate over the parsed items and decide which ones can qualify as mv
-    for frameTag in consideredTags:
-
-      try:
-        tagValue2FileList = tag2ValueFileList[frameTag]
-      except:
-        # didn't find the tag
-        continue
-
-      if len(tagValue2FileList)<2:
-        # not enough frames for this tag to be a multivolume
-        continue
-
-      tagValues = sorted(tagValue2FileList.keys())
+    headerTable = self.getHeaderTable(files)
+    groups, rejections = self.frameTagGroups(files, consideredTags)
 
-      # Check if the number of frames is the same in each volume
-      slicesPerFrame = {}  # key: number of slices, value: list of tagValue values that has this many slices
-      for tagValue in tagValues:
-        numberOfSlices = len(tagValue2FileList[tagValue])
-        if numberOfSlices in slicesPerFrame.keys():
-          slicesPerFrame[numberOfSlices].append(tagValue)
-        else:
-          slicesPerFrame[numberOfSlices] = [tagValue]
+    if self.detailedLogging:
+      seriesNumber = headerTable.value(files[-1], 'seriesNumber')
+      seriesDescription = headerTable.value(files[-1], 'seriesDescription')
+      seriesInstanceUid = headerTable.value(files[-1], 'seriesInstanceUID')
+      for frameTag, reason in rejections:
+        logging.debug(f"MultiVolumeImporterPlugin: series {seriesNumber}: {seriesDescription} ({seriesInstanceUid})"
+          f" is not accepted as multi-volume grouped by {frameTag} because {reason}")
 
-      if self.detailedLogging:
-        seriesNumber = slicer.dicomDatabase.fileValue(file, self.tags['seriesNumber'])
-        seriesDescription = slicer.dicomDatabase.fileValue(file, self.tags['seriesDescription'])
-        seriesInstanceUid = slicer.dicomDatabase.fileValue(file, self.tags['seriesInstanceUID'])
-        msg = f"MultiVolumeImporterPlugin: series {seriesNumber}: {seriesDescription} ({seriesInstanceUid})"
-        msg += f" is not accepted as multi-volume grouped by {frameTag} because "
-
-      if len(slicesPerFrame) > 1:
-        # We only accept volumes that has the same number of slices per frame.
-        # There are multiple different slicesPerFrame values, therefore it is rejected.
-        if self.detailedLogging:
-          msg +="number of slices varies across frames."
-          for numberOfSlices in slicesPerFrame:
-            msg += f"{numberOfSlices} slices are found for {frameTag}={slicesPerFrame[numberOfSlices]}."
-          logging.debug(msg)
-        continue
-
-      # Do basic check: same orientation, not repeated slice positions
-      geometryValid = True
-      for tagValue in tagValues:
-        imagePositions = set()  # must be different for each slice
-        imageOrientations = set()  # must be the same for each slice
-        frameFileList = tagValue2FileList[tagValue]
-        for file in frameFileList:
-          imagePositions.add(slicer.dicomDatabase.fileValue(file, self.tags['position']))
-          imageOrientations.add(slicer.dicomDatabase.fileValue(file, self.tags['orientation']))
-        if len(imagePositions) != len(frameFileList):
-          if self.detailedLogging:
-            msg +=  "there are multiple frames at the same position within a frame."
-            logging.debug(msg)
-          geometryValid = False
-          break
-        if len(imageOrientations) != 1:
-          if self.detailedLogging:
-            msg +=  "orientation of slices are not the same within a frame."
-            logging.debug(msg)
-          geometryValid = False
-          break
-      if not geometryValid:
-        continue
+    # iterate over the frame groups that passed the geometry checks, each one can qualify as mv
+    for frameTag, frameFileLists, frameLabels in groups:
 
       # TODO: We could do some more checks here and if acquisition geometry is complicated (varying slice spacing,
       # dimensions, etc.) then reduce the confidence value or do not offer a loadable at all.
@@ -940,45 +1453,29 @@ class MultiVolumeImporterPluginClass(DICOMPlugin):
       # now this looks like a serious mv!
 
       # initialize the needed attributes for a new mvNode
-      frameFileListStr = ""
-      frameLabelsStr = ""
-      frameLabelsArray = vtk.vtkDoubleArray()
-      tagValue0 = tagValues[0]
-      for tagValue in tagValues:
-        frameFileList = tagValue2FileList[tagValue]
-        for file in frameFileList:
-          frameFileListStr = frameFileListStr+file+','
-
-        # if mv was parsed by series time, probably makes sense to start from 0
-        if frameTag == 'SeriesTime' or frameTag == 'AcquisitionTime' or frameTag == 'ContentTime':
-          frameLabelsArray.InsertNextValue(tagValue-tagValue0)
-          frameLabelsStr = frameLabelsStr+str(tagValue-tagValue0)+','
-        else:
-          frameLabelsArray.InsertNextValue(tagValue)
-          frameLabelsStr = frameLabelsStr+str(tagValue)+','
-
-      frameFileListStr = frameFileListStr[:-1]
-      frameLabelsStr = frameLabelsStr[:-1]
+      frameIndex = FrameIndex(frameFileLists, frameLabels)
+      frameFileList = frameFileLists[-1]
 
       mvNode = slicer.mrmlScene.CreateNodeByClass('vtkMRMLMultiVolumeNode')
       mvNode.UnRegister(None)
-      mvNode.SetAttribute("MultiVolume.FrameLabels",frameLabelsStr)
+      mvNode.SetAttribute("MultiVolume.FrameLabels",frameIndex.labelsAttribute())
       mvNode.SetAttribute("MultiVolume.FrameIdentifyingDICOMTagName",frameTag)
-      mvNode.SetAttribute('MultiVolume.NumberOfFrames',str(len(tagValue2FileList)))
+      mvNode.SetAttribute('MultiVolume.NumberOfFrames',str(len(frameFileLists)))
       mvNode.SetAttribute('MultiVolume.FrameIdentifyingDICOMTagUnits',self.multiVolumeTagsUnits[frameTag])
       # keep the files in the order by the detected tag
       # files are not ordered within the individual frames -- this will be
       # done by ScalarVolumePlugin later
-      mvNode.SetAttribute('MultiVolume.FrameFileList', frameFileListStr)
+      mvNode.SetAttribute('MultiVolume.FrameFileList', frameIndex.fileListAttribute())
 
-      mvNode.SetNumberOfFrames(len(tagValue2FileList))
+      mvNode.SetNumberOfFrames(len(frameFileLists))
       mvNode.SetLabelName(self.multiVolumeTagsUnits[frameTag])
-      mvNode.SetLabelArray(frameLabelsArray)
+      mvNode.SetLabelArray(self.frameLabelsArray(frameIndex))
 
       self.addAcquisitionAttributes(mvNode, frameFileList)
 
       # add the node
       multivolumes.append(mvNode)
+      self.frameIndices[mvNode] = frameIndex
 
     return multivolumes
 
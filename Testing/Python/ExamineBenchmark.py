@@ -0,0 +1,227 @@
+"""
+Measure how examining multivolume series scales with the number of
+instances, using synthetic DICOM headers: N series x F frames x S slices,
+the frames of each series separated by one of several frame identifying
+tags (TriggerTime, AcquisitionTime, vendor B-value tags,
+TemporalPositionIdentifier, CardiacCycle).
+
+The headers are served by an in-memory stand-in for slicer.dicomDatabase,
+no files are needed. In the default 'examine' mode the whole
+MultiVolumeImporterPluginClass.examine() is run, which needs Slicer:
+
+  Slicer --no-main-window --python-script ExamineBenchmark.py --instances 1000 10000 100000
+
+The 'grouping' mode only runs the header table and the Slicer independent
+grouping of the files (FrameGrouping.groupSeries), with plain Python:
+
+  python ExamineBenchmark.py --mode grouping --instances 1000 10000 100000
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+# frame identifying tags used by the synthetic series, cycled over the series
+FRAME_KINDS = ['TriggerTime', 'AcquisitionTime', 'GE.B-value', 'Siemens.B-value', 'Philips.B-value',
+  'TemporalPositionIdentifier', 'CardiacCycle']
+
+
+def tm(seconds):
+  """ DICOM TM string of a time of day given in seconds.
+  """
+  hours, remainder = divmod(seconds, 3600)
+  minutes, seconds = divmod(remainder, 60)
+  return f'{int(hours):02d}{int(minutes):02d}{seconds:09.6f}'
+
+
+class StandInDatabase:
+  """ In-memory replacement of the parts of ctkDICOMDatabase that examine() uses.
+  Header values are generated for the synthetic files, fileValue() calls are counted.
+  """
+
+  def __init__(self):
+    self.values = {}  # file: {tag: value}
+    self.instances = {}
+    self.series = {}
+    self.fileValueCalls = 0
+
+  def addSeries(self, seriesNumber, kind, numberOfFrames, numberOfSlices):
+    seriesInstanceUID = f'1.2.826.0.1.3680043.2.1125.{seriesNumber}'
+    files = []
+    for frameNumber in range(numberOfFrames):
+      for sliceNumber in range(numberOfSlices):
+        instanceNumber = frameNumber * numberOfSlices + sliceNumber + 1
+        f = f'/standin/{seriesNumber}/{instanceNumber}.dcm'
+        values = {
+          '0020,000E': seriesInstanceUID,
+          '0008,103E': f'{kind} series',
+          '0008,0018': f'{seriesInstanceUID}.{instanceNumber}',
+          '0008,0016': '1.2.840.10008.5.1.4.1.1.4',
+          '0020,0032': f'-120\\-120\\{sliceNumber * 2.5:g}',
+          '0020,0037': '1\\0\\0\\0\\1\\0',
+          '0008,1030': 'Benchmark study',
+          '0020,0011': str(seriesNumber),
+          '0020,0013': str(instanceNumber),
+          '0008,0060': 'MR',
+          '0028,0030': '0.9375\\0.9375',
+          '0028,0010': '256',
+          '0028,0011': '256',
+          '0028,0100': '16',
+          '0028,0002': '1',
+          '0028,0004': 'MONOCHROME2',
+          '0018,0081': '30',
+          '0018,0080': '2000',
+          '0018,1314': '90',
+          '0008,0031': tm(36000),
+          '0008,0032': tm(36000),
+          '0008,0033': tm(36000),
+          '7fe0,0010': 'pixels',
+          }
+        if kind == 'TriggerTime':
+          values['0018,1060'] = str(frameNumber * 50)
+        elif kind == 'AcquisitionTime':
+          values['0008,0032'] = tm(36000 + frameNumber * 2.5)
+        elif kind == 'GE.B-value':
+          values['0043,1039'] = f'{1000000000 + frameNumber * 100}\\8\\0\\0'
+        elif kind == 'Siemens.B-value':
+          values['0019,100c'] = str(frameNumber * 100)
+        elif kind == 'Philips.B-value':
+          values['2001,1003'] = str(frameNumber * 100)
+        elif kind == 'TemporalPositionIdentifier':
+          values['0020,0100'] = str(frameNumber + 1)
+        elif kind == 'CardiacCycle':
+          values['0018,0022'] = f'TP{frameNumber * 10}PC0965\\PULSTART_P0020PC\\PULSEND_P0080PC'
+        self.values[f] = values
+        self.instances[f] = values['0008,0018']
+        self.series[f] = seriesInstanceUID
+        files.append(f)
+    return files
+
+  def fileValue(self, f, tag):
+    self.fileValueCalls += 1
+    return self.values[f].get(tag, '')
+
+  def instanceForFile(self, f):
+    return self.instances[f]
+
+  def seriesForFile(self, f):
+    return self.series[f]
+
+
+def syntheticSeries(numberOfInstances, numberOfFrames, numberOfSlices, kinds):
+  """ Stand-in database and file lists (one per series) of about numberOfInstances instances.
+  """
+  database = StandInDatabase()
+  numberOfSeries = max(1, round(numberOfInstances / (numberOfFrames * numberOfSlices)))
+  fileLists = [database.addSeries(seriesNumber + 1, kinds[seriesNumber % len(kinds)], numberOfFrames, numberOfSlices)
+    for seriesNumber in range(numberOfSeries)]
+  return database, fileLists
+
+
+def examineRunner(processes):
+  """ Run MultiVolumeImporterPluginClass.examine() on the stand-in database. Needs Slicer.
+  """
+  import qt
+  import slicer
+  from MultiVolumeImporterPlugin import MultiVolumeImporterPluginClass
+
+  def run(database, fileLists):
+    settings = qt.QSettings()
+    savedSettings = {key: settings.value(key) for key in ['DICOM/MultiVolumeExamineProcesses', 'DICOM/MultiVolumeExamineCache']}
+    savedDatabase = slicer.dicomDatabase
+    settings.setValue('DICOM/MultiVolumeExamineProcesses', processes)
+    settings.setValue('DICOM/MultiVolumeExamineCache', False)
+    slicer.dicomDatabase = database
+    try:
+      loadables = MultiVolumeImporterPluginClass().examine(fileLists)
+    finally:
+      slicer.dicomDatabase = savedDatabase
+      for key, value in savedSettings.items():
+        if value is None:
+          settings.remove(key)
+        else:
+          settings.setValue(key, value)
+    return len(loadables)
+
+  return run
+
+
+def groupingRunner():
+  """ Read the headers and group the files of each series, without Slicer.
+  """
+  from MultiVolumeImporterLib import FrameGrouping
+  from MultiVolumeImporterLib.HeaderTable import HeaderTable
+
+  # the tags the plugin reads, see MultiVolumeImporterPluginClass.__init__
+  frameTags = {
+    'TriggerTime': '0018,1060', 'EchoTime': '0018,0081', 'FlipAngle': '0018,1314', 'RepetitionTime': '0018,0080',
+    'AcquisitionTime': '0008,0032', 'SeriesTime': '0008,0031', 'ContentTime': '0008,0033',
+    'CardiacCycle': '0018,0022', 'NominalPercentageOfCardiacPhase': '0020,9241',
+    'Siemens.B-value': '0019,100c', 'GE.B-value': '0043,1039', 'TemporalPositionIdentifier': '0020,0100',
+    'Philips.B-value': '2001,1003', 'Standard.B-value': '0018,9087', 'DeltaStartTime': '0043,101e',
+    }
+  tags = {
+    'seriesInstanceUID': '0020,000E', 'seriesDescription': '0008,103E', 'instanceUID': '0008,0018',
+    'position': '0020,0032', 'orientation': '0020,0037', 'studyDescription': '0008,1030',
+    'seriesNumber': '0020,0011', 'instanceNumber': '0020,0013', 'repetitionTime': '0018,0080',
+    'modality': '0008,0060', 'pixelSpacing': '0028,0030', 'rows': '0028,0010', 'columns': '0028,0011',
+    'bitsAllocated': '0028,0100', 'rescaleSlope': '0028,1053', 'rescaleIntercept': '0028,1052',
+    }
+  tags.update(frameTags)
+
+  def run(database, fileLists):
+    headerTable = HeaderTable([f for files in fileLists for f in files], tags, database)
+    numberOfGroups = 0
+    for files in fileLists:
+      seriesGroups = FrameGrouping.groupSeries(files, headerTable, list(frameTags), 0.01)
+      numberOfGroups += sum(len(groups) for _, groups, _ in seriesGroups.subseries)
+    return numberOfGroups
+
+  return run
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--mode', choices=['examine', 'grouping'], default='examine', help='what is measured')
+  parser.add_argument('--instances', type=int, nargs='+', default=[1000, 3000, 10000, 30000, 100000],
+    help='total number of instances of each run')
+  parser.add_argument('--frames', type=int, default=20, help='frames per series')
+  parser.add_argument('--slices', type=int, default=25, help='slices per frame')
+  parser.add_argument('--kinds', nargs='+', choices=FRAME_KINDS, default=FRAME_KINDS, help='frame identifying tags of the series')
+  parser.add_argument('--processes', type=int, default=1, help='examine worker processes (examine mode)')
+  parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best one is reported')
+  args = parser.parse_args(argv)
+
+  run = examineRunner(args.processes) if args.mode == 'examine' else groupingRunner()
+
+  print(f'{args.mode}: {args.frames} frames x {args.slices} slices per series, frame tags {", ".join(args.kinds)}')
+  print(f'{"instances":>10} {"series":>7} {"found":>6} {"seconds":>9} {"instances/s":>12} {"fileValue/inst":>15} {"scaling":>8}')
+  previous = None
+  for numberOfInstances in args.instances:
+    elapsed = []
+    for _ in range(args.repeat):
+      database, fileLists = syntheticSeries(numberOfInstances, args.frames, args.slices, args.kinds)
+      startTime = time.perf_counter()
+      found = run(database, fileLists)
+      elapsed.append(time.perf_counter() - startTime)
+    instances = sum(len(files) for files in fileLists)
+    seconds = min(elapsed)
+    # exponent of the growth of the time with the number of instances since the previous run (1 is linear)
+    scaling = ''
+    if previous and instances != previous[0] and seconds > 0 and previous[1] > 0:
+      scaling = f'{math.log(seconds / previous[1]) / math.log(instances / previous[0]):.2f}'
+    print(f'{instances:>10} {len(fileLists):>7} {found:>6} {seconds:>9.3f} {instances / seconds:>12.0f}'
+      f' {database.fileValueCalls / instances:>15.1f} {scaling:>8}')
+    previous = (instances, seconds)
+
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
+  if 'slicer' in sys.modules:
+    import slicer
+    if slicer.app.commandOptions().noMainWindow:
+      slicer.util.exit(0)
@@ -0,0 +1,106 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from MultiVolumeImporterLib.ExamineCache import ExamineCache
+
+
+class ExamineCacheTest(unittest.TestCase):
+  """ Keys of the examine cache change with anything the examine results depend on,
+  and the least recently used entries are removed.
+  """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp(prefix='ExamineCacheTest-')
+
+  def tearDown(self):
+    shutil.rmtree(self.directory, ignore_errors=True)
+
+  def writeFile(self, name, content, mtime=None):
+    path = os.path.join(self.directory, name)
+    with open(path, 'w') as f:
+      f.write(content)
+    if mtime is not None:
+      os.utime(path, (mtime, mtime))
+    return path
+
+  def parameters(self, **changes):
+    parameters = {'source': 'digest', 'epsilon': 0.01, 'multiVolumeTags': {'TriggerTime': '0018,1060'},
+      'multiseriesFrameTags': ['SeriesTime', 'AcquisitionTime']}
+    parameters.update(changes)
+    return parameters
+
+  def test_fingerprint(self):
+    files = [self.writeFile(f'{i}.dcm', 'data', mtime=1000) for i in range(3)]
+    instanceUIDs = {f: f'1.2.{i}' for i, f in enumerate(files)}
+    fingerprint = ExamineCache.fingerprint([files], instanceUIDs)
+    self.assertEqual(ExamineCache.fingerprint([files], dict(instanceUIDs)), fingerprint)
+
+    # removed, added and modified files, other instance UIDs and another grouping of the files
+    self.assertNotEqual(ExamineCache.fingerprint([files[:2]], instanceUIDs), fingerprint)
+    newFile = self.writeFile('3.dcm', 'data', mtime=1000)
+    self.assertNotEqual(ExamineCache.fingerprint([files + [newFile]], instanceUIDs), fingerprint)
+    self.assertNotEqual(ExamineCache.fingerprint([files], dict(instanceUIDs, **{files[0]: '1.2.9'})), fingerprint)
+    self.assertNotEqual(ExamineCache.fingerprint([files[:1], files[1:]], instanceUIDs), fingerprint)
+    os.utime(files[1], (2000, 2000))
+    self.assertNotEqual(ExamineCache.fingerprint([files], instanceUIDs), fingerprint)
+
+    os.remove(files[2])
+    self.assertIsNone(ExamineCache.fingerprint([files], instanceUIDs))
+
+  def test_key(self):
+    key = ExamineCache.key(['1.2.3', '1.2.4'], 'fingerprint', self.parameters())
+    # the order of the series and of the parameters does not matter
+    self.assertEqual(ExamineCache.key(['1.2.4', '1.2.3'], 'fingerprint', dict(reversed(list(self.parameters().items())))), key)
+
+    otherKeys = [
+      ExamineCache.key(['1.2.3'], 'fingerprint', self.parameters()),
+      ExamineCache.key(['1.2.3', '1.2.4'], 'otherFingerprint', self.parameters()),
+      ExamineCache.key(['1.2.3', '1.2.4'], 'fingerprint', self.parameters(epsilon=0.001)),
+      ExamineCache.key(['1.2.3', '1.2.4'], 'fingerprint', self.parameters(multiVolumeTags={'EchoTime': '0018,0081'})),
+      ExamineCache.key(['1.2.3', '1.2.4'], 'fingerprint', self.parameters(multiseriesFrameTags=['SeriesTime'])),
+      ExamineCache.key(['1.2.3', '1.2.4'], 'fingerprint', self.parameters(source='otherDigest')),
+      ]
+    self.assertEqual(len(set(otherKeys + [key])), len(otherKeys) + 1)
+
+  def test_sourceDigest(self):
+    paths = [self.writeFile('a.py', 'a = 1\n', mtime=1000), self.writeFile('b.py', 'b = 1\n', mtime=1000)]
+    digest = ExamineCache.sourceDigest(paths)
+    self.assertEqual(ExamineCache.sourceDigest(paths), digest)
+    self.writeFile('b.py', 'b = 2\n', mtime=2000)
+    self.assertNotEqual(ExamineCache.sourceDigest(paths), digest)
+    self.assertIsNone(ExamineCache.sourceDigest(paths + [os.path.join(self.directory, 'missing.py')]))
+
+  def test_getPut(self):
+    cache = ExamineCache(os.path.join(self.directory, 'cache'))
+    key = ExamineCache.key(['1.2.3'], 'fingerprint', self.parameters())
+    self.assertIsNone(cache.get(key))
+    cache.put(key, [{'name': 'loadable'}])
+    self.assertEqual(cache.get(key), [{'name': 'loadable'}])
+    self.assertIsNone(cache.get(ExamineCache.key(['1.2.3'], 'fingerprint', self.parameters(epsilon=0.001))))
+
+  def test_prune(self):
+    cache = ExamineCache(os.path.join(self.directory, 'cache'))
+    numberOfEntries = cache.maximumEntries + 5
+    keys = [f'entry{i}' for i in range(numberOfEntries)]
+    os.makedirs(cache.directory)
+    for i, key in enumerate(keys):
+      # put() prunes as well, so the entries are written directly
+      with open(cache.entryPath(key), 'w') as f:
+        json.dump({'version': ExamineCache.VERSION, 'loadables': []}, f)
+      os.utime(cache.entryPath(key), (1000 + i, 1000 + i))
+    # the oldest entry is used now
+    self.assertEqual(cache.get(keys[0]), [])
+
+    cache.prune()
+    remaining = sorted(name[:-len('.json')] for name in os.listdir(cache.directory))
+    self.assertEqual(len(remaining), 500)
+    self.assertEqual(remaining, sorted([keys[0]] + keys[6:]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+"""
+Compare the strided per-frame copy (mvImageArray.T[frame] = frameArray)
+with the blocked FrameAssembler when assembling a multivolume.
+
+Only NumPy is needed, e.g.:
+
+  python FrameAssemblyBenchmark.py --size 512 512 200 --frames 80
+
+Note that the multivolume and the frames must fit in memory
+(512x512x200x80 16-bit voxels are about 8 GB).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from MultiVolumeImporterLib.FrameAssembler import FrameAssembler
+
+
+def assembleStrided(mvImageArray, frames):
+  for frameNumber, frameArray in enumerate(frames):
+    mvImageArray.T[frameNumber] = frameArray
+
+
+def assembleBlocked(mvImageArray, frames, batchSize, blockSize):
+  assembler = FrameAssembler(mvImageArray, batchSize, blockSize)
+  for frameNumber, frameArray in enumerate(frames):
+    assembler.addFrame(frameNumber, frameArray)
+  assembler.flush()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument('--size', type=int, nargs=3, default=[256, 256, 100], help='frame size (columns rows slices)')
+  parser.add_argument('--frames', type=int, default=40, help='number of frames')
+  parser.add_argument('--dtype', default='int16', help='voxel type')
+  parser.add_argument('--batch-size', type=int, default=16, help='frames per batch of the blocked assembler')
+  parser.add_argument('--block-size', type=int, default=1<<14, help='voxels per block of the blocked assembler')
+  parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best one is reported')
+  args = parser.parse_args()
+
+  numberOfVoxels = int(np.prod(args.size))
+  frames = [np.full(numberOfVoxels, frameNumber, dtype=args.dtype) for frameNumber in range(args.frames)]
+  mvImageArray = np.zeros((numberOfVoxels, args.frames), dtype=args.dtype)
+  megabytes = mvImageArray.nbytes / 1024 / 1024
+
+  print(f'{args.frames} frames of {args.size} {args.dtype} voxels ({megabytes:.0f} MB)')
+  for name, assemble in [
+      ('strided', lambda: assembleStrided(mvImageArray, frames)),
+      ('blocked', lambda: assembleBlocked(mvImageArray, frames, args.batch_size, args.block_size))]:
+    elapsed = []
+    for _ in range(args.repeat):
+      mvImageArray[...] = 0
+      startTime = time.perf_counter()
+      assemble()
+      elapsed.append(time.perf_counter() - startTime)
+    assert all((mvImageArray[:, frameNumber] == frameNumber).all() for frameNumber in range(args.frames))
+    print(f'{name}: {min(elapsed):.3f} sec ({megabytes / min(elapsed):.0f} MB/sec)')
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,201 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from MultiVolumeImporterLib import FrameGrouping
+from MultiVolumeImporterLib.HeaderTable import HeaderTable
+
+TAGS = {
+  'seriesInstanceUID': '0020,000E', 'position': '0020,0032', 'orientation': '0020,0037',
+  'instanceNumber': '0020,0013', 'repetitionTime': '0018,0080',
+  'AcquisitionTime': '0008,0032', 'TriggerTime': '0018,1060',
+  }
+
+FRAME_TAGS = ['TriggerTime', 'AcquisitionTime']
+
+
+class Database:
+  """ Header values of the files, with the fileValue() of ctkDICOMDatabase.
+  """
+
+  def __init__(self):
+    self.headers = {}
+
+  def fileValue(self, f, tag):
+    return self.headers[f].get(tag, '')
+
+  def set(self, f, tagName, value):
+    self.headers[f][TAGS[tagName]] = value
+
+
+def seriesDatabase(numberOfFrames=3, numberOfSlices=4):
+  """ Headers of a series of numberOfFrames frames of numberOfSlices slices,
+  separated by TriggerTime and AcquisitionTime. Returns the database and the
+  file lists of the frames.
+  """
+  database = Database()
+  frameFileLists = []
+  for frameNumber in range(numberOfFrames):
+    frameFileList = []
+    for sliceNumber in range(numberOfSlices):
+      f = f'frame{frameNumber}-slice{sliceNumber}.dcm'
+      database.headers[f] = {
+        TAGS['seriesInstanceUID']: '1.2.3',
+        TAGS['position']: f'-100\\-100\\{sliceNumber * 2.5:g}',
+        TAGS['orientation']: '1\\0\\0\\0\\1\\0',
+        TAGS['instanceNumber']: str(frameNumber * numberOfSlices + sliceNumber + 1),
+        TAGS['repetitionTime']: '2000',
+        TAGS['AcquisitionTime']: f'1000{frameNumber:02d}.5',
+        TAGS['TriggerTime']: str(frameNumber * 100),
+        }
+      frameFileList.append(f)
+    frameFileLists.append(frameFileList)
+  return database, frameFileLists
+
+
+def allFiles(frameFileLists):
+  return [f for frameFileList in frameFileLists for f in frameFileList]
+
+
+class FrameGroupingTest(unittest.TestCase):
+  """ Grouping of the files of a series into frames from small hand-built header tables.
+  """
+
+  def tagGroups(self, database, files, epsilon=0.01):
+    headerTable = HeaderTable(files, TAGS, database)
+    partition = FrameGrouping.tagPartition(files, headerTable, FRAME_TAGS)
+    groups, rejections = FrameGrouping.tagGroups(files, headerTable, partition, epsilon)
+    return {group.frameTag: group for group in groups}, dict(rejections)
+
+  def test_tagGroups(self):
+    database, frameFileLists = seriesDatabase()
+    groups, rejections = self.tagGroups(database, allFiles(frameFileLists))
+    self.assertEqual(rejections, {})
+    self.assertEqual(sorted(groups), sorted(FRAME_TAGS))
+    self.assertEqual(groups['TriggerTime'].frameFileLists, frameFileLists)
+    np.testing.assert_allclose(groups['TriggerTime'].frameLabels, [0, 100, 200])
+    # time labels start from 0
+    self.assertEqual(groups['AcquisitionTime'].frameFileLists, frameFileLists)
+    np.testing.assert_allclose(groups['AcquisitionTime'].frameLabels, [0, 1000, 2000])
+
+  def test_singleValueIsNotAFrameTag(self):
+    database, frameFileLists = seriesDatabase()
+    for f in allFiles(frameFileLists):
+      database.set(f, 'TriggerTime', '0')
+    groups, rejections = self.tagGroups(database, allFiles(frameFileLists))
+    self.assertEqual(sorted(groups), ['AcquisitionTime'])
+    self.assertEqual(rejections, {})
+
+  def test_varyingSliceCountIsRejected(self):
+    database, frameFileLists = seriesDatabase()
+    files = allFiles(frameFileLists)[:-1]
+    groups, rejections = self.tagGroups(database, files)
+    self.assertEqual(groups, {})
+    self.assertTrue(rejections['TriggerTime'].startswith("number of slices varies across frames."))
+    self.assertIn("3 slices are found for TriggerTime=[200.0]", rejections['TriggerTime'])
+
+  def test_repeatedPositionIsRejected(self):
+    database, frameFileLists = seriesDatabase()
+    # within epsilon of the position of the first slice
+    database.set(frameFileLists[1][1], 'position', '-100\\-100\\0.001')
+    groups, rejections = self.tagGroups(database, allFiles(frameFileLists))
+    self.assertEqual(rejections['TriggerTime'], "there are multiple frames at the same position within a frame.")
+    # not a repeated position with a smaller epsilon
+    groups, rejections = self.tagGroups(database, allFiles(frameFileLists), epsilon=0.0001)
+    self.assertEqual(rejections, {})
+
+  def test_inconsistentOrientationIsRejected(self):
+    database, frameFileLists = seriesDatabase()
+    database.set(frameFileLists[2][3], 'orientation', '0\\1\\0\\1\\0\\0')
+    groups, rejections = self.tagGroups(database, allFiles(frameFileLists))
+    self.assertEqual(rejections['TriggerTime'], "orientation of slices are not the same within a frame.")
+
+  def test_unparsableValueIsNotAssigned(self):
+    database, frameFileLists = seriesDatabase()
+    files = allFiles(frameFileLists)
+    database.set(frameFileLists[0][0], 'TriggerTime', 'n/a')
+    headerTable = HeaderTable(files, TAGS, database)
+    partition = FrameGrouping.tagPartition(files, headerTable, FRAME_TAGS)
+    self.assertIn('TriggerTime', partition.consideredTags)
+    self.assertNotIn(frameFileLists[0][0], allFiles(partition.tagValue2FileLists['TriggerTime'].values()))
+    self.assertEqual(partition.tagValue2FileLists['TriggerTime'][0.0], frameFileLists[0][1:])
+
+  def test_missingValueDropsTag(self):
+    database, frameFileLists = seriesDatabase()
+    files = allFiles(frameFileLists)
+    database.set(frameFileLists[0][0], 'TriggerTime', '')
+    headerTable = HeaderTable(files, TAGS, database)
+    partition = FrameGrouping.tagPartition(files, headerTable, FRAME_TAGS)
+    self.assertEqual(partition.consideredTags, ['AcquisitionTime'])
+
+  def test_positionPartition(self):
+    database, frameFileLists = seriesDatabase()
+    # files in slice order, frames are ordered by time at each position
+    files = [frameFileList[sliceNumber] for sliceNumber in range(4) for frameFileList in reversed(frameFileLists)]
+    headerTable = HeaderTable(files, TAGS, database)
+    for timeTag in ('AcquisitionTime', 'instanceNumber'):
+      partition = FrameGrouping.positionPartition(files, headerTable, timeTag)
+      self.assertEqual(FrameGrouping.positionFrameFileLists(partition), frameFileLists, timeTag)
+
+  def test_positionPartitionUnparsableTime(self):
+    database, frameFileLists = seriesDatabase()
+    files = allFiles(frameFileLists)
+    database.set(frameFileLists[1][2], 'AcquisitionTime', 'xx0000')
+    headerTable = HeaderTable(files, TAGS, database)
+    partition = FrameGrouping.positionPartition(files, headerTable, 'AcquisitionTime')
+    self.assertNotIn(frameFileLists[1][2], partition.files)
+    # one position has fewer frames than the others
+    self.assertIsNone(FrameGrouping.positionFrameFileLists(partition))
+
+  def test_positionPartitionSingleFrame(self):
+    database, frameFileLists = seriesDatabase(numberOfFrames=1)
+    files = allFiles(frameFileLists)
+    headerTable = HeaderTable(files, TAGS, database)
+    self.assertIsNone(FrameGrouping.positionFrameFileLists(FrameGrouping.positionPartition(files, headerTable, 'instanceNumber')))
+
+
+class IncrementalGroupingTest(unittest.TestCase):
+  """ Grouping of a series whose files are added in several steps (incremental examine)
+  must give the same groups as grouping all files from scratch.
+  """
+
+  @staticmethod
+  def comparable(groups, rejections):
+    return ([(group.frameTag, group.frameFileLists, group.frameLabels.tolist()) for group in groups], rejections)
+
+  def test_addFiles(self):
+    database, frameFileLists = seriesDatabase(numberOfFrames=5, numberOfSlices=6)
+    # two slices of the last frame are 0.005 apart: a repeated position with the default epsilon only
+    database.set(frameFileLists[4][1], 'position', '-100\\-100\\0.005')
+    # the files arrive slice by slice, after every 5 files all frames have the same number of slices
+    files = [frameFileList[sliceNumber] for sliceNumber in range(6) for frameFileList in frameFileLists]
+
+    steps = [(5, 0.01), (10, 0.01), (10, 0.001), (13, 0.001), (20, 0.001), (25, 0.01), (30, 0.01), (30, 0.001)]
+    headerTable = HeaderTable([], TAGS, database)
+    tagPartition = None
+    positionPartition = None
+    for numberOfFiles, epsilon in steps:
+      addedFiles = files[:numberOfFiles]
+      headerTable.addFiles(addedFiles, database)
+      tagPartition = FrameGrouping.tagPartition(addedFiles, headerTable, FRAME_TAGS, tagPartition)
+      positionPartition = FrameGrouping.positionPartition(addedFiles, headerTable, 'AcquisitionTime', positionPartition)
+      groups, rejections = FrameGrouping.tagGroups(addedFiles, headerTable, tagPartition, epsilon)
+
+      seriesGroups = FrameGrouping.groupSeries(addedFiles, HeaderTable(addedFiles, TAGS, database), FRAME_TAGS, epsilon)
+      (_, expectedGroups, expectedRejections), = seriesGroups.subseries
+      step = f'{numberOfFiles} files, epsilon {epsilon}'
+      self.assertEqual(self.comparable(groups, rejections), self.comparable(expectedGroups, expectedRejections), step)
+      self.assertEqual(FrameGrouping.positionFrameFileLists(positionPartition), seriesGroups.acquisitionTimeFrames, step)
+
+    # all files: the repeated position is only accepted with the smaller epsilon
+    self.assertEqual(rejections, [])
+    self.assertEqual([len(group.frameFileLists) for group in groups], [5, 5])
+    groups, rejections = FrameGrouping.tagGroups(files, headerTable, tagPartition, 0.01)
+    self.assertEqual([frameTag for frameTag, _ in rejections], FRAME_TAGS)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from MultiVolumeImporterLib import ValueParsing
+
+
+class ValueParsingTest(unittest.TestCase):
+  """ Column parsers of the frame identifying tags: the fast NumPy path and the
+  value by value fallback must give the same values as the scalar conversions.
+  """
+
+  def assertParsed(self, parsed, expectedValues, expectedValid):
+    values, valid = parsed
+    np.testing.assert_array_equal(valid, expectedValid)
+    np.testing.assert_allclose(values[valid], np.array(expectedValues, dtype=np.float64)[np.array(expectedValid)])
+    self.assertTrue(np.isnan(values[~valid]).all())
+
+  def test_tm2ms(self):
+    self.assertEqual(ValueParsing.tm2ms(''), 0)
+    self.assertEqual(ValueParsing.tm2ms('12345'), 0)
+    self.assertEqual(ValueParsing.tm2ms('120000'), 12*60*60*1000.)
+    self.assertAlmostEqual(ValueParsing.tm2ms('101530.25'), (10*60*60+15*60+30.25)*1000.)
+    self.assertAlmostEqual(ValueParsing.tm2ms('1015.5'), (10*60*60+15*60+0.5)*1000.)
+    self.assertAlmostEqual(ValueParsing.tm2ms('235959.999999'), (23*60*60+59*60+59.999999)*1000.)
+    with self.assertRaises(OSError):
+      ValueParsing.tm2ms('12:00:00')
+
+  def test_parseTM(self):
+    strings = ['120000', '101530.25', '1015.5', '10.500', '1234', '', '235959.999999',
+      '1 0000', '12:00:00', 'xx0000', '120000.5.3']
+    values, valid = ValueParsing.parseTM(strings)
+    for string, value, isValid in zip(strings, values, valid):
+      try:
+        expected = ValueParsing.tm2ms(string)
+      except (OSError, ValueError):
+        self.assertFalse(isValid, string)
+        self.assertTrue(np.isnan(value), string)
+        continue
+      self.assertTrue(isValid, string)
+      self.assertAlmostEqual(value, expected, msg=string)
+    # short strings are 0 like in tm2ms, not invalid
+    np.testing.assert_array_equal(valid, [True]*8 + [False, False, True])
+
+  def test_parseTM_empty(self):
+    values, valid = ValueParsing.parseTM([])
+    self.assertEqual(len(values), 0)
+    self.assertEqual(len(valid), 0)
+
+  def test_parseDecimals(self):
+    self.assertParsed(ValueParsing.parseDecimals(['1.5', '2', '-3e2']), [1.5, 2, -300], [True, True, True])
+    self.assertParsed(ValueParsing.parseDecimals(['1.5', 'abc', '', ' 7 ']), [1.5, 0, 0, 7], [True, False, False, True])
+
+  def test_parseIntegers(self):
+    self.assertParsed(ValueParsing.parseIntegers(['1', '20', '-3']), [1, 20, -3], [True, True, True])
+    self.assertParsed(ValueParsing.parseIntegers(['1', '2.5', '']), [1, 0, 0], [True, False, False])
+
+  def test_parseMultiValued(self):
+    values, valid = ValueParsing.parseMultiValued(['1\\2\\3', '1\\2', 'a\\b\\c', '', '-1.5\\0\\2e1'], 3)
+    np.testing.assert_array_equal(valid, [True, False, False, False, True])
+    np.testing.assert_allclose(values[valid], [[1, 2, 3], [-1.5, 0, 20]])
+    self.assertTrue(np.isnan(values[~valid]).all())
+
+  def test_parseGEBValue(self):
+    self.assertParsed(ValueParsing.parseGEBValue(['1000001250\\8\\0\\0', '1000\\8\\0\\0', '500', 'x\\8', '']),
+      [1250, 1000, 500, 0, 0], [True, True, True, False, False])
+
+  def test_parseCardiacCycle(self):
+    self.assertParsed(ValueParsing.parseCardiacCycle(['TP10PC0965\\PULSTART_P0020PC', 'TP0PC0', 'PFP\\TP5PC1', 'NONE', '']),
+      [10, 0, 0, 0, 0], [True, True, False, False, False])
+
+  def test_frameTagParser(self):
+    self.assertIs(ValueParsing.frameTagParser('AcquisitionTime'), ValueParsing.parseTM)
+    self.assertIs(ValueParsing.frameTagParser('GE.B-value'), ValueParsing.parseGEBValue)
+    self.assertIs(ValueParsing.frameTagParser('CardiacCycle'), ValueParsing.parseCardiacCycle)
+    self.assertIs(ValueParsing.frameTagParser('TriggerTime'), ValueParsing.parseDecimals)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,13 @@
+# Convert the DICOM multivolumes of a folder or database to 4D NRRD or NIfTI files.
+#
+# Usage:
+#   Slicer --no-main-window --python-script convert_multivolumes.py [DICOM_FOLDER] OUTPUT_DIRECTORY
+#     [--database DATABASE_DIRECTORY] [--format nrrd|nii] [--workers N]
+
+import os, sys
+
+import slicer
+from MultiVolumeImporterLib import BatchConverter
+
+exitCode = BatchConverter.main(sys.argv[1:], os.path.abspath(__file__))
+slicer.util.exit(exitCode)